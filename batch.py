@@ -0,0 +1,145 @@
+"""Generation of many intent files in one process.
+
+Every intent of the batch (files, or directories searched for .yml, .yaml and
+.json intents) is generated into its own output directory, with its own
+allocation table, so the i{num}_startup-config.cfg of different topologies
+never collide. The intents are spread over a pool of worker processes forked
+once the templates are compiled : yaml, the generator and the templates with
+their render cache are loaded once per worker instead of once per intent, and
+the parsed intents stay in the cache of intent_loader between two runs.
+
+Run from the root of the repository : python batch.py intents/ -o build/configs
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import templates
+from intent_loader import load_intent_file, CACHE_DIR
+from ipam import plan_intent, load_allocation_table, save_allocation_table
+from nas_config_generator import get_as_list, get_addressing, get_bgp_neighbors, render_configs, write_config_files
+from validator import validate_intent, IntentValidationError
+
+INTENT_EXTENSIONS = (".yml", ".yaml", ".json")
+DEFAULT_OUTPUT_DIR = "configs"
+DEFAULT_REPORT_FILE = "batch_report.json"
+ALLOCATION_TABLE = "ipam_table.json"
+
+
+def find_intents(paths, output_dir=None):
+    """Intent files of the batch, directories are searched recursively (except the output directory)"""
+    skipped = os.path.abspath(output_dir) if output_dir else None
+    intents = []
+    for path in paths:
+        if not os.path.isdir(path):
+            intents.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if not name.startswith(".") and os.path.abspath(os.path.join(root, name)) != skipped)
+            intents.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(INTENT_EXTENSIONS))
+    return list(dict.fromkeys(intents))
+
+def output_dirs(intents, output_dir):
+    """Output directory of every intent, named after its path relative to the common directory of the batch"""
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(intent)) for intent in intents])
+    names = {intent: os.path.splitext(os.path.relpath(os.path.abspath(intent), base))[0] for intent in intents}
+    counts = {}
+    for name in names.values():
+        counts[name] = counts.get(name, 0) + 1
+    # topology.yml and topology.json of the same directory keep their extension apart
+    return {intent: os.path.join(output_dir, name if counts[name] == 1 else os.path.relpath(os.path.abspath(intent), base).replace(".", "_"))
+            for intent, name in names.items()}
+
+def generate_intent(filename, output_dir, cache_dir=CACHE_DIR):
+    """
+    Generates the configurations of one intent file into its output directory.
+
+    :param filename: Intent file
+    :param output_dir: Répertoire des configurations et de la table d'allocation de cet intent
+    :param cache_dir: Cache des intents déjà lus, None pour toujours relire le fichier
+    :return: Dictionnaire {"intent", "output", "routers", "written", "seconds", "error"}
+    """
+    start = time.perf_counter()
+    result = {"intent": filename, "output": output_dir, "routers": 0, "written": 0, "seconds": 0.0, "error": None}
+    try:
+        data = validate_intent(load_intent_file(filename, cache_dir=cache_dir))
+        as_list = get_as_list(data)
+        os.makedirs(output_dir, exist_ok=True)
+        table = os.path.join(output_dir, ALLOCATION_TABLE)
+        ipam = plan_intent(as_list, data.get("AS_connections", []), load_allocation_table(table))
+        topology = get_addressing(data, ipam)
+        save_allocation_table(table, ipam)
+        get_bgp_neighbors(topology, data)
+        rendered = render_configs(topology, topology.routers)
+        result["routers"] = len(topology)
+        result["written"] = len(write_config_files(topology, rendered, output_dir=output_dir, verbose=False))
+    except IntentValidationError as e:
+        result["error"] = f"{len(e.errors)} erreur(s) :\n{e}"
+    except Exception as e:
+        # One broken intent must not stop the others
+        result["error"] = str(e) or type(e).__name__
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def _init_batch_worker(template_dir=None):
+    if templates.engine.template_dir != template_dir:
+        templates.load_templates(template_dir)
+
+def run_batch(intents, output_dir=DEFAULT_OUTPUT_DIR, jobs=0, cache_dir=CACHE_DIR, template_dir=None):
+    """
+    Generates every intent of the batch, over a pool of jobs processes.
+
+    :param intents: Intent files, voir find_intents
+    :param jobs: Nombre de processus, 0 pour utiliser tous les coeurs
+    :return: Itérateur des résultats de generate_intent, dans l'ordre où les intents sont terminés
+    """
+    directories = output_dirs(intents, output_dir)
+    # Biggest intents first, so that a large one does not start when the others are done
+    ordered = sorted(intents, key=lambda intent: os.path.getsize(intent) if os.path.isfile(intent) else 0, reverse=True)
+    jobs = min(jobs or os.cpu_count(), len(intents))
+    if jobs <= 1:
+        _init_batch_worker(template_dir)
+        for intent in ordered:
+            yield generate_intent(intent, directories[intent], cache_dir)
+        return
+    # fork shares the compiled templates and the imported modules with the workers
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    with ProcessPoolExecutor(jobs, mp_context=context, initializer=_init_batch_worker, initargs=(template_dir,)) as pool:
+        futures = [pool.submit(generate_intent, intent, directories[intent], cache_dir) for intent in ordered]
+        for future in as_completed(futures):
+            yield future.result()
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description='''Génération des configurations de plusieurs intent files en un seul processus''')
+    parser.add_argument('paths', nargs='+', help="Intent files, or directories searched for .yml, .yaml and .json intents")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT_DIR, help="Directory receiving one sub-directory of configurations per intent")
+    parser.add_argument('-j', '--jobs', type=int, default=0, help="Number of worker processes, 0 to use every core")
+    parser.add_argument('--templates', help="Directory of custom templates, as in nas_config_generator.py")
+    parser.add_argument('--no_cache', action='store_true', help="Always parse the intent files instead of using the cache in .nas_cache")
+    parser.add_argument('--report', nargs='?', const=DEFAULT_REPORT_FILE, help=f"Write the result of every intent to this JSON file (default {DEFAULT_REPORT_FILE})")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    intents = find_intents(args.paths, args.output)
+    if not intents : sys.exit(f"Aucun intent file trouvé dans {', '.join(args.paths)}")
+    templates.load_templates(args.templates)
+    start = time.perf_counter()
+    results = []
+    for result in run_batch(intents, args.output, args.jobs, None if args.no_cache else CACHE_DIR, args.templates):
+        results.append(result)
+        if result["error"]:
+            print(f"{result['intent']} : échec\n{result['error']}")
+        else:
+            print(f"{result['intent']} : {result['routers']} routeurs, {result['written']} fichiers écrits dans {result['output']} en {result['seconds']:.3f} s")
+    failed = [result for result in results if result["error"]]
+    print(f"{len(results) - len(failed)}/{len(results)} intent files générés ({sum(result['routers'] for result in results)} routeurs) en {time.perf_counter() - start:.3f} s")
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump(results, report_file, indent=2)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,6 @@
+"""Benchmarks of the generator on synthetic topologies.
+
+Run from the root of the repository : python -m benchmarks --help
+"""
+from benchmarks.synthetic import generate_intent, TOPOLOGIES
+from benchmarks.runner import run_scenario, find_regressions, SCENARIOS, PHASES
@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+
+from benchmarks.runner import (SCENARIOS, PHASES, DEFAULT_TIME_TOLERANCE, DEFAULT_MEMORY_TOLERANCE,
+                               run_scenario, find_regressions, load_baseline, save_baseline)
+from benchmarks.synthetic import TOPOLOGIES
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description='''Benchmarks du générateur de configurations sur des topologies synthétiques''')
+    parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run, among {', '.join(SCENARIOS)} (all by default)")
+    parser.add_argument('--custom', action='store_true', help="Run a single scenario built from the options below instead")
+    parser.add_argument('--provider_as', type=int, default=2, help="Number of provider ASes (--custom)")
+    parser.add_argument('--routers', type=int, default=10, help="Routers per provider AS (--custom)")
+    parser.add_argument('--topology', choices=TOPOLOGIES, default="ring", help="Internal connections of the provider ASes (--custom)")
+    parser.add_argument('--vpn_customers', type=int, default=2, help="VPN customers per PE (--custom)")
+    parser.add_argument('--ibgp', choices=("full_mesh", "route_reflector"), default="full_mesh", help="iBGP of the provider ASes (--custom)")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="Timed runs per scenario, the best one is kept")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Render processes, as in nas_config_generator.py")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline file the results are compared to")
+    parser.add_argument('--save_baseline', action='store_true', help="Store the results as the new baseline instead of comparing them")
+    parser.add_argument('--time_tolerance', type=float, default=DEFAULT_TIME_TOLERANCE, help="Allowed slowdown of a phase, as a fraction")
+    parser.add_argument('--memory_tolerance', type=float, default=DEFAULT_MEMORY_TOLERANCE, help="Allowed growth of the peak memory of a phase, as a fraction")
+    return parser.parse_args()
+
+def print_result(name, result):
+    print(f"\n{name} ({result['routers']} routeurs)")
+    print(f"  {'phase':<12}{'temps (ms)':>12}{'pic (KiB)':>12}")
+    for phase in PHASES:
+        measure = result["phases"][phase]
+        print(f"  {phase:<12}{measure['seconds'] * 1000:>12.1f}{measure['peak_kib']:>12}")
+    print(f"  {'total':<12}{sum(measure['seconds'] for measure in result['phases'].values()) * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    if args.custom:
+        name = f"custom_{args.provider_as}x{args.routers}_{args.topology}_{args.vpn_customers}vpn_{args.ibgp}"
+        scenarios = {name: {"provider_as": args.provider_as, "routers": args.routers, "topology": args.topology,
+                            "vpn_customers": args.vpn_customers, "ibgp": args.ibgp}}
+    else:
+        unknown = [name for name in args.scenarios if name not in SCENARIOS]
+        if unknown : sys.exit(f"Unknown scenario(s) {', '.join(unknown)}, available : {', '.join(SCENARIOS)}")
+        scenarios = {name: SCENARIOS[name] for name in args.scenarios or SCENARIOS}
+
+    results = {}
+    for name, parameters in scenarios.items():
+        results[name] = run_scenario(parameters, args.repeat, args.jobs)
+        print_result(name, results[name])
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"\nBaseline enregistrée dans {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline) : sys.exit(f"\nBaseline {args.baseline} introuvable (--save_baseline pour l'enregistrer)")
+    baseline = load_baseline(args.baseline)
+    regressions = find_regressions(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print("\nRégressions par rapport à la baseline :")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nAucune régression par rapport à la baseline")
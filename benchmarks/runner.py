@@ -0,0 +1,156 @@
+"""Timing of every phase of the generator on synthetic intents.
+
+Each scenario is written as a YAML intent in a temporary directory, then goes
+through the same functions as nas_config_generator.py : load, addressing,
+neighbors, rendering, write and dispatch (to a fake GNS3 project). Times are
+the best of several runs, the peak memory of each phase is measured in a
+separate run with tracemalloc so that tracing does not slow the timed runs.
+"""
+import contextlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+from benchmarks.synthetic import generate_intent
+from file_dispatcher import FileDispatcher
+from intent_loader import load_intent_file
+from nas_config_generator import get_addressing, get_bgp_neighbors, render_configs, write_config_files
+
+PHASES = ("load", "addressing", "neighbors", "rendering", "write", "dispatch")
+
+# name -> parameters of generate_intent
+SCENARIOS = {
+    "small_ring": {"provider_as": 2, "routers": 10, "topology": "ring", "vpn_customers": 2},
+    "medium_leaf_spine": {"provider_as": 4, "routers": 64, "topology": "leaf_spine", "vpn_customers": 4},
+    "medium_mesh": {"provider_as": 2, "routers": 40, "topology": "mesh", "vpn_customers": 2},
+    "large_ring_rr": {"provider_as": 8, "routers": 200, "topology": "ring", "vpn_customers": 4, "ibgp": "route_reflector"},
+}
+
+DEFAULT_TIME_TOLERANCE = 0.25    # +25 %
+DEFAULT_MEMORY_TOLERANCE = 0.10  # +10 %
+# Below these differences a phase is never reported as a regression (timer and allocator noise)
+MIN_TIME_DIFFERENCE = 0.005
+MIN_MEMORY_DIFFERENCE = 256  # KiB
+
+
+def write_gns3_project(project_dir, intent):
+    """Writes a .gns3 file with one dynamips node per router of the intent"""
+    nodes = [{"node_id": f"node-{router['num_creation']}", "node_type": "dynamips", "name": router["hostname"],
+              "properties": {"dynamips_id": router["num_creation"]}}
+             for key, value in intent.items() if "AS_" not in key for router in value[0].get("routers", [])]
+    os.makedirs(project_dir, exist_ok=True)
+    with open(os.path.join(project_dir, "benchmark.gns3"), 'w') as project_file:
+        json.dump({"topology": {"nodes": nodes}}, project_file)
+
+def run_phases(intent_file, work_dir, jobs=1, trace_memory=False):
+    """
+    Runs the pipeline once on an intent file.
+
+    :param work_dir: Dossier où les configurations sont écrites, avec le projet GNS3 dans work_dir/gns3
+    :param trace_memory: Mesure le pic mémoire de chaque phase au lieu de sa durée
+    :return: Dictionnaire {phase: secondes} ou {phase: KiB}
+    """
+    results = {}
+
+    @contextlib.contextmanager
+    def phase(name):
+        if trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        yield
+        if trace_memory:
+            results[name] = tracemalloc.get_traced_memory()[1] // 1024
+        else:
+            results[name] = time.perf_counter() - start
+
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            with phase("load"):
+                data = load_intent_file(intent_file, cache_dir=None)
+            with phase("addressing"):
+                topology = get_addressing(data)
+            with phase("neighbors"):
+                get_bgp_neighbors(topology, data)
+            with phase("rendering"):
+                rendered = render_configs(topology, topology.routers, jobs)
+            with phase("write"):
+                write_config_files(topology, rendered)
+            with phase("dispatch"):
+                FileDispatcher(os.path.join(work_dir, "gns3"), work_dir, quiet=True).copy_configs()
+    finally:
+        os.chdir(previous_dir)
+    return results
+
+def run_scenario(parameters, repeat=3, jobs=1):
+    """
+    Benchmarks one scenario.
+
+    :param parameters: Paramètres de generate_intent
+    :param repeat: Nombre d'exécutions chronométrées, la meilleure est gardée
+    :return: Dictionnaire {"routers": n, "phases": {phase: {"seconds": s, "peak_kib": m}}}
+    """
+    intent = generate_intent(**parameters)
+    with tempfile.TemporaryDirectory(prefix="nas_benchmark_") as work_dir:
+        intent_file = os.path.join(work_dir, "intent.yml")
+        with open(intent_file, 'w') as f:
+            yaml.safe_dump(intent, f, sort_keys=False)
+        write_gns3_project(os.path.join(work_dir, "gns3"), intent)
+
+        timings = [run_phases(intent_file, work_dir, jobs) for _ in range(repeat)]
+        tracemalloc.start()
+        try:
+            memory = run_phases(intent_file, work_dir, jobs, trace_memory=True)
+        finally:
+            tracemalloc.stop()
+
+    routers = sum(len(value[0].get("routers", [])) for key, value in intent.items() if "AS_" not in key)
+    return {
+        "routers": routers,
+        "phases": {name: {"seconds": min(timing[name] for timing in timings), "peak_kib": memory[name]} for name in PHASES},
+    }
+
+def find_regressions(results, baseline, time_tolerance=DEFAULT_TIME_TOLERANCE, memory_tolerance=DEFAULT_MEMORY_TOLERANCE):
+    """Returns a message for every phase slower or bigger than in the baseline beyond the tolerances, or missing from it"""
+    regressions = []
+    for scenario, result in results.items():
+        reference = baseline.get(scenario)
+        if reference is None:
+            # An unmeasured scenario must not pass silently
+            regressions.append(f"{scenario} : no baseline for this scenario (--save_baseline to record it)")
+            continue
+        if reference.get("routers") != result["routers"]:
+            regressions.append(f"{scenario} : the baseline was measured on {reference.get('routers')} routers, not {result['routers']}")
+            continue
+        for name, measure in result["phases"].items():
+            expected = reference["phases"].get(name)
+            if expected is None:
+                regressions.append(f"{scenario} / {name} : no baseline for this phase (--save_baseline to record it)")
+                continue
+            seconds, expected_seconds = measure["seconds"], expected["seconds"]
+            if seconds > expected_seconds * (1 + time_tolerance) and seconds - expected_seconds > MIN_TIME_DIFFERENCE:
+                regressions.append(f"{scenario} / {name} : {seconds * 1000:.1f} ms instead of {expected_seconds * 1000:.1f} ms")
+            peak, expected_peak = measure["peak_kib"], expected["peak_kib"]
+            if peak > expected_peak * (1 + memory_tolerance) and peak - expected_peak > MIN_MEMORY_DIFFERENCE:
+                regressions.append(f"{scenario} / {name} : {peak} KiB peak instead of {expected_peak} KiB")
+    return regressions
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as baseline_file:
+        return json.load(baseline_file)
+
+def save_baseline(path, results):
+    """Merges results into the baseline file, keeping the scenarios that were not run"""
+    baseline = load_baseline(path)
+    baseline.update(results)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
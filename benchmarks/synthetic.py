@@ -0,0 +1,121 @@
+"""Synthetic intent files, in the same schema as intent.yml.
+
+Every provider AS gets routers P/PE linked as a ring, a full mesh or a
+leaf-spine fabric (the leaves are the PEs). Provider ASes are chained with eBGP
+sessions between their first PEs, and every provider AS has vpn_customers
+customer ASes : one CE per PE and per customer, in the VRF of the customer.
+"""
+
+TOPOLOGIES = ("ring", "mesh", "leaf_spine")
+MAX_PROVIDER_AS = 200
+MAX_CUSTOMER_AS = 1024
+
+
+class InterfaceCounter:
+    """Hands out GigabitEthernet interfaces, in order, for every router"""
+
+    def __init__(self):
+        self.used = {}
+
+    def next(self, hostname):
+        slot = self.used.get(hostname, 0) + 1
+        self.used[hostname] = slot
+        return f"GigabitEthernet{slot}/0"
+
+
+def internal_links(hostnames, topology, pe_count):
+    """Returns the (first, second) hostname pairs of the internal connections of a provider AS"""
+    if topology == "ring":
+        if len(hostnames) == 2:
+            return [(hostnames[0], hostnames[1])]
+        return [(hostnames[i], hostnames[(i + 1) % len(hostnames)]) for i in range(len(hostnames))]
+    if topology == "mesh":
+        return [(first, second) for i, first in enumerate(hostnames) for second in hostnames[i + 1:]]
+    # leaf_spine : the PEs are the leaves, every leaf is linked to every spine
+    leaves, spines = hostnames[:pe_count], hostnames[pe_count:]
+    return [(leaf, spine) for leaf in leaves for spine in spines]
+
+def generate_intent(provider_as=2, routers=10, topology="ring", vpn_customers=2, pe_count=None, ibgp="full_mesh"):
+    """
+    Builds a synthetic intent, as load_intent_file would return it.
+
+    :param provider_as: Nombre d'AS opérateurs (MPLS, OSPF)
+    :param routers: Nombre de routeurs par AS opérateur
+    :param topology: "ring", "mesh" ou "leaf_spine" pour les connexions internes
+    :param vpn_customers: Nombre de clients VPN par PE (un AS client par client, un CE par PE)
+    :param pe_count: Nombre de PE par AS opérateur, un quart des routeurs par défaut
+    :param ibgp: "full_mesh" ou "route_reflector"
+    :return: Dictionnaire de l'intent
+    """
+    if topology not in TOPOLOGIES : raise ValueError(f"unknown topology {topology}, use one of {', '.join(TOPOLOGIES)}")
+    if not 1 <= provider_as <= MAX_PROVIDER_AS : raise ValueError(f"provider_as must be between 1 and {MAX_PROVIDER_AS}")
+    if not 2 <= routers <= 256 : raise ValueError("routers must be between 2 and 256 (one loopback /24 per AS)")
+    if provider_as * vpn_customers > MAX_CUSTOMER_AS : raise ValueError(f"at most {MAX_CUSTOMER_AS} customer ASes")
+    pe_count = pe_count or max(1, routers // 4)
+    if topology == "leaf_spine":
+        pe_count = min(pe_count, routers - 1)
+    pe_count = min(pe_count, routers)
+
+    intent = {}
+    connections = []
+    interfaces = InterfaceCounter()
+    num_creation = 0
+    customer_index = 0
+    for provider in range(1, provider_as + 1):
+        hostnames = [f"PE{provider}_{i}" for i in range(pe_count)] + [f"P{provider}_{i}" for i in range(routers - pe_count)]
+        router_list = []
+        for hostname in hostnames:
+            num_creation += 1
+            router_list.append({"hostname": hostname, "is_border": hostname.startswith("PE"),
+                                "telnet_port": 5000 + num_creation, "num_creation": num_creation})
+        intent[f"AS{provider}"] = [{
+            "number": str(provider),
+            "IPv4_prefix": f"10.{provider}.0.0",
+            "IPv4_mask": "16",
+            "mpls": True,
+            "igp": True,
+            "VPN_Client": False,
+            "ibgp": ibgp,
+            "routers": router_list,
+            "internal_connections": [{
+                "first_peer_hostname": first,
+                "first_peer_interface": interfaces.next(first),
+                "second_peer_hostname": second,
+                "second_peer_interface": interfaces.next(second),
+            } for first, second in internal_links(hostnames, topology, pe_count)],
+        }]
+
+        if provider > 1:
+            previous_pe = f"PE{provider - 1}_0"
+            connections.append({
+                "AS_1": str(provider - 1), "AS_1_router_hostname": previous_pe, "AS_1_router_interface": interfaces.next(previous_pe),
+                "AS_2": str(provider), "AS_2_router_hostname": hostnames[0], "AS_2_router_interface": interfaces.next(hostnames[0]),
+                "connexion": [{"type": "BGP"}],
+            })
+
+        for customer in range(vpn_customers):
+            customer_as = 10000 + customer_index
+            # Customer prefixes are /20 out of 100.64.0.0/10
+            base = (100 << 24) | (64 << 16) | (customer_index << 12)
+            customer_index += 1
+            ce_list = []
+            for pe in hostnames[:pe_count]:
+                num_creation += 1
+                ce = f"CE{provider}_{customer}_{pe[2:].split('_')[1]}"
+                ce_list.append({"hostname": ce, "is_border": True, "telnet_port": 5000 + num_creation, "num_creation": num_creation})
+                connections.append({
+                    "AS_1": str(provider), "AS_1_router_hostname": pe, "AS_1_router_interface": interfaces.next(pe),
+                    "AS_2": str(customer_as), "AS_2_router_hostname": ce, "AS_2_router_interface": interfaces.next(ce),
+                    "connexion": [{"type": "VPN", "vrf_name": f"CLIENT{provider}_{customer}_VRF"}],
+                })
+            intent[f"AS{customer_as}"] = [{
+                "number": str(customer_as),
+                "IPv4_prefix": f"{base >> 24}.{(base >> 16) & 255}.{(base >> 8) & 255}.0",
+                "IPv4_mask": "20",
+                "mpls": False,
+                "igp": False,
+                "VPN_Client": True,
+                "routers": ce_list,
+            }]
+    intent["AS_connections"] = connections
+    return intent
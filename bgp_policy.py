@@ -0,0 +1,86 @@
+"""BGP policies of the eBGP relationships, for generate_conf.py.
+
+Every eBGP neighbor is tagged with the relation of the local AS toward it
+(client : the neighbor is our provider, peer, provider : the neighbor is our
+customer) and refers to the route-map of that relation :
+  - routes received get the local-preference of the relation and are tagged
+    with a community <local AS>:<code> telling where they were learnt
+  - toward providers and peers, only the routes of our customers (matched by
+    their community) and our own networks are announced (valley-free routing)
+
+The route-maps, community lists and as-path lists only depend on the local AS
+and on the relations the router uses, so they are compiled once per (AS,
+relations) and the same block is shared by every router and every session :
+a neighbor only adds the lines naming them.
+"""
+from functools import lru_cache
+
+RELATIONS = ("client", "peer", "provider")
+EXPORT_ROUTE_MAP = "VALLEY_FREE"
+CUSTOMER_COMMUNITY_LIST = "FROM_CUSTOMER"
+LOCAL_AS_PATH_LIST = 1
+
+DEFAULT_POLICIES = {
+    # relation: (local-preference, community code, announce only customer and local routes)
+    "client": (100, 30, True),     # routes of our providers
+    "peer": (150, 20, True),
+    "provider": (200, 10, False),  # routes of our customers
+}
+
+
+class PolicyEngine:
+    """Relation policies, compiled into memoized configuration blocks"""
+
+    def __init__(self, policies=None):
+        self.policies = dict(DEFAULT_POLICIES)
+        for relation, policy in (policies or {}).items():
+            if relation not in RELATIONS : raise Exception(f'Intent file error : unknown BGP relation {relation} in BGP_policies, use {", ".join(RELATIONS)}')
+            local_preference, community, export_filter = self.policies[relation]
+            self.policies[relation] = (int(policy.get("local_preference", local_preference)),
+                                       int(policy.get("community", community)),
+                                       bool(policy.get("export_filter", export_filter)))
+        self.block = lru_cache(maxsize=None)(self._block)
+
+    def route_map(self, relation):
+        if relation not in RELATIONS : raise Exception(f'Intent file error : unknown BGP relation {relation}, use {", ".join(RELATIONS)}')
+        return relation.upper()
+
+    def neighbor_lines(self, ip, relation):
+        """Lines of a neighbor referring to the shared route-maps of its relation"""
+        lines = [f" neighbor {ip} route-map {self.route_map(relation)} in"]
+        if self.policies[relation][2]:
+            lines.append(f" neighbor {ip} route-map {EXPORT_ROUTE_MAP} out")
+        return lines
+
+    def _block(self, as_number, relations):
+        config = []
+        customer_community = f"{as_number}:{self.policies['provider'][1]}"
+        export_filter = any(self.policies[relation][2] for relation in relations)
+        if export_filter:
+            config.append(f"ip community-list standard {CUSTOMER_COMMUNITY_LIST} permit {customer_community}")
+            config.append(f"ip as-path access-list {LOCAL_AS_PATH_LIST} permit ^$")
+            config.append("!")
+        for relation in relations:
+            local_preference, community, _ = self.policies[relation]
+            config.append(f"route-map {self.route_map(relation)} permit 10")
+            config.append(f" set local-preference {local_preference}")
+            config.append(f" set community {as_number}:{community} additive")
+            config.append("!")
+        if export_filter:
+            config.append(f"route-map {EXPORT_ROUTE_MAP} permit 10")
+            config.append(f" match community {CUSTOMER_COMMUNITY_LIST}")
+            config.append("!")
+            config.append(f"route-map {EXPORT_ROUTE_MAP} permit 20")
+            config.append(f" match as-path {LOCAL_AS_PATH_LIST}")
+            config.append("!")
+        return "\n".join(config)
+
+    def policy_config(self, as_number, relations):
+        """
+        Returns the community lists and route-maps used by a router.
+
+        :param as_number: AS du routeur, utilisé dans les communautés
+        :param relations: Relations de ses voisins eBGP (voir PolicyIndexes.neighbors_by_relation)
+        :return: Bloc de configuration, partagé par tous les routeurs de l'AS ayant les mêmes relations
+        """
+        return self.block(str(as_number), tuple(relation for relation in RELATIONS if relation in relations))
@@ -0,0 +1,294 @@
+"""Checks that the network converged once the configurations are deployed.
+
+The adjacencies the configurations should bring up are derived from the
+router model (topology.py), keeping only the ones both ends configure :
+  - OSPF and LDP neighbors, between interfaces of the same subnet running
+    OSPF (resp. mpls ip)
+  - BGP sessions (show ip bgp summary) and vpnv4 / VRF sessions (show bgp
+    vpnv4 unicast all summary), between routers declaring each other
+  - VRF routes : the PE-CE subnets of every VRF whose route-targets are
+    imported, as seen in show ip route vrf
+Every router is then polled from one asyncio event loop, with a backoff
+between polls, until all its adjacencies are up or the timeout expires. The
+report gives the time each router took to converge and what is still missing.
+"""
+import asyncio
+import re
+import time
+
+from telnet import TelnetSession
+from topology import int_to_ip, prefixlen_to_netmask, ip_to_int
+
+CHECKS = ("ospf", "ldp", "bgp", "vpnv4", "vrf_routes")
+SHOW_COMMANDS = {
+    "ospf": "show ip ospf neighbor",
+    "ldp": "show mpls ldp neighbor",
+    "bgp": "show ip bgp summary",
+    "vpnv4": "show bgp vpnv4 unicast all summary",
+    "vrf_routes": "show ip route vrf {vrf}",
+}
+CHECK_NAMES = {"ospf": "voisin OSPF", "ldp": "voisin LDP", "bgp": "session BGP", "vpnv4": "session vpnv4/VRF", "vrf_routes": "route VRF"}
+DEFAULT_VERIFY_TIMEOUT = 300
+
+IP = r"\d+\.\d+\.\d+\.\d+"
+OSPF_NEIGHBOR = re.compile(rf"^({IP})\s+\d+\s+(\S+/\s*-|\S+)\s+\S+\s+({IP})\s+\S+")  # "FULL/  -" on point-to-point links
+LDP_PEER = re.compile(rf"Peer LDP Ident:\s*({IP}):\d+")
+LDP_STATE = re.compile(r"State:\s*(\w+)")
+BGP_NEIGHBOR = re.compile(rf"^({IP})\s+\d\s+\d+(?:\.\d+)?\s+.*\s(\S+)$")
+ROUTE = re.compile(rf"^[A-Z][A-Za-z0-9*+%]*(?: [A-Z0-9]+)?\s+({IP})")
+
+
+class Node:
+    """What a router configures, as far as its adjacencies are concerned"""
+    __slots__ = ("hostname", "loopback", "addresses", "ospf", "ldp", "bgp", "vpnv4", "vrf_neighbors", "vrfs")
+
+    def __init__(self, hostname, loopback=None):
+        self.hostname = hostname
+        self.loopback = loopback  # integer address of Loopback0, the LDP identifier
+        self.addresses = []       # integer addresses of every interface
+        self.ospf = []            # (address, prefixlen) of the interfaces running OSPF
+        self.ldp = []             # (address, prefixlen) of the interfaces with mpls ip
+        self.bgp = []             # addresses of the BGP neighbors of the global table
+        self.vpnv4 = []           # addresses of the vpnv4 neighbors
+        self.vrf_neighbors = []   # (VRF name, address) of the CE neighbors
+        self.vrfs = {}            # VRF name -> (exports, imports, [(network, prefixlen)])
+
+    def __repr__(self):
+        return f"Node({self.hostname}, {len(self.ospf)} OSPF, {len(self.ldp)} LDP, {len(self.bgp)} BGP, {len(self.vpnv4)} vpnv4, vrfs={list(self.vrfs)})"
+
+
+def network(address, prefixlen):
+    return address & ip_to_int(prefixlen_to_netmask(prefixlen))
+
+def router_node(router, ospf_interfaces=None):
+    """
+    Returns the Node of a router of the model.
+
+    :param router: Router de topology.py (généré, ou relu par ios_config.parse_startup_config)
+    :param ospf_interfaces: Noms des interfaces où tourne OSPF, par défaut celles sans VRF si le routeur a un IGP
+    :return: Node
+    """
+    loopback = router.interfaces.get("Loopback0")
+    node = Node(router.hostname, loopback.address if loopback is not None else None)
+    for name, interface in router.interfaces.items():
+        if interface.address is None : continue
+        node.addresses.append(interface.address)
+        if (router.igp and not interface.vrf) if ospf_interfaces is None else name in ospf_interfaces:
+            node.ospf.append((interface.address, interface.prefixlen))
+        if interface.mpls:
+            node.ldp.append((interface.address, interface.prefixlen))
+        if interface.vrf:
+            node.vrfs.setdefault(interface.vrf, ((), (), []))[2].append((network(interface.address, interface.prefixlen), interface.prefixlen))
+    # A VPN client only keeps its sessions with the provider (see bgp_add), and the vpnv4 address family
+    # is only configured on PEs and route reflectors (see render_config)
+    node.bgp = [neighbor.address for neighbor in router.bgp_neighbors if not router.vpn_client or neighbor.remote_as != router.as_number]
+    if router.vpns or router.route_reflector:
+        node.vpnv4 = [neighbor.address for neighbor in router.vpnv4_neighbors]
+    for vrf in router.vpns:
+        networks = node.vrfs.get(vrf.name, ((), (), []))[2]
+        node.vrfs[vrf.name] = (tuple(vrf.exports or ()), tuple(vrf.imports or ()), networks)
+        if vrf.remote_ip is not None:
+            node.vrf_neighbors.append((vrf.name, vrf.remote_ip))
+    return node
+
+def adjacencies(nodes):
+    """
+    Returns the adjacencies configured on both ends.
+
+    :param nodes: Liste de Node, voir router_node
+    :return: Dictionnaire {hostname: {check: {clé: hostname du voisin}}}, les clés sont des adresses, (VRF, réseau) pour vrf_routes
+    """
+    result = {node.hostname: {} for node in nodes}
+    owners = {address: node for node in nodes for address in node.addresses}
+
+    def add(node, check, key, peer):
+        result[node.hostname].setdefault(check, {})[key] = peer.hostname
+
+    for check in ("ospf", "ldp"):
+        subnets = {}
+        for node in nodes:
+            for address, prefixlen in getattr(node, check):
+                subnets.setdefault((network(address, prefixlen), prefixlen), []).append((node, address))
+        for members in subnets.values():
+            for node, _ in members:
+                for peer, address in members:
+                    if peer is node : continue
+                    if check == "ospf":
+                        add(node, check, int_to_ip(address), peer)
+                    elif peer.loopback is not None:
+                        add(node, check, int_to_ip(peer.loopback), peer)
+
+    for node in nodes:
+        # A session is up when the neighbor declares one of the addresses of the router in return
+        for address in node.bgp:
+            peer = owners.get(address)
+            if peer is not None and any(owners.get(back) is node for back in peer.bgp + [back for _, back in peer.vrf_neighbors]):
+                add(node, "bgp", int_to_ip(address), peer)
+        for address in node.vpnv4:
+            peer = owners.get(address)
+            if peer is not None and any(owners.get(back) is node for back in peer.vpnv4):
+                add(node, "vpnv4", int_to_ip(address), peer)
+        for _, address in node.vrf_neighbors:
+            peer = owners.get(address)
+            if peer is not None and any(owners.get(back) is node for back in peer.bgp):
+                add(node, "vpnv4", int_to_ip(address), peer)
+
+    exporters = {}
+    for node in nodes:
+        for exports, _, networks in node.vrfs.values():
+            for route_target in exports:
+                exporters.setdefault(route_target, []).append((node, networks))
+    for node in nodes:
+        for name, (_, imports, _) in node.vrfs.items():
+            for route_target in imports:
+                for peer, networks in exporters.get(route_target, ()):
+                    if peer is node : continue
+                    for address, _ in networks:
+                        add(node, "vrf_routes", (name, int_to_ip(address)), peer)
+    return result
+
+def expected_adjacencies(topology):
+    """Adjacencies the generated configurations should bring up, for every router of the topology"""
+    return adjacencies([router_node(router) for router in topology])
+
+
+def parse_ospf_neighbors(output):
+    """Addresses of the OSPF neighbors in FULL (or 2WAY between DROTHERs) state"""
+    neighbors = set()
+    for line in output.splitlines():
+        match = OSPF_NEIGHBOR.match(line.strip())
+        if match and match.group(2).upper().startswith(("FULL", "2WAY")):
+            neighbors.add(match.group(3))
+    return neighbors
+
+def parse_ldp_neighbors(output):
+    """LDP identifiers of the peers in Oper state"""
+    neighbors = set()
+    peer = None
+    for line in output.splitlines():
+        match = LDP_PEER.search(line)
+        if match:
+            peer = match.group(1)
+            continue
+        match = LDP_STATE.search(line)
+        if match and peer is not None:
+            if match.group(1) == "Oper":
+                neighbors.add(peer)
+            peer = None
+    return neighbors
+
+def parse_bgp_summary(output):
+    """Neighbors of a BGP summary whose State/PfxRcd column is a prefix count, i.e. Established"""
+    neighbors = set()
+    for line in output.splitlines():
+        match = BGP_NEIGHBOR.match(line.strip())
+        if match and match.group(2).isdigit():
+            neighbors.add(match.group(1))
+    return neighbors
+
+def parse_routes(output):
+    """Network addresses of a routing table"""
+    return {match.group(1) for match in map(ROUTE.match, output.splitlines()) if match}
+
+PARSERS = {"ospf": parse_ospf_neighbors, "ldp": parse_ldp_neighbors, "bgp": parse_bgp_summary, "vpnv4": parse_bgp_summary}
+
+
+class ConvergenceResult:
+    __slots__ = ("hostname", "port", "converged", "convergence_time", "missing", "polls", "error")
+
+    def __init__(self, hostname, port, missing):
+        self.hostname = hostname
+        self.port = port
+        self.converged = not missing
+        self.convergence_time = 0.0 if self.converged else None  # seconds from the start of the verification
+        self.missing = missing  # check -> {key: hostname of the neighbor} not seen yet
+        self.polls = 0
+        self.error = None
+
+
+async def poll_router(session, missing):
+    """Runs the show commands of the checks still missing, removes from missing what is up"""
+    await session.command("terminal length 0")
+    for check in list(missing):
+        if check == "vrf_routes":
+            for vrf in sorted({vrf for vrf, _ in missing[check]}):
+                output, _, _ = await session.command(SHOW_COMMANDS[check].format(vrf=vrf), session.timeout * 3)
+                seen = parse_routes(output)
+                for key in [key for key in missing[check] if key[0] == vrf and key[1] in seen]:
+                    del missing[check][key]
+        else:
+            output, _, _ = await session.command(SHOW_COMMANDS[check], session.timeout * 3)
+            seen = PARSERS[check](output)
+            for key in [key for key in missing[check] if key in seen]:
+                del missing[check][key]
+        if not missing[check]:
+            del missing[check]
+
+async def verify_router(hostname, host, port, expected, semaphore, start, deadline, timeout, interval, max_interval):
+    result = ConvergenceResult(hostname, port, {check: dict(keys) for check, keys in expected.items() if keys})
+    loop = asyncio.get_running_loop()
+    while not result.converged:
+        async with semaphore:
+            session = TelnetSession(host, port, timeout)
+            try:
+                await session.connect()
+                await session.enable()
+                await poll_router(session, result.missing)
+                result.error = None
+            except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                result.error = str(e) or type(e).__name__
+            finally:
+                result.polls += 1
+                await session.close()
+        if not result.missing:
+            result.converged = True
+            result.convergence_time = time.perf_counter() - start
+        elif loop.time() + interval > deadline:
+            break
+        else:
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, max_interval)
+    return result
+
+async def verify_convergence_async(targets, expected, host, concurrency, timeout, verify_timeout, interval, max_interval):
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    deadline = asyncio.get_running_loop().time() + verify_timeout
+    return await asyncio.gather(*(verify_router(hostname, host, port, expected.get(hostname, {}), semaphore, start, deadline, timeout, interval, max_interval)
+                                  for hostname, port in targets))
+
+def verify_convergence(topology, host="localhost", concurrency=50, timeout=10, verify_timeout=DEFAULT_VERIFY_TIMEOUT, interval=1.0, max_interval=15.0):
+    """
+    Polls every router until the adjacencies of the generated configurations are up.
+
+    :param topology: Topologie dont les configurations ont été déployées
+    :param host: Hôte des consoles telnet
+    :param concurrency: Nombre maximum de consoles interrogées en même temps
+    :param verify_timeout: Délai en secondes au-delà duquel les adjacences manquantes sont rapportées
+    :param interval: Délai avant la deuxième interrogation d'un routeur, doublé ensuite jusqu'à max_interval
+    :return: Liste de ConvergenceResult, dans l'ordre des routeurs de la topologie
+    """
+    expected = expected_adjacencies(topology)
+    targets = [(router.hostname, router.telnet_port) for router in topology]
+    return asyncio.run(verify_convergence_async(targets, expected, host, concurrency, timeout, verify_timeout, interval, max_interval))
+
+def describe_missing(check, key, peer):
+    if check == "vrf_routes":
+        return f"{CHECK_NAMES[check]} {key[1]} dans {key[0]} ({peer})"
+    return f"{CHECK_NAMES[check]} {key} ({peer})"
+
+def print_convergence_report(results):
+    """Prints the convergence time and the missing adjacencies, returns True if every router converged"""
+    converged = [result for result in results if result.converged]
+    for result in results:
+        if result.converged : continue
+        print(f"Convergence : {result.hostname} non convergé après {result.polls} interrogation(s)" + (f", dernière erreur : {result.error}" if result.error else ""))
+        for check in CHECKS:
+            for key, peer in sorted(result.missing.get(check, {}).items()):
+                print(f"  {describe_missing(check, key, peer)} manquant")
+    slowest = max(converged, key=lambda result: result.convergence_time, default=None)
+    summary = f"Convergence : {len(converged)}/{len(results)} routeurs convergés"
+    if slowest is not None:
+        summary += f", le dernier ({slowest.hostname}) après {slowest.convergence_time:.1f} s"
+    print(summary)
+    return len(converged) == len(results)
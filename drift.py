@@ -0,0 +1,131 @@
+"""Drift detection between the configurations of a GNS3 project and the generated ones.
+
+Both sides are parsed into the router model (ios_config.parse_startup_config)
+and compared field by field, so the order of the lines, the comments and the
+sections the generator never writes (boot markers, ip cef, unused shutdown
+interfaces...) do not count as drift. The project configurations are parsed
+and compared in parallel over a pool of processes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+from ios_config import parse_startup_config
+from topology import int_to_ip
+
+# Below this number of routers, starting processes costs more than it saves
+PARALLEL_THRESHOLD = 64
+
+
+def describe_interface(interface):
+    address = f"{int_to_ip(interface.address)}/{interface.prefixlen}" if interface.address is not None else "sans adresse"
+    return address + (f" vrf {interface.vrf}" if interface.vrf else "") + (" mpls" if interface.mpls else "")
+
+def describe_vrf(vrf):
+    remote = f", voisin {int_to_ip(vrf.remote_ip)} AS{vrf.remote_as}" if vrf.remote_ip is not None else ""
+    return f"rd {vrf.rd}, export {' '.join(sorted(vrf.exports))}, import {' '.join(sorted(vrf.imports))}{remote}"
+
+def describe_setting(value):
+    if isinstance(value, (set, list, tuple)):
+        return " ".join(sorted(map(str, value)))
+    return str(value)
+
+def compare_records(kind, expected, actual, describe, ignore_extra=None):
+    """Compares two dictionaries {name: record}, returns the missing, extra and different records"""
+    differences = []
+    for name in expected:
+        if name not in actual:
+            differences.append(f"{kind} {name} manquant(e) (attendu : {describe(expected[name])})")
+        elif describe(expected[name]) != describe(actual[name]):
+            differences.append(f"{kind} {name} : attendu {describe(expected[name])}, trouvé {describe(actual[name])}")
+    for name in actual:
+        if name not in expected and not (ignore_extra and ignore_extra(name, actual[name])):
+            differences.append(f"{kind} {name} en trop ({describe(actual[name])})")
+    return differences
+
+def compare_configs(expected, actual):
+    """
+    Returns the semantic differences between two parsed configurations.
+
+    :param expected: ParsedConfig de la configuration générée
+    :param actual: ParsedConfig de la configuration du projet GNS3
+    :return: Liste de différences lisibles, vide si les configurations sont équivalentes
+    """
+    differences = []
+    expected_router, actual_router = expected.router, actual.router
+    for field, label in (("hostname", "hostname"), ("as_number", "AS BGP"), ("cluster_id", "cluster-id")):
+        if getattr(expected_router, field) != getattr(actual_router, field):
+            differences.append(f"{label} : attendu {getattr(expected_router, field)}, trouvé {getattr(actual_router, field)}")
+
+    # An interface the generator does not use is only drift if it is configured
+    unused = lambda name, interface: interface.address is None and actual.settings.get(f"interface {name} shutdown")
+    differences += compare_records("interface", expected_router.interfaces, actual_router.interfaces, describe_interface, unused)
+    differences += compare_records("vrf", {vrf.name: vrf for vrf in expected_router.vpns}, {vrf.name: vrf for vrf in actual_router.vpns}, describe_vrf)
+
+    describe_neighbor = lambda neighbor: f"AS{neighbor.remote_as}" + (" route-reflector-client" if neighbor.rr_client else "")
+    differences += compare_records("voisin BGP", {neighbor.ip: neighbor for neighbor in expected_router.bgp_neighbors},
+                                   {neighbor.ip: neighbor for neighbor in actual_router.bgp_neighbors}, describe_neighbor)
+    differences += compare_records("voisin vpnv4", {neighbor.ip: neighbor for neighbor in expected_router.vpnv4_neighbors},
+                                   {neighbor.ip: neighbor for neighbor in actual_router.vpnv4_neighbors}, describe_neighbor)
+
+    settings = {key: value for key, value in expected.settings.items() if not key.endswith(" shutdown")}
+    actual_settings = {key: value for key, value in actual.settings.items() if not key.endswith(" shutdown")}
+    differences += compare_records("paramètre", settings, actual_settings, describe_setting)
+    return differences
+
+
+def _drift_job(job):
+    router_num, expected_config, config_path = job
+    with open(config_path, 'r') as config_file:
+        content = config_file.read()
+    if content == expected_config:
+        # The file copied by the dispatcher, nothing to parse
+        return router_num, []
+    expected = parse_startup_config(expected_config.splitlines(), router_num)
+    return router_num, compare_configs(expected, parse_startup_config(content.splitlines(), router_num))
+
+def detect_drift(expected_configs, gns3_configs, jobs=None):
+    """
+    Compares every configuration of a GNS3 project with the generated one.
+
+    :param expected_configs: Dictionnaire {numéro_routeur: configuration générée}
+    :param gns3_configs: Dictionnaire {numéro_routeur: chemin du fichier GNS3}, voir FileDispatcher.find_gns3_config_files
+    :param jobs: Nombre de processus, tous les coeurs par défaut
+    :return: Dictionnaire {numéro_routeur: [différences]} pour chaque routeur, trié par numéro
+    """
+    report = {}
+    tasks = []
+    for router_num in sorted(expected_configs.keys() | gns3_configs.keys()):
+        if router_num not in gns3_configs:
+            report[router_num] = ["pas de fichier de configuration dans le projet GNS3"]
+        elif router_num not in expected_configs:
+            report[router_num] = ["routeur absent de l'intent file"]
+        elif not os.path.exists(gns3_configs[router_num]):
+            report[router_num] = [f"{gns3_configs[router_num]} n'existe pas"]
+        else:
+            tasks.append((router_num, expected_configs[router_num], gns3_configs[router_num]))
+
+    jobs = jobs or os.cpu_count()
+    if jobs <= 1 or len(tasks) < PARALLEL_THRESHOLD:
+        report.update(map(_drift_job, tasks))
+    else:
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(jobs, mp_context=context) as pool:
+            report.update(pool.map(_drift_job, tasks, chunksize=max(1, len(tasks) // (jobs * 4))))
+    return dict(sorted(report.items()))
+
+def print_drift_report(report, names=None):
+    """Prints the differences of every router, returns the number of routers with drift"""
+    names = names or {}
+    drifted = 0
+    for router_num, differences in report.items():
+        name = f"{names[router_num]} (i{router_num})" if router_num in names else f"i{router_num}"
+        if not differences:
+            print(f"{name} : conforme")
+            continue
+        drifted += 1
+        print(f"{name} : {len(differences)} différence(s)")
+        for difference in differences:
+            print(f"  - {difference}")
+    print(f"\n{drifted}/{len(report)} routeurs ont dérivé de l'intent file")
+    return drifted
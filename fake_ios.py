@@ -0,0 +1,645 @@
+"""Emulator of the IOS consoles of a topology, to test the telnet deployment without GNS3.
+
+Every router of an intent file gets a console on its telnet_port, all of them
+served by one asyncio event loop, so hundreds of routers fit in one process.
+A console behaves like the one of an IOS router as far as the deployment is
+concerned :
+  - prompts of the user, privileged and configuration modes (Router>,
+    Router#, Router(config)#, Router(config-if)#, Router(config-router)#...)
+  - configuration lines applied to a running-config (see ios_config.py),
+    shown by show running-config for the delta mode, with the IOS semantics
+    the deltas rely on : a single-valued command (ip address, ip vrf
+    forwarding, rd, router-id) replaces the previous value, a new VRF clears
+    the addresses of the interface, "no neighbor X remote-as" removes every
+    line of the neighbor and "default interface" empties the interface
+  - configure replace and copy of a configuration served over HTTP or TFTP,
+    for the bulk mode
+  - show commands of the convergence check (OSPF and LDP neighbors, BGP
+    summaries, VRF routes), answered from the running-configs of all the
+    emulated routers : an adjacency is up once both ends configured it (see
+    convergence.py), after an optional convergence delay
+Latency (per command, at connection), rejected commands and dropped
+connections can be injected, and every command received is recorded, to
+measure the throughput of the deployment and check what the routers got.
+
+Run from the root of the repository : python fake_ios.py intent.yml --help
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import struct
+import time
+
+from convergence import SHOW_COMMANDS, adjacencies, network, router_node
+from intent_loader import load_intent_file
+from ios_config import SINGLE_VALUED, ConfigSection, parse_config, parse_startup_config
+from topology import int_to_ip, ip_to_int
+
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+ECHO, SGA = 1, 3
+
+DEFAULT_HOSTNAME = "Router"
+DEFAULT_RECORD_FILE = "fake_ios_record.json"
+INVALID_INPUT = "% Invalid input detected at '^' marker."
+
+# Header of a configuration section -> mode of its prompt
+SECTION_MODES = (
+    ("interface ", "config-if"),
+    ("router ", "config-router"),
+    ("ip vrf ", "config-vrf"),
+    ("vrf definition ", "config-vrf"),
+    ("route-map ", "config-route-map"),
+    ("line ", "config-line"),
+    ("ip access-list ", "config-ext-nacl"),
+    ("key chain ", "config-keychain"),
+)
+ADDRESS_FAMILY_MODE = "config-router-af"
+INTERFACE_COMMANDS = ("ip vrf forwarding ",)  # look like a section header, but belong to the interface
+NAVIGATION_COMMANDS = ("end", "exit", "exit-address-family")
+LINE_END = re.compile(r"\r\n|\r\0|\r|\n")
+
+
+def section_mode(header):
+    """Returns the prompt mode of a configuration section, None if header does not open one"""
+    for prefix, mode in SECTION_MODES:
+        if header.startswith(prefix) and not header.startswith(INTERFACE_COMMANDS):
+            return mode
+    return None
+
+def intent_consoles(data):
+    """Returns [(hostname, telnet_port)] of every router of an intent file, in both intent formats"""
+    consoles = []
+    for value in data.values():
+        if not isinstance(value, list) : continue
+        for entry in value:
+            if not isinstance(entry, dict) : continue
+            for router in entry.get("routers") or []:
+                if router.get("telnet_port") is not None:
+                    consoles.append((router["hostname"], int(router["telnet_port"])))
+    return consoles
+
+async def fetch(url, timeout=5):
+    """Downloads a configuration served over HTTP or TFTP, returns its content or None"""
+    scheme, _, rest = url.partition("://")
+    address, _, name = rest.partition("/")
+    host, _, port = address.partition(":")
+    if scheme == "http":
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port or 80)), timeout)
+        try:
+            writer.write(f"GET /{name} HTTP/1.0\r\nHost: {address}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout)
+        finally:
+            writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return body if head.split(b" ", 2)[1:2] == [b"200"] else None
+    if scheme == "tftp":
+        return await tftp_fetch(host, int(port or 69), name, timeout)
+    return None
+
+
+class TftpClient(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.packets = asyncio.Queue()
+
+    def datagram_received(self, data, address):
+        self.packets.put_nowait((data, address))
+
+async def tftp_fetch(host, port, name, timeout, block_size=8192):
+    """Read request with the blksize option, as IOS sends it"""
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(TftpClient, local_addr=("0.0.0.0", 0))
+    try:
+        transport.sendto(struct.pack("!H", 1) + name.encode("latin-1") + b"\0octet\0blksize\0" + str(block_size).encode() + b"\0", (host, port))
+        content, size = bytearray(), 512
+        while True:
+            data, address = await asyncio.wait_for(client.packets.get(), timeout)
+            opcode = struct.unpack("!H", data[:2])[0]
+            if opcode == 6:  # OACK, the server accepted the block size
+                size = block_size
+                transport.sendto(struct.pack("!HH", 4, 0), address)
+            elif opcode == 3:
+                block = struct.unpack("!H", data[2:4])[0]
+                content += data[4:]
+                transport.sendto(struct.pack("!HH", 4, block), address)
+                if len(data) - 4 < size:
+                    return bytes(content)
+            else:
+                return None
+    finally:
+        transport.close()
+
+
+class Faults:
+    """Latency and errors injected in the consoles"""
+    __slots__ = ("line_delay", "jitter", "connect_delay", "parse_delay", "error_rate", "reject", "drop_rate", "converge_delay", "random")
+
+    def __init__(self, line_delay=0.0, jitter=0.0, connect_delay=0.0, parse_delay=0.0, error_rate=0.0, reject=(), drop_rate=0.0, converge_delay=0.0, seed=None):
+        self.line_delay = line_delay        # seconds to answer a command
+        self.jitter = jitter                # random extra delay, as a fraction of the delays
+        self.connect_delay = connect_delay  # seconds before a new connection gets its console
+        self.parse_delay = parse_delay      # seconds to apply one line of a downloaded configuration
+        self.error_rate = error_rate        # probability that a configuration line is rejected
+        self.reject = [re.compile(pattern) for pattern in reject]  # configuration lines always rejected
+        self.drop_rate = drop_rate          # probability that a connection is closed in the middle of the session
+        self.converge_delay = converge_delay  # seconds after the last change of both ends before an adjacency is up
+        self.random = random.Random(seed)
+
+    def delay(self, seconds):
+        return seconds * (1 + self.jitter * self.random.random()) if seconds else 0
+
+    def rejects(self, line):
+        if line in NAVIGATION_COMMANDS:
+            return False
+        return any(pattern.search(line) for pattern in self.reject) or (self.error_rate and self.random.random() < self.error_rate)
+
+
+class FakeRouter:
+    """State of one emulated router, kept across its console connections"""
+
+    def __init__(self, name, port, faults):
+        self.name = name  # hostname in the intent file, the prompt shows the configured one
+        self.port = port
+        self.faults = faults
+        self.hostname = DEFAULT_HOSTNAME
+        self.running = ConfigSection(None)
+        self.commands = []  # every line received, in order
+        self.connections = 0
+        self.config_lines = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.transfers = 0
+        self.network = None  # FakeNetwork answering the show commands
+        self.revision = 0    # number of configuration changes
+        self.changed = 0.0   # time of the last configuration change
+        self.reset_session()
+
+    def reset_session(self):
+        self.enabled = False
+        self.path = []  # configuration sections entered, [] in global configuration mode
+        self.configuring = False
+
+    def prompt(self):
+        if self.configuring:
+            mode = "config"
+            if self.path:
+                mode = ADDRESS_FAMILY_MODE if self.path[-1].line.startswith("address-family") else section_mode(self.path[0].line) or "config"
+            return f"{self.hostname}({mode})#"
+        return f"{self.hostname}{'#' if self.enabled else '>'}"
+
+    def apply(self, raw_line):
+        """Applies a configuration line in the current mode, returns the error message of IOS or None"""
+        line = raw_line.strip()
+        if self.path and line not in NAVIGATION_COMMANDS and not raw_line.startswith(" "):
+            # IOS falls back to the global configuration for the commands the submode does not know. Without
+            # its grammar, the emulator relies on the indentation of the generated files : the line leaves the section
+            self.path = []
+        if self.faults.rejects(line):
+            self.rejected += 1
+            return INVALID_INPUT
+        self.config_lines += 1
+        if line not in NAVIGATION_COMMANDS:
+            self.touch()
+        if line == "end":
+            self.path, self.configuring = [], False
+        elif line == "exit":
+            if self.path:
+                self.path.pop()
+            else:
+                self.configuring = False
+        elif line == "exit-address-family":
+            if self.path and self.path[-1].line.startswith("address-family"):
+                self.path.pop()
+        elif line.startswith("no "):
+            self.remove(self.path[-1] if self.path else self.running, line[3:])
+        elif line.startswith("default interface ") and not self.path:
+            section = self.running.children.get(line[len("default "):])
+            if section is not None:
+                section.children.clear()
+        elif section_mode(line):
+            self.path = [self.running.children.setdefault(line, ConfigSection(line))]
+        elif line.startswith("address-family ") and self.path:
+            self.path = [self.path[0], self.path[0].children.setdefault(line, ConfigSection(line))]
+        else:
+            if not self.path and line.startswith("hostname "):
+                for existing in [child for child in self.running.children if child.startswith("hostname ")]:
+                    del self.running.children[existing]
+                self.hostname = line.split(None, 1)[1]
+            parent = self.path[-1] if self.path else self.running
+            if line not in parent.children:
+                # A single-valued command (ip address, rd, router-id...) replaces the previous value
+                replaced = tuple(prefix for prefix in SINGLE_VALUED if line.startswith(prefix))
+                if line.startswith("ip vrf forwarding "):
+                    replaced += ("ip address ",)  # IOS removes the addresses of an interface moved to another VRF
+                for existing in [child for child in parent.children if child.startswith(replaced)] if replaced else ():
+                    del parent.children[existing]
+            parent.children.setdefault(line, ConfigSection(line))
+        return None
+
+    def remove(self, parent, line):
+        """Applies the "no" form of line inside parent"""
+        words = line.split()
+        if words[0] == "neighbor" and (len(words) == 2 or words[2] == "remote-as"):
+            # Removing the remote-as of a neighbor removes the whole neighbor, in the address families too
+            for section in [parent] + [child for child in parent.children.values() if child.line.startswith("address-family ")]:
+                for existing in [child for child in section.children if child.split()[:2] == words[:2]]:
+                    del section.children[existing]
+        elif line in parent.children:
+            parent.children.pop(line)
+        else:
+            # "no ip address", "no ip vrf forwarding"... without the value
+            for existing in [child for child in parent.children if child.startswith(line + " ") and child.startswith(SINGLE_VALUED)]:
+                del parent.children[existing]
+        if line.startswith("ip vrf forwarding"):
+            for existing in [child for child in parent.children if child.startswith("ip address ")]:
+                del parent.children[existing]
+
+    def touch(self):
+        self.revision += 1
+        self.changed = time.perf_counter()
+
+    async def load(self, content, replace):
+        """Applies a downloaded configuration, replacing the running-config or merged into it"""
+        lines = [line.rstrip() for line in content.decode("latin-1").splitlines() if line.strip() and line.strip() != "!"]
+        await asyncio.sleep(self.faults.delay(self.faults.parse_delay * len(lines)))
+        if replace:
+            self.running = parse_config(content.decode("latin-1"))
+            self.config_lines += len(lines)
+            self.hostname = next((line.split(None, 1)[1] for line in self.running.children if line.startswith("hostname ")), DEFAULT_HOSTNAME)
+        else:
+            configuring, self.configuring, self.path = self.configuring, True, []
+            for line in lines:
+                self.apply(line)
+            self.configuring, self.path = configuring, []
+        self.touch()
+
+    def running_config(self):
+        lines = list(self.running.lines())
+        body = "\r\n".join(["!"] + [line for line in lines if line.strip() not in ("exit", "exit-address-family")] + ["!", "end"])
+        return f"Building configuration...\r\n\r\nCurrent configuration : {len(body)} bytes\r\n{body}"
+
+    async def transfer(self, session, url, replace):
+        start = time.perf_counter()
+        try:
+            content = await fetch(url)
+        except (OSError, asyncio.TimeoutError):
+            content = None
+        if content is None:
+            return f"%Error opening {url} (No such file or directory)"
+        await self.load(content, replace)
+        self.transfers += 1
+        output = f"Loading {url} \r\n[OK - {len(content)} bytes]\r\n"
+        if replace:
+            return output + "Total number of passes: 1\r\nRollback Done"
+        return output + f"{len(content)} bytes copied in {time.perf_counter() - start:.3f} secs"
+
+    async def execute(self, session, line):
+        """Runs an exec mode command, returns its output"""
+        if line == "enable":
+            self.enabled = True
+        elif line == "disable":
+            self.enabled = False
+        elif line in ("exit", "logout", "quit"):
+            raise ConnectionResetError
+        elif not self.enabled:
+            return INVALID_INPUT
+        elif line in ("configure terminal", "conf t"):
+            self.configuring, self.path = True, []
+            return "Enter configuration commands, one per line.  End with CNTL/Z."
+        elif line.startswith("terminal "):
+            pass
+        elif line in ("show running-config", "show run"):
+            return self.running_config()
+        elif line.startswith("show ") and self.network is not None:
+            output = self.network.show(self, line)
+            return INVALID_INPUT if output is None else output
+        elif line in ("write memory", "copy running-config startup-config"):
+            return "Building configuration...\r\n[OK]"
+        elif line.startswith("configure replace "):
+            return await self.transfer(session, line.split()[2], replace=True)
+        elif line.startswith("copy ") and line.split()[-1] == "running-config":
+            answer = await session.ask("Destination filename [running-config]? ")
+            if answer not in ("", "running-config"):
+                return INVALID_INPUT
+            return await self.transfer(session, line.split()[1], replace=False)
+        else:
+            return INVALID_INPUT
+        return ""
+
+    async def handle(self, line, session):
+        self.commands.append(line)
+        if not line.strip():
+            return ""
+        if self.configuring:
+            return self.apply(line) or ""
+        return await self.execute(session, line.strip())
+
+    def record(self):
+        return {
+            "hostname": self.hostname,
+            "port": self.port,
+            "connections": self.connections,
+            "dropped": self.dropped,
+            "config_lines": self.config_lines,
+            "rejected": self.rejected,
+            "transfers": self.transfers,
+            "commands": self.commands,
+            "running_config": [line for line in self.running.lines()],
+        }
+
+
+class ConsoleSession:
+    """One telnet connection to the console of a FakeRouter"""
+
+    def __init__(self, router, reader, writer):
+        self.router = router
+        self.reader = reader
+        self.writer = writer
+        self.pending = b""
+        self.buffer = ""
+        self.skip_newline = False
+
+    def filter_telnet(self, data):
+        """Removes the telnet commands sent by the client"""
+        data = self.pending + data
+        self.pending = b""
+        output = bytearray()
+        i = 0
+        while i < len(data):
+            if data[i] != IAC:
+                output.append(data[i])
+                i += 1
+            elif i + 1 >= len(data) or (data[i + 1] in (DO, DONT, WILL, WONT) and i + 2 >= len(data)):
+                self.pending = data[i:]
+                break
+            elif data[i + 1] == IAC:
+                output.append(IAC)
+                i += 2
+            elif data[i + 1] == SB:
+                end = data.find(bytes((IAC, SE)), i)
+                if end < 0:
+                    self.pending = data[i:]
+                    break
+                i = end + 2
+            else:
+                i += 3 if data[i + 1] in (DO, DONT, WILL, WONT) else 2
+        return output.decode("latin-1")
+
+    async def read_line(self):
+        """Returns the next line typed on the console, None once the client is gone"""
+        while True:
+            match = LINE_END.search(self.buffer)
+            if match:
+                line, self.buffer = self.buffer[:match.start()], self.buffer[match.end():]
+                # The \n or \0 of a \r\n may come with the next read, it must not end another line
+                self.skip_newline = match.group() == "\r" and not self.buffer
+                return line
+            data = await self.reader.read(4096)
+            if not data:
+                return None
+            text = self.filter_telnet(data)
+            if self.skip_newline and text[:1] in ("\n", "\0"):
+                text = text[1:]
+            self.skip_newline = False
+            self.buffer += text
+
+    async def write(self, text):
+        self.writer.write(text.encode("latin-1"))
+        await self.writer.drain()
+
+    async def ask(self, question):
+        await self.write(question)
+        answer = await self.read_line()
+        if answer is None:
+            raise ConnectionResetError
+        await self.write(answer + "\r\n")
+        self.router.commands.append(answer)
+        return answer.strip()
+
+    async def run(self):
+        router = self.router
+        faults = router.faults
+        router.connections += 1
+        router.reset_session()
+        drop_after = faults.random.randint(1, 50) if faults.drop_rate and faults.random.random() < faults.drop_rate else None
+        await asyncio.sleep(faults.delay(faults.connect_delay))
+        self.writer.write(bytes((IAC, WILL, ECHO, IAC, WILL, SGA)))
+        while True:
+            line = await self.read_line()
+            if line is None:
+                return
+            if drop_after is not None:
+                drop_after -= 1
+                if drop_after <= 0:
+                    router.dropped += 1
+                    return
+            await asyncio.sleep(faults.delay(faults.line_delay))
+            output = await router.handle(line.rstrip(), self)
+            await self.write(line + "\r\n" + (output + "\r\n" if output else "") + router.prompt())
+
+
+class FakeNetwork:
+    """The consoles of every router of a topology, in one event loop"""
+
+    def __init__(self, consoles, host="127.0.0.1", faults=None):
+        self.host = host
+        self.faults = faults or Faults()
+        self.routers = {port: FakeRouter(name, port, self.faults) for name, port in consoles}
+        self.by_name = {router.name: router for router in self.routers.values()}
+        for router in self.routers.values():
+            router.network = self
+        self.servers = []
+        self.revision = None
+        self.parsed = {}     # name -> ParsedConfig of the running-config
+        self.adjacency = {}  # name -> {check: {key: name of the neighbor}}, see convergence.adjacencies
+
+    async def handle(self, router, reader, writer):
+        try:
+            await ConsoleSession(router, reader, writer).run()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        for port, router in self.routers.items():
+            self.servers.append(await asyncio.start_server(lambda reader, writer, router=router: self.handle(router, reader, writer), self.host, port))
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def control_plane(self):
+        """Parsed running-configs and adjacencies of every router, computed again after a configuration change"""
+        revision = sum(router.revision for router in self.routers.values())
+        if revision != self.revision:
+            self.parsed = {}
+            nodes = []
+            for router in self.routers.values():
+                parsed = self.parsed[router.name] = parse_startup_config(router.running.lines())
+                parsed.router.hostname = router.name
+                ospf = {key.split()[1] for key in parsed.settings if key.startswith("interface ") and key.endswith(" ospf")}
+                nodes.append(router_node(parsed.router, ospf))
+            self.adjacency = adjacencies(nodes)
+            self.revision = revision
+        return self.parsed, self.adjacency
+
+    def established(self, router, peer):
+        return time.perf_counter() - max(router.changed, self.by_name[peer].changed) >= self.faults.converge_delay
+
+    def loopback(self, name):
+        loopback = self.parsed[name].router.interfaces.get("Loopback0")
+        return loopback.ip if loopback is not None and loopback.address is not None else "0.0.0.0"
+
+    def show(self, router, command):
+        """Output of a show command of the convergence check, None for the other commands"""
+        parsed, adjacency = self.control_plane()
+        config = parsed[router.name].router
+        up = {check: {key: peer for key, peer in keys.items() if self.established(router, peer)} for check, keys in adjacency[router.name].items()}
+        if command == SHOW_COMMANDS["ospf"]:
+            return show_ospf_neighbor(config, up.get("ospf", {}), self.loopback)
+        if command == SHOW_COMMANDS["ldp"]:
+            return show_ldp_neighbor(self.loopback(router.name), up.get("ldp", {}))
+        if command == SHOW_COMMANDS["bgp"]:
+            neighbors = [(neighbor.ip, neighbor.remote_as) for neighbor in config.bgp_neighbors]
+            return show_bgp_summary(self.loopback(router.name), config.as_number, neighbors, up.get("bgp", {}))
+        if command == SHOW_COMMANDS["vpnv4"]:
+            neighbors = [(neighbor.ip, neighbor.remote_as) for neighbor in config.vpnv4_neighbors]
+            neighbors += [(int_to_ip(vrf.remote_ip), vrf.remote_as) for vrf in config.vpns if vrf.remote_ip is not None]
+            return show_bgp_summary(self.loopback(router.name), config.as_number, neighbors, up.get("vpnv4", {}))
+        words = command.split()
+        if words[:4] == ["show", "ip", "route", "vrf"] and len(words) == 5:
+            routes = {key[1]: peer for key, peer in up.get("vrf_routes", {}).items() if key[0] == words[4]}
+            return show_vrf_routes(config, words[4], routes, parsed, self.loopback)
+        return None
+
+    def summary(self):
+        routers = self.routers.values()
+        return (f"{len(self.routers)} routeurs, {sum(router.connections for router in routers)} connexions, "
+                f"{sum(len(router.commands) for router in routers)} commandes, {sum(router.config_lines for router in routers)} lignes de configuration, "
+                f"{sum(router.transfers for router in routers)} téléchargements, {sum(router.rejected for router in routers)} commandes refusées, "
+                f"{sum(router.dropped for router in routers)} connexions coupées")
+
+    def record(self):
+        return {router.name: router.record() for router in self.routers.values()}
+
+    def save_running_configs(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for router in self.routers.values():
+            with open(os.path.join(directory, f"{router.name}.cfg"), 'w') as config_file:
+                config_file.write("\n".join(router.running.lines()) + "\n")
+
+
+def interface_towards(router, address):
+    """Name of the interface of the router on the subnet of address"""
+    for interface in router.interfaces.values():
+        if interface.address is not None and interface.prefixlen < 32 and network(interface.address, interface.prefixlen) == network(address, interface.prefixlen):
+            return interface.name
+    return "-"
+
+def show_ospf_neighbor(config, neighbors, loopback):
+    lines = ["", "Neighbor ID     Pri   State           Dead Time   Address         Interface"]
+    for ip, peer in neighbors.items():
+        lines.append(f"{loopback(peer):<15} {1:>3}   {'FULL/DR':<15} 00:00:35    {ip:<15} {interface_towards(config, ip_to_int(ip))}")
+    return "\r\n".join(lines)
+
+def show_ldp_neighbor(local, neighbors):
+    lines = []
+    for ip in neighbors:
+        lines.append(f"    Peer LDP Ident: {ip}:0; Local LDP Ident {local}:0")
+        lines.append(f"        TCP connection: {ip}.646 - {local}.11000")
+        lines.append("        State: Oper; Msgs sent/rcvd: 20/20; Downstream")
+        lines.append("        Up time: 00:01:00")
+    return "\r\n".join(lines)
+
+def show_bgp_summary(router_id, as_number, neighbors, established):
+    if as_number is None:
+        return "% BGP not active"
+    lines = [f"BGP router identifier {router_id}, local AS number {as_number}", "BGP table version is 1, main routing table version 1", "",
+             "Neighbor        V           AS MsgRcvd MsgSent   TblVer  InQ OutQ Up/Down  State/PfxRcd"]
+    for ip, remote_as in neighbors:
+        up = ip in established
+        lines.append(f"{ip:<15} 4 {remote_as:>12} {5 if up else 0:>7} {5 if up else 0:>7} {1:>8} {0:>4} {0:>4} {'00:01:00' if up else 'never':>8} {1 if up else 'Active':>8}")
+    return "\r\n".join(lines)
+
+def show_vrf_routes(config, vrf, routes, parsed, loopback):
+    interfaces = [interface for interface in config.interfaces.values() if interface.vrf == vrf and interface.address is not None]
+    if not interfaces and not routes:
+        return f"% IP routing table {vrf} does not exist"
+    lines = [f"Routing Table: {vrf}", "Codes: L - local, C - connected, S - static, R - RIP, M - mobile, B - BGP", "", "Gateway of last resort is not set", ""]
+    for interface in interfaces:
+        lines.append(f"C        {int_to_ip(network(interface.address, interface.prefixlen))}/{interface.prefixlen} is directly connected, {interface.name}")
+        lines.append(f"L        {interface.ip}/32 is directly connected, {interface.name}")
+    for ip, peer in routes.items():
+        prefixlen = next((interface.prefixlen for interface in parsed[peer].router.interfaces.values()
+                          if interface.vrf and interface.address is not None and network(interface.address, interface.prefixlen) == ip_to_int(ip)), 32)
+        lines.append(f"B        {ip}/{prefixlen} [200/0] via {loopback(peer)}, 00:01:00")
+    return "\r\n".join(lines)
+
+def raise_file_limit(consoles):
+    """Every router needs a listening socket and a connection, more than the default limit of open files past a few hundred"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = 2 * consoles + 256
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted if hard == resource.RLIM_INFINITY else min(wanted, hard), hard))
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description='''Emulation des consoles IOS des routeurs d'un intent file, pour tester le déploiement telnet sans GNS3''')
+    parser.add_argument('filename', help="Intent file, every router with a telnet_port gets a console")
+    parser.add_argument('--host', default="127.0.0.1", help="Address the consoles listen on")
+    parser.add_argument('--duration', type=float, help="Stop after this many seconds (until Ctrl+C by default)")
+    parser.add_argument('--line_delay', type=float, default=0.0, help="Seconds to answer each command")
+    parser.add_argument('--connect_delay', type=float, default=0.0, help="Seconds before a new connection gets its console")
+    parser.add_argument('--parse_delay', type=float, default=0.0, help="Seconds to apply each line of a configuration downloaded in bulk mode")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random extra delay, as a fraction of the delays above")
+    parser.add_argument('--error_rate', type=float, default=0.0, help="Probability that a configuration line is rejected by IOS")
+    parser.add_argument('--reject', action='append', default=[], help="Regular expression of configuration lines always rejected, can be repeated")
+    parser.add_argument('--drop_rate', type=float, default=0.0, help="Probability that a connection is closed in the middle of the session")
+    parser.add_argument('--converge_delay', type=float, default=0.0, help="Seconds after the last configuration change of both ends before an adjacency is up")
+    parser.add_argument('--seed', type=int, help="Seed of the injected errors, for reproducible runs")
+    parser.add_argument('--record', nargs='?', const=DEFAULT_RECORD_FILE, help=f"Write the commands and the running-config of every router to this JSON file on exit (default {DEFAULT_RECORD_FILE})")
+    parser.add_argument('--save_configs', help="Write the running-config of every router to this directory on exit, as <hostname>.cfg")
+    return parser.parse_args()
+
+async def serve(network, duration=None):
+    async with network:
+        print(f"{len(network.routers)} consoles IOS émulées sur {network.host}, Ctrl+C pour arrêter")
+        if duration is None:
+            await asyncio.Event().wait()
+        else:
+            await asyncio.sleep(duration)
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    consoles = intent_consoles(load_intent_file(args.filename, cache_dir=None))
+    if not consoles : raise SystemExit(f"Aucun routeur avec un telnet_port dans {args.filename}")
+    raise_file_limit(len(consoles))
+    faults = Faults(args.line_delay, args.jitter, args.connect_delay, args.parse_delay, args.error_rate, args.reject, args.drop_rate, args.converge_delay, args.seed)
+    emulator = FakeNetwork(consoles, args.host, faults)
+    try:
+        asyncio.run(serve(emulator, args.duration))
+    except KeyboardInterrupt:
+        pass
+    print(emulator.summary())
+    if args.record:
+        with open(args.record, 'w') as record_file:
+            json.dump(emulator.record(), record_file, indent=2)
+        print(f"Commandes reçues enregistrées dans {args.record}")
+    if args.save_configs:
+        emulator.save_running_configs(args.save_configs)
+        print(f"Running-configs enregistrées dans {args.save_configs}")
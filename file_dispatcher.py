@@ -1,39 +1,105 @@
 #!/usr/bin/env python3
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import os
-import shutil
+
+import profiler
+
+INDEX_FILE = ".gns3_index.json"
 
 class FileDispatcher():
-    def __init__(self, gns3_project_dir):
+    def __init__(self, gns3_project_dir, custom_config_dir='./', quiet=False, dry_run=False, jobs=8):
         self.gns3_project_directory = gns3_project_dir
-        self.custom_config_directory = './'
-        
+        self.custom_config_directory = custom_config_dir
+        self.quiet = quiet
+        self.dry_run = dry_run
+        self.jobs = jobs
+
+    def log(self, message):
+        if not self.quiet:
+            print(message)
+
     def copy_configs(self):
-        print(" Recherche des fichiers de configuration GNS3...")
-        gns3_configs = self.find_gns3_config_files(self.gns3_project_directory)
+        self.log(" Recherche des fichiers de configuration GNS3...")
+        with profiler.phase("dispatch : index"):
+            gns3_configs = self.find_gns3_config_files(self.gns3_project_directory)
 
         if not gns3_configs:
-            print(" Aucun fichier de configuration GNS3 trouvé !")
-        else:
-            print(f" {len(gns3_configs)} fichiers de configuration trouvés.")
+            self.log(" Aucun fichier de configuration GNS3 trouvé !")
+            return {}
+        self.log(f" {len(gns3_configs)} fichiers de configuration trouvés.")
 
-            print("\n Remplacement des fichiers...")
-            self.replace_configs(gns3_configs, self.custom_config_directory)
+        self.log("\n Remplacement des fichiers...")
+        with profiler.phase("dispatch : copy", jobs=self.jobs):
+            return self.replace_configs(gns3_configs, self.custom_config_directory)
 
     def find_gns3_config_files(self, gns3_project_dir):
         """
-        Recherche récursivement tous les fichiers de configuration GNS3 au format i{numéro}_startup-config.cfg.
+        Trouve les fichiers de configuration GNS3 au format i{numéro}_startup-config.cfg.
+
+        Les chemins sont lus dans le fichier .gns3 du projet (node_id et dynamips_id de chaque routeur)
+        et l'index est mis en cache tant que le fichier .gns3 ne change pas. Sans fichier .gns3,
+        seul le dossier project-files/dynamips est parcouru.
 
         Args:
-            gns3_project_dir (str): Chemin du dossier de configuration du projet GNS3.
+            gns3_project_dir (str): Chemin du dossier du projet GNS3.
 
         Returns:
             dict: Un dictionnaire {numéro_routeur: chemin_du_fichier}.
         """
+        project_file = self.find_project_file(gns3_project_dir)
+        if project_file is None:
+            return self.walk_dynamips_configs(gns3_project_dir)
+
+        stat = os.stat(project_file)
+        cache_key = f"{os.path.abspath(project_file)}:{stat.st_mtime_ns}:{stat.st_size}"
+        index_path = os.path.join(self.custom_config_directory, INDEX_FILE)
+        cache = {}
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as index_file:
+                cache = json.load(index_file)
+        if cache.get("key") == cache_key:
+            return {int(router_num): path for router_num, path in cache["configs"].items()}
+
+        router_configs = self.read_project_file(project_file)
+        if not self.dry_run:
+            with open(index_path, 'w') as index_file:
+                json.dump({"key": cache_key, "configs": router_configs}, index_file)
+        return router_configs
+
+    def find_project_file(self, gns3_project_dir):
+        if os.path.isfile(gns3_project_dir) and gns3_project_dir.endswith(".gns3"):
+            return gns3_project_dir
+        with os.scandir(gns3_project_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".gns3"):
+                    return entry.path
+        return None
+
+    def read_project_file(self, project_file):
+        """Retourne {numéro_routeur: chemin_du_fichier} pour les routeurs dynamips du fichier .gns3"""
+        with open(project_file, 'r') as gns3_file:
+            project = json.load(gns3_file)
+        project_dir = os.path.dirname(os.path.abspath(project_file))
+
         router_configs = {}
+        for node in project.get("topology", {}).get("nodes", []):
+            dynamips_id = node.get("properties", {}).get("dynamips_id")
+            if node.get("node_type") != "dynamips" or dynamips_id is None : continue
+            router_configs[int(dynamips_id)] = os.path.join(project_dir, "project-files", "dynamips", node["node_id"],
+                                                            "configs", f"i{dynamips_id}_startup-config.cfg")
+        return router_configs
 
-        for root, sous_doss, files in os.walk(gns3_project_dir):
-            print (files)
-            print (sous_doss)
+    def walk_dynamips_configs(self, gns3_project_dir):
+        """Parcourt le dossier dynamips du projet (ou le dossier donné) sans descendre dans les images ni les captures"""
+        root_dir = os.path.join(gns3_project_dir, "project-files", "dynamips")
+        if not os.path.isdir(root_dir):
+            root_dir = gns3_project_dir
+
+        router_configs = {}
+        for root, sous_doss, files in os.walk(root_dir):
+            sous_doss[:] = [d for d in sous_doss if d not in ("captures", "images", "qemu", "iou", "docker", "vpcs")]
             for file in files:
                 if file.startswith("i") and file.endswith("_startup-config.cfg"):
                     try:
@@ -47,21 +113,53 @@ class FileDispatcher():
     def replace_configs(self, gns3_configs, custom_config_dir):
         """
         Remplace les fichiers de configuration GNS3 par les fichiers de configuration personnalisés.
+        Les fichiers identiques sont ignorés, les autres sont copiés en parallèle
+        (écriture dans un fichier temporaire puis renommage, pour que la copie soit atomique).
 
         Args:
             gns3_configs (dict): Dictionnaire {numéro_routeur: chemin_du_fichier_GNS3}.
             custom_config_dir (str): Dossier contenant les fichiers de configuration personnalisés.
+
+        Returns:
+            dict: Dictionnaire {numéro_routeur: "copied" | "unchanged" | "missing"}.
         """
-        replaced_files = 0
+        jobs = [(router_num, os.path.join(custom_config_dir, f"i{router_num}_startup-config.cfg"), gns3_config_path)
+                for router_num, gns3_config_path in sorted(gns3_configs.items())]
+        with ThreadPoolExecutor(self.jobs) as pool:
+            results = dict(zip((job[0] for job in jobs), pool.map(self.profiled_replace_config, jobs)))
+
+        for router_num, custom_config_path, gns3_config_path in jobs:
+            if results[router_num] == "copied":
+                self.log(f" Remplacement : {gns3_config_path} ← {custom_config_path}")
+            elif results[router_num] == "missing":
+                self.log(f" Aucune config trouvée pour le routeur {router_num} ({custom_config_path} manquant)")
+
+        replaced_files = sum(1 for result in results.values() if result == "copied")
+        unchanged_files = sum(1 for result in results.values() if result == "unchanged")
+        dry_run = " (dry-run, aucun fichier modifié)" if self.dry_run else ""
+        self.log(f"\n {replaced_files}/{len(gns3_configs)} fichiers remplacés, {unchanged_files} identiques{dry_run}.")
+        return results
 
-        for router_num, gns3_config_path in gns3_configs.items():
-            custom_config_path = os.path.join(custom_config_dir, f"i{router_num}_startup-config.cfg")
+    def profiled_replace_config(self, job):
+        router_num, custom_config_path, gns3_config_path = job
+        with profiler.phase(f"copy i{router_num}", "router"):
+            return self.replace_config(custom_config_path, gns3_config_path)
 
-            if os.path.exists(custom_config_path):
-                shutil.copy(custom_config_path, gns3_config_path)
-                print(f" Remplacement : {gns3_config_path} ← {custom_config_path}")
-                replaced_files += 1
-            else:
-                print(f" Aucune config trouvée pour le routeur {router_num} ({custom_config_path} manquant)")
+    def replace_config(self, custom_config_path, gns3_config_path):
+        if not os.path.exists(custom_config_path):
+            return "missing"
+        with open(custom_config_path, 'rb') as custom_file:
+            content = custom_file.read()
+        if os.path.exists(gns3_config_path):
+            with open(gns3_config_path, 'rb') as gns3_file:
+                if hashlib.sha256(gns3_file.read()).digest() == hashlib.sha256(content).digest():
+                    return "unchanged"
+        if self.dry_run:
+            return "copied"
 
-        print(f"\n {replaced_files}/{len(gns3_configs)} fichiers remplacés.")
+        os.makedirs(os.path.dirname(gns3_config_path), exist_ok=True)
+        tmp_path = f"{gns3_config_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, gns3_config_path)
+        return "copied"
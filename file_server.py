@@ -0,0 +1,211 @@
+"""Local file servers for the bulk deployment of the configurations.
+
+Instead of typing every line on the console, each router downloads its whole
+configuration with a single command (configure replace or copy) from a server
+started by the generator for the duration of the deployment. Both servers run
+in the asyncio event loop of the telnet deployment and only serve the files
+they were given, by their base name :
+  - HTTP/1.0 GET, for "copy http://..." and "configure replace http://..."
+  - TFTP read requests (RFC 1350) with the blksize option (RFC 2348), which
+    most IOS images negotiate to send fewer, larger blocks
+"""
+import asyncio
+import os
+import struct
+
+RRQ, DATA, ACK, ERROR, OACK = 1, 3, 4, 5, 6
+TFTP_BLOCK_SIZE = 512
+TFTP_MAX_BLOCK_SIZE = 65464
+TFTP_TIMEOUT = 1.0
+TFTP_RETRIES = 5
+PROTOCOLS = ("http", "tftp")
+TFTP_PORT = 69  # IOS tftp: URLs do not generally accept another port
+
+
+class FileServer:
+    """Files served by name, with the counters of what was sent"""
+
+    def __init__(self, files, host="127.0.0.1", port=0, advertised_host=None):
+        self.files = {os.path.basename(path): path for path in files}
+        self.host = host
+        self.port = port
+        self.advertised_host = advertised_host or host  # address the routers use to reach the server
+        self.server = None
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def read(self, name):
+        """Returns the content of a served file, or None if it is not one of them"""
+        path = self.files.get(os.path.basename(name.lstrip("/")))
+        if path is None or not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as served_file:
+            return served_file.read()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class HttpFileServer(FileServer):
+    scheme = "http"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            method, path = request.split(b" ", 2)[:2]
+            content = self.read(path.decode("latin-1")) if method in (b"GET", b"HEAD") else None
+            if content is None:
+                writer.write(b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            else:
+                writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % len(content))
+                if method == b"GET":
+                    writer.write(content)
+                    self.requests += 1
+                    self.bytes_sent += len(content)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def url(self, name):
+        return f"http://{self.advertised_host}:{self.port}/{os.path.basename(name)}"
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+class TftpTransfer(asyncio.DatagramProtocol):
+    """Sends one file from its own port (the TID of RFC 1350), block by block"""
+
+    def __init__(self, server, content, block_size, options):
+        self.server = server
+        self.content = content
+        self.block_size = block_size
+        self.options = options  # acknowledged options, sent in an OACK before the first block
+        self.transport = None
+        self.block = 0
+        self.acked = asyncio.Event()
+        self.done = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if len(data) >= 4 and struct.unpack("!H", data[:2])[0] == ACK and struct.unpack("!H", data[2:4])[0] == self.block & 0xFFFF:
+            self.acked.set()
+        elif data[:2] == struct.pack("!H", ERROR) and not self.done.done():
+            self.done.set_result(False)
+
+    def error_received(self, exc):
+        if not self.done.done():
+            self.done.set_result(False)
+
+    async def send(self, packet):
+        """Sends a packet until its ACK comes back, returns False if the client gave up"""
+        for _ in range(TFTP_RETRIES):
+            self.acked.clear()
+            self.transport.sendto(packet)
+            waiter = asyncio.ensure_future(self.acked.wait())
+            await asyncio.wait((waiter, self.done), timeout=TFTP_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if self.done.done():
+                return False
+            if self.acked.is_set():
+                return True
+        return False
+
+    async def run(self):
+        try:
+            if self.options and not await self.send(struct.pack("!H", OACK) + b"".join(key + b"\0" + value + b"\0" for key, value in self.options.items())):
+                return
+            offset = 0
+            while True:
+                self.block += 1
+                chunk = self.content[offset:offset + self.block_size]
+                if not await self.send(struct.pack("!HH", DATA, self.block & 0xFFFF) + chunk):
+                    return
+                self.server.bytes_sent += len(chunk)
+                offset += len(chunk)
+                if len(chunk) < self.block_size:
+                    self.server.requests += 1
+                    return
+        finally:
+            self.transport.close()
+
+
+class TftpServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if len(data) < 4 or struct.unpack("!H", data[:2])[0] != RRQ:
+            self.transport.sendto(struct.pack("!HH", ERROR, 4) + b"Only read requests are served\0", address)
+            return
+        fields = data[2:].split(b"\0")
+        name, options = fields[0].decode("latin-1"), {}
+        for key, value in zip(fields[2::2], fields[3::2]):
+            if key.lower() == b"blksize" and value.isdigit():
+                options[b"blksize"] = str(max(8, min(int(value), TFTP_MAX_BLOCK_SIZE))).encode()
+            elif key.lower() == b"tsize":
+                options[b"tsize"] = None  # filled with the file size below
+        content = self.server.read(name)
+        if content is None:
+            self.transport.sendto(struct.pack("!HH", ERROR, 1) + b"File not found\0", address)
+            return
+        if b"tsize" in options:
+            options[b"tsize"] = str(len(content)).encode()
+        block_size = int(options.get(b"blksize", TFTP_BLOCK_SIZE))
+        task = asyncio.ensure_future(self.server.transfer(content, block_size, options, address))
+        self.server.transfers.add(task)
+        task.add_done_callback(self.server.transfers.discard)
+
+
+class TftpFileServer(FileServer):
+    scheme = "tftp"
+
+    def __init__(self, files, host="127.0.0.1", port=0, advertised_host=None):
+        super().__init__(files, host, port, advertised_host)
+        self.transfers = set()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.server, _ = await loop.create_datagram_endpoint(lambda: TftpServerProtocol(self), local_addr=(self.host, self.port))
+        self.port = self.server.get_extra_info("sockname")[1]
+
+    async def transfer(self, content, block_size, options, address):
+        loop = asyncio.get_running_loop()
+        transport, transfer = await loop.create_datagram_endpoint(lambda: TftpTransfer(self, content, block_size, options),
+                                                                  local_addr=(self.host, 0), remote_addr=address)
+        await transfer.run()
+
+    def url(self, name):
+        port = "" if self.port == TFTP_PORT else f":{self.port}"
+        return f"tftp://{self.advertised_host}{port}/{os.path.basename(name)}"
+
+    def close(self):
+        for task in self.transfers:
+            task.cancel()
+        if self.server is not None:
+            self.server.close()
+
+
+def file_server(protocol, files, host="127.0.0.1", port=None, advertised_host=None):
+    """Returns the HTTP or TFTP server of files, to use with async with. By default TFTP uses port 69, HTTP a free port"""
+    if protocol not in PROTOCOLS : raise ValueError(f"unknown file server protocol {protocol}, use {' or '.join(PROTOCOLS)}")
+    if port is None:
+        port = TFTP_PORT if protocol == "tftp" else 0
+    return (HttpFileServer if protocol == "http" else TftpFileServer)(files, host, port, advertised_host)
@@ -1,22 +1,14 @@
 from file_dispatcher import FileDispatcher
-from telnet import TelnetConfigurator 
+from telnet import deploy_configs
+from intent_loader import load_intent_file
+from bgp_policy import PolicyEngine
+from scheduler import border_roles, build_graph, deployment_waves, intent_links
 from pprint import pprint
 import ipaddress
 import argparse
-import json
-import yaml
 import re 
 
 # START OF GETTER FUNCTIONS
-def load_intent_file(filename):
-    """Loading the file as a Python dict object. Compatible with yaml and  json"""
-    with open(filename, 'r') as intent_file:
-        if (filename.split('.')[-1] == 'json') :
-            data = json.load(intent_file)
-        elif (filename.split('.')[-1] == 'yaml' or 'yml'):
-              data = yaml.safe_load(intent_file)
-    return data
-
 def argument_parser():
     parser = argparse.ArgumentParser(description='''Projet GNS3 2024-2025 -- Génération automatisé de configurations CISCO''')
     parser.add_argument('filename', help="Intent file describing the network that needs to be configured. YAML and JSON are supported")
@@ -43,6 +35,7 @@ def map_routers_to_as_and_protocol(data):
     """
     router_mapping = {}
     for as_key, as_values in data.items():
+        if "AS" not in as_key : continue
         for as_entry in as_values:
             as_number = as_entry.get('number')
             protocol = as_entry.get('IGP')
@@ -51,27 +44,61 @@ def map_routers_to_as_and_protocol(data):
                 router_mapping[router_name] = {"AS_number": as_number, "protocol": protocol, "telnet_port" : int(router["telnet_port"])}
     return router_mapping
 
-def get_dico_network (data, router_map):
-    dico_networks = {}
+def get_networks_by_as(data, router_map):
+    """
+    Indexes the networks announced in BGP by the border routers of each AS.
+
+    :param data: contenu du fichier d'intention sous forme de dictionnaire
+    :param router_map: Dictionnaire {routeur: {interface: adresse}}
+    :return: Dictionnaire {numéro d'AS: [réseaux]}, un réseau par couple de routeurs connectés
+    """
+    links = {}
     for as_id, val in data.items():
-        if as_id != "BGP_connections":
+        if "AS" in as_id:
+            as_number = val[0]['number']
             for liaison in val[0]['internal_connections']:
-                dico_networks [(data[as_id][0]['number'], (liaison['first_peer_hostname'],liaison['second_peer_hostname']))] = liaison['first_peer_interface']
-    for key, value in dico_networks.items():
-        router1, router2 = key[1]
-        dico_networks[key] = router_map[router1][value][:-4] + router_map[router1][value][-3:]
-    return (dico_networks)
-        
-        
-def get_border_routers(bgp_data):
-    result = []
+                links[(as_number, liaison['first_peer_hostname'], liaison['second_peer_hostname'])] = liaison['first_peer_interface']
+    networks_by_as = {}
+    for (as_number, router1, _), interface in links.items():
+        ip = router_map[router1][interface]
+        networks_by_as.setdefault(as_number, []).append(ip[:-4] + ip[-3:])
+    return networks_by_as
+
+def get_passive_interfaces(bgp_data):
+    """Returns {hostname: [interfaces]} of the eBGP interfaces of every border router"""
+    result = {}
     for connection in bgp_data:
-        result.append((connection['AS_1_router_hostname'], connection['AS_1_router_interface']))
-        result.append((connection['AS_2_router_hostname'], connection['AS_2_router_interface']))
+        result.setdefault(connection['AS_1_router_hostname'], []).append(connection['AS_1_router_interface'])
+        result.setdefault(connection['AS_2_router_hostname'], []).append(connection['AS_2_router_interface'])
+    return result
 
+def get_neighbors_by_relation(neighbors):
+    """Returns {hostname: {relation: [neighbor ip]}} of the eBGP neighbors, from generate_external_neighbors"""
+    result = {}
+    for router, router_neighbors in neighbors.items():
+        for neighbor in router_neighbors:
+            if neighbor[2] : continue
+            result.setdefault(router, {}).setdefault(neighbor[3], []).append(neighbor[0])
     return result
 
-        
+
+class PolicyIndexes:
+    """Per router indexes of the RIP/OSPF generator, built once so that each router is rendered by lookups"""
+    __slots__ = ("router_mapping", "networks_by_as", "passive_interfaces", "neighbors_by_relation", "policies")
+
+    def __init__(self, data, routers_data, routers_bgp):
+        self.router_mapping = map_routers_to_as_and_protocol(data)
+        self.networks_by_as = get_networks_by_as(data, routers_data)
+        self.passive_interfaces = get_passive_interfaces(data.get('BGP_connections') or [])
+        self.neighbors_by_relation = get_neighbors_by_relation(routers_bgp)
+        self.policies = PolicyEngine(data.get('BGP_policies'))
+
+    def networks(self, router):
+        """Networks announced by a router : the ones of its AS if it is a border router"""
+        if router not in self.passive_interfaces:
+            return []
+        return self.networks_by_as.get(self.router_mapping[router]["AS_number"], [])
+
 # END OF GETTER FUNCTIONS
 
 # START OF NETWORK ADDRESSING
@@ -207,12 +234,14 @@ def config_interfaces(valeurs, dico_protocoles, routeur):
 
     return "\n".join(config)
 
-def bgp_add(bgp_config, num, router_mapping, network, border_routers):
+def bgp_add(bgp_config, num, router_mapping, networks, policies):
     """
     Génère la configuration BGP pour un routeur Cisco.
 
     :param bgp_config: Dictionnaire contenant les informations BGP (AS et voisins)
     :param num: Numéro du routeur (extrait du nom du routeur)
+    :param networks: Réseaux annoncés par le routeur (voir PolicyIndexes.networks)
+    :param policies: PolicyEngine donnant les route-maps de chaque relation
     :return: Chaîne de texte représentant la configuration BGP
     """
     config = []
@@ -221,18 +250,14 @@ def bgp_add(bgp_config, num, router_mapping, network, border_routers):
     config.append(f" bgp router-id {num}.{num}.{num}.{num}")
     config.append(" bgp log-neighbor-changes")
     for neighbor in bgp_config[f"R{num}"]:
-        print (neighbor)
         config.append(f" neighbor {neighbor[0]} remote-as {neighbor[1]}")
         if neighbor[2]:
             config.append(f" neighbor {neighbor[0]} update-source Loopback0")
         else :
-            config.append(f" neighbor {neighbor[0]} route-map {neighbor[3].upper()} in")
+            config.extend(policies.neighbor_lines(neighbor[0], neighbor[3]))
     config.append(" !\n address-family ipv4")
-    for router in border_routers:
-        if f"R{num}" in router[0]:
-            for key, ip_value in network.items():
-                if key[0] ==  router_mapping[f"R{num}"]["AS_number"]:
-                    config.append(f"  network {ip_value}")
+    for network in networks:
+        config.append(f"  network {network}")
     for neighbor in bgp_config[f"R{num}"]:
         config.append(f"  neighbor {neighbor[0]} next-hop-self")
         config.append(f"  neighbor {neighbor[0]} activate")
@@ -241,7 +266,7 @@ def bgp_add(bgp_config, num, router_mapping, network, border_routers):
     config.append("!")
     return "\n".join(config)
 
-def add_protocol(num, dico_protocoles, border_routers):
+def add_protocol(num, dico_protocoles, passive_interfaces):
     config = []
     
     #configuration du protocole routeur*
@@ -253,20 +278,22 @@ def add_protocol(num, dico_protocoles, border_routers):
         num_as = dico_protocoles['AS_number']
         config.append(f"ip router ospf {num_as}")
         config.append(f" router-id {num}.{num}.{num}.{num}")
-        for router in border_routers:
-            if f"R{num}" == router[0]:
-                config.append(f" passive-interface {router[1]}")
+        for interface in passive_interfaces:
+            config.append(f" passive-interface {interface}")
                 
         
     return "\n".join(config)
 
-def generate_config_file(hostname, interface_data, router_mapping, routers_bgp, router_network, border_routers):
+def generate_config_file(hostname, interface_data, routers_bgp, indexes):
     file_name = f"i{hostname}_startup-config.cfg"
+    router = f"R{hostname}"
     with open(file_name, 'w') as file:
         file.write(generate_base_cisco_config(hostname))
-        file.write("\n" + config_interfaces(interface_data, router_mapping, hostname))
-        file.write("\n" + bgp_add(routers_bgp, hostname, router_mapping, router_network, border_routers))
-        file.write("\n" + add_protocol(hostname, router_mapping[f"R{hostname}"], border_routers))
+        file.write("\n" + config_interfaces(interface_data, indexes.router_mapping, hostname))
+        file.write("\n" + bgp_add(routers_bgp, hostname, indexes.router_mapping, indexes.networks(router), indexes.policies))
+        file.write("\n" + add_protocol(hostname, indexes.router_mapping[router], indexes.passive_interfaces.get(router, [])))
+        if router in indexes.neighbors_by_relation:
+            file.write("\n!\n" + indexes.policies.policy_config(indexes.router_mapping[router]["AS_number"], indexes.neighbors_by_relation[router]))
     print(f"Configuration pour le router {hostname} terminée")
 # END OF CONFIG
 
@@ -292,29 +319,23 @@ if __name__ == "__main__" :
         routers_data = get_routers_external_interfaces_ip(data.get("BGP_connections", {}), routers_data, subnets_iters)
         
         routers_bgp = generate_external_neighbors(routers_bgp,routers_data, data.get("BGP_connections", {}))
-        # Mapping each router to it's AS and IGP
-        router_mapping = map_routers_to_as_and_protocol(data)
-        router_network = get_dico_network(data, routers_data)
-        border_routers = get_border_routers(data.get('BGP_connections'))
+        # AS and IGP of each router, networks by AS, passive interfaces and neighbors by relation
+        indexes = PolicyIndexes(data, routers_data, routers_bgp)
 
         for router in routers_data:
-            generate_config_file(router[1:], routers_data, router_mapping, routers_bgp, router_network, border_routers)
+            generate_config_file(router[1:], routers_data, routers_bgp, indexes)
 
         if args.copy_config :
             configurator = FileDispatcher(args.copy_config)
             configurator.copy_configs()
 
         if args.telnet :
-            processes = []
-            for router, infos in router_mapping.items():
-                p = TelnetConfigurator('localhost', infos["telnet_port"], f"i{router[1:]}_startup-config.cfg")
-                p.start()
-                processes.append(p)
-
-            for p in processes:
-                    p.join()
-
-            #TODO : GET every router telnet port and copy the config file there
+            targets = [(router, infos["telnet_port"], f"i{router[1:]}_startup-config.cfg") for router, infos in indexes.router_mapping.items()]
+            # Routers without a border connection first, then the border routers
+            graph = build_graph(intent_links([val[0] for key, val in data.items() if "AS" in key], data.get("BGP_connections")))
+            waves = deployment_waves(border_roles(indexes.router_mapping, data.get("BGP_connections")), graph)
+            as_numbers = {router: infos["AS_number"] for router, infos in indexes.router_mapping.items()}
+            deploy_configs(targets, 'localhost', waves=waves, as_numbers=as_numbers)
 
     except Exception as e:
         print(e)
@@ -0,0 +1,153 @@
+"""Incremental regeneration of the router configurations.
+
+The manifest keeps a fingerprint of every record of the last intent file (AS
+settings, routers, internal_connections, AS_connections) and the hash of every
+rendered configuration. Diffing two sets of fingerprints tells which routers an
+intent change actually touches, only those are rendered again, and a file is
+only rewritten when its content changed, so untouched files keep their mtime.
+"""
+import hashlib
+import json
+import os
+
+from ipam import link_key
+
+MANIFEST_VERSION = 2
+
+
+def record_hash(record):
+    return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+def content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def file_hash(path):
+    with open(path, 'rb') as source:
+        return hashlib.sha256(source.read()).hexdigest()
+
+
+def intent_fingerprints(as_list, as_connections, generator=None):
+    """
+    Returns the fingerprint of every record of the intent file, with the routers each record touches.
+
+    :param generator: Hash of the generator code, any change to it forces a full rebuild
+    """
+    fingerprints = {"generator": generator, "as": {}, "routers": {}, "internal_connections": {}, "AS_connections": {}}
+    for as_data in as_list:
+        as_number = str(int(as_data["number"]))
+        settings = {key: value for key, value in as_data.items() if key not in ("routers", "internal_connections")}
+        fingerprints["as"][as_number] = {
+            "hash": record_hash(settings),
+            "routers": [router["hostname"] for router in as_data.get("routers", [])],
+            # The route reflectors are elected by number of internal links (see elect_route_reflectors)
+            "elected_route_reflectors": as_data.get("ibgp") == "route_reflector" and not as_data.get("route_reflectors"),
+        }
+        for router in as_data.get("routers", []):
+            fingerprints["routers"][router["hostname"]] = {"as": as_number, "hash": record_hash(router), "is_border": bool(router.get("is_border"))}
+        for internal in as_data.get("internal_connections", []):
+            key = link_key(internal["first_peer_hostname"], internal["first_peer_interface"],
+                           internal["second_peer_hostname"], internal["second_peer_interface"])
+            fingerprints["internal_connections"][key] = {
+                "hash": record_hash(internal),
+                "routers": [internal["first_peer_hostname"], internal["second_peer_hostname"]],
+                "as": as_number,
+            }
+    for connection in as_connections:
+        key = link_key(connection["AS_1_router_hostname"], connection["AS_1_router_interface"],
+                       connection["AS_2_router_hostname"], connection["AS_2_router_interface"])
+        connexion = (connection.get("connexion") or [{}])[0]
+        fingerprints["AS_connections"][key] = {
+            "hash": record_hash(connection),
+            "routers": [connection["AS_1_router_hostname"], connection["AS_2_router_hostname"]],
+            "as": [str(int(connection["AS_1"])), str(int(connection["AS_2"]))],
+            "vrf": connexion.get("vrf_name") if connexion.get("type") == "VPN" else None,
+        }
+    return fingerprints
+
+
+def changed_records(old, new):
+    """Yields (key, old_record, new_record) for every record added, removed or modified between two fingerprint tables"""
+    for key in old.keys() | new.keys():
+        old_record, new_record = old.get(key), new.get(key)
+        if old_record is None or new_record is None or old_record["hash"] != new_record["hash"]:
+            yield key, old_record, new_record
+
+
+def affected_routers(manifest, fingerprints, topology):
+    """
+    Computes the routers whose configuration may change after an intent modification.
+
+    :param manifest: Manifest of the previous run (see load_manifest)
+    :param fingerprints: Fingerprints of the new intent (see intent_fingerprints)
+    :param topology: Topology built from the new intent
+    :return: Set of hostnames to render again
+    """
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("generator") != fingerprints.get("generator"):
+        return set(topology.routers)
+
+    affected = set()
+    dirty_as = set()
+    for as_number, old, new in changed_records(manifest["as"], fingerprints["as"]):
+        for record in (old, new):
+            if record : affected.update(record["routers"])
+        dirty_as.add(as_number)
+
+    for hostname, old, new in changed_records(manifest["routers"], fingerprints["routers"]):
+        if old is None or new is None or old["is_border"] != new["is_border"]:
+            # The iBGP sessions and vpnv4 neighbors of the whole AS change
+            dirty_as.update(record["as"] for record in (old, new) if record)
+        affected.add(hostname)
+
+    for _, old, new in changed_records(manifest["internal_connections"], fingerprints["internal_connections"]):
+        for record in (old, new):
+            if not record : continue
+            affected.update(record["routers"])
+            if fingerprints["as"].get(record["as"], {}).get("elected_route_reflectors"):
+                # A new or removed link can elect other route reflectors, with another cluster-id
+                dirty_as.add(record["as"])
+
+    for _, old, new in changed_records(manifest["AS_connections"], fingerprints["AS_connections"]):
+        for record in (old, new):
+            if not record : continue
+            affected.update(record["routers"])
+            if record["vrf"]:
+                # PEs sharing the VRF render its route-targets
+                affected.update(topology.vrfs.pes.get(record["vrf"], ()))
+
+    for as_number in dirty_as:
+        affected.update(router.hostname for router in topology.routers_by_as.get(int(as_number), []))
+        for record in fingerprints["AS_connections"].values():
+            if as_number in record["as"] : affected.update(record["routers"])
+
+    # Routers never rendered, or whose file disappeared
+    for hostname, router in topology.routers.items():
+        previous = manifest["configs"].get(hostname)
+        if previous is None or not os.path.exists(previous["file"]):
+            affected.add(hostname)
+
+    return affected & topology.routers.keys()
+
+
+def load_manifest(path):
+    """Returns the manifest of the previous run, or an empty one"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as manifest_file:
+        return json.load(manifest_file)
+
+def build_manifest(fingerprints, configs):
+    """Manifest of a run, as saved by save_manifest (the watch mode keeps it in memory)"""
+    return dict(fingerprints, version=MANIFEST_VERSION, configs=configs)
+
+def save_manifest(path, fingerprints, configs):
+    """
+    Saves the manifest of this run.
+
+    :param fingerprints: Fingerprints of the intent (see intent_fingerprints)
+    :param configs: Dictionnaire {hostname: {"file": chemin, "hash": hash de la configuration}}
+    """
+    manifest = build_manifest(fingerprints, configs)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
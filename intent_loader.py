@@ -0,0 +1,123 @@
+"""Loading of the intent files.
+
+YAML is parsed with the libyaml loader when PyYAML was built with it. The
+parsed intent is kept in a pickle cache keyed by the path, size and content
+hash of the file, so an unchanged intent is loaded without parsing it again.
+
+Very large intents can also be read as a stream of records (see
+iter_intent_records) : JSON Lines, or a YAML stream of documents.
+"""
+import hashlib
+import json
+import os
+import pickle
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+CACHE_DIR = ".nas_cache"
+CACHE_VERSION = 1
+STREAM_EXTENSIONS = ("jsonl", "ndjson")
+
+
+def parse_intent(filename, content):
+    """Parses the content of an intent file according to its extension"""
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension == 'json':
+        return json.loads(content)
+    if extension in ('yaml', 'yml'):
+        return yaml.load(content, Loader=SafeLoader)
+    raise Exception(f'Intent file error : unsupported format ".{extension}" for {filename}, use .yml, .yaml or .json')
+
+def cache_path(filename, cache_dir):
+    return os.path.join(cache_dir, hashlib.sha1(os.path.abspath(filename).encode()).hexdigest() + ".pickle")
+
+def load_intent_file(filename, cache_dir=CACHE_DIR):
+    """Loading the file as a Python dict object. Compatible with yaml and json"""
+    with open(filename, 'rb') as intent_file:
+        content = intent_file.read()
+    if not cache_dir:
+        return parse_intent(filename, content)
+
+    key = (CACHE_VERSION, os.path.abspath(filename), len(content), hashlib.blake2b(content).hexdigest())
+    path = cache_path(filename, cache_dir)
+    try:
+        with open(path, 'rb') as cache_file:
+            cached_key, data = pickle.load(cache_file)
+        if cached_key == key:
+            return data
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        pass
+
+    data = parse_intent(filename, content)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as cache_file:
+        pickle.dump((key, data), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return data
+
+
+def split_document(document):
+    """Yields the (kind, record) of one document of an intent stream"""
+    if isinstance(document, list):
+        for item in document:
+            yield from split_document(item)
+        return
+    if not isinstance(document, dict):
+        raise Exception(f'Intent file error : stream documents must be mappings, got {document!r}')
+    for key, value in document.items():
+        if key in ("router", "internal_connection"):
+            yield key, value
+        elif key == "flush":
+            yield "flush", None
+        elif key == "AS_connection":
+            yield "AS_connection", value
+        elif key == "AS_connections":
+            for connection in value:
+                yield "AS_connection", connection
+        elif "AS_" in key:
+            raise Exception(f'Intent file error : unknown stream record "{key}"')
+        else:
+            # An AS, given as in the intent file (a list holding one mapping) or as a mapping, with or without its routers
+            as_data = dict(value[0] if isinstance(value, list) else value)
+            routers = as_data.pop("routers", None) or []
+            internal_connections = as_data.pop("internal_connections", None) or []
+            yield "AS", as_data
+            for router in routers:
+                yield "router", router
+            for internal in internal_connections:
+                yield "internal_connection", internal
+
+def iter_intent_records(filename):
+    """
+    Reads an intent file as a stream of records, without holding the whole file in memory.
+
+    .jsonl/.ndjson files hold one JSON document per line, YAML files may hold several documents
+    separated by "---". A document is either a whole intent file, or records such as
+    {"AS": {...}}, {"router": {...}}, {"internal_connection": {...}}, {"AS_connection": {...}}
+    and {"flush": true}. Routers and internal connections belong to the last AS given before them.
+
+    :param filename: Chemin de l'intent file
+    :return: Générateur de (type, record)
+    """
+    extension = filename.rsplit('.', 1)[-1].lower()
+    with open(filename, 'rb') as intent_file:
+        if extension in STREAM_EXTENSIONS:
+            for line_number, line in enumerate(intent_file, 1):
+                if not line.strip() : continue
+                try:
+                    document = json.loads(line)
+                except ValueError as e:
+                    raise Exception(f'Intent file error : line {line_number} of {filename} is not valid JSON ({e})')
+                yield from split_document(document)
+        elif extension in ('yaml', 'yml'):
+            for document in yaml.load_all(intent_file, Loader=SafeLoader):
+                if document is not None:
+                    yield from split_document(document)
+        else:
+            yield from split_document(parse_intent(filename, intent_file.read()))
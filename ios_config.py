@@ -0,0 +1,260 @@
+"""Parsing and diffing of IOS configurations.
+
+A configuration is read into a tree of ConfigSection, following the indentation
+of IOS (interface, router bgp, its address families, ip vrf...). Two trees can
+then be diffed to get the minimal list of commands (additions and "no" lines)
+turning a running configuration into the generated one.
+
+A startup-config can also be read back into the router model of topology.py
+(parse_startup_config), to compare existing configurations with the generated
+ones semantically (see drift.py).
+"""
+from topology import Router, Interface, Vrf, BgpNeighbor, ip_to_int, netmask_to_prefixlen
+
+# Lines of a running-config that are not configuration
+NOISE_PREFIXES = ("Building configuration", "Current configuration", "Last configuration change", "NVRAM config last updated")
+TERMINATORS = ("end", "exit", "exit-address-family")
+
+# Sections and lines written by the generator, the only ones a delta is allowed to remove
+REMOVABLE_SECTIONS = ("ip vrf ", "router ospf ", "router bgp ", "router rip ", "route-map ", "ip community-list ")
+MANAGED_LINES = ("ip address", "ip vrf forwarding", "ip ospf ", "mpls ip", "neighbor ", "redistribute ", "network ",
+                 "bgp cluster-id", "bgp router-id", "router-id", "rd ", "route-target ", "passive-interface ", "address-family ")
+# Interfaces are never removed : one the generator no longer writes is put back to its defaults if it carries managed lines
+DEFAULTED_SECTIONS = ("interface ",)
+# Lines replaced by a new value without a "no" first
+SINGLE_VALUED = ("ip address ", "ip vrf forwarding ", "rd ", "router-id ", "bgp router-id ", "bgp cluster-id ")
+
+
+class ConfigSection:
+    __slots__ = ("line", "children")
+
+    def __init__(self, line):
+        self.line = line
+        self.children = {}  # line -> ConfigSection, in configuration order
+
+    def lines(self, depth=0):
+        """Yields the commands recreating this section and its children"""
+        if self.line is not None:
+            yield " " * (depth - 1) + self.line
+        for child in self.children.values():
+            yield from child.lines(depth + 1)
+        if self.line is not None and self.children:
+            yield " " * (depth - 1) + exit_command(self.line)
+
+    def __repr__(self):
+        return f"ConfigSection({self.line!r}, {len(self.children)} children)"
+
+
+def exit_command(header):
+    return "exit-address-family" if header.startswith("address-family") else "exit"
+
+def negate(line):
+    return line[3:] if line.startswith("no ") else "no " + line
+
+
+def parse_config(lines):
+    """
+    Parses an IOS configuration into a ConfigSection tree.
+
+    :param lines: Texte de la configuration, ou itérable de lignes (un fichier ouvert par exemple)
+    :return: ConfigSection racine
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    root = ConfigSection(None)
+    stack = [(-1, root)]
+    for raw_line in lines:
+        line = raw_line.rstrip()
+        stripped = line.lstrip()
+        if not stripped or stripped.startswith("!") or stripped in TERMINATORS or stripped.startswith(NOISE_PREFIXES):
+            continue
+        indent = len(line) - len(stripped)
+        while stack[-1][0] >= indent:
+            stack.pop()
+        parent = stack[-1][1]
+        section = parent.children.get(stripped)
+        if section is None:
+            section = parent.children[stripped] = ConfigSection(stripped)
+        stack.append((indent, section))
+    return root
+
+
+def diff_sections(running, target, depth=0, removed_neighbors=None):
+    """Returns the commands to apply inside a section so that running matches target"""
+    commands = []
+    indent = " " * depth
+    # A neighbor removed from router bgp disappears from its address families too
+    removed_neighbors = set() if removed_neighbors is None else removed_neighbors
+
+    # Removals first, so that a single-valued command (ip address, rd...) is replaced and not removed afterwards
+    replaced = {prefix for prefix in SINGLE_VALUED for line in target.children if line.startswith(prefix)}
+    vrf_changed = False
+    for line in running.children:
+        if line in target.children : continue
+        if depth == 0:
+            if line.startswith(REMOVABLE_SECTIONS):
+                commands.append("no " + line)
+            elif line.startswith(DEFAULTED_SECTIONS) and any(child.startswith(MANAGED_LINES) for child in running.children[line].children):
+                # The address, OSPF, LDP and VRF of a link removed from the intent must not stay up
+                commands.append("default " + line)
+        elif line.startswith(MANAGED_LINES):
+            vrf_changed |= line.startswith("ip vrf forwarding")
+            if line.startswith(tuple(replaced)) : continue
+            words = line.split()
+            if words[0] == "neighbor":
+                if words[1] in removed_neighbors : continue
+                if words[2] == "remote-as":
+                    removed_neighbors.add(words[1])
+            commands.append(indent + negate(line))
+
+    added = target.children.keys() - running.children.keys()
+    if removed_neighbors:
+        # Removing the remote-as of a neighbor removed all its lines : those still in the target are sent again
+        added |= {line for line in target.children if line.startswith("neighbor ") and line.split()[1] in removed_neighbors}
+    if vrf_changed or any(line.startswith("ip vrf forwarding") for line in added):
+        # Changing the VRF of an interface clears its addresses : everything is sent again
+        added = target.children.keys()
+
+    for line, section in target.children.items():
+        if line in added:
+            commands.extend(indent + command for command in section.lines(1))
+        elif section.children:
+            sub_commands = diff_sections(running.children[line], section, depth + 1, removed_neighbors if depth else None)
+            if sub_commands:
+                commands.append(indent + line)
+                commands.extend(sub_commands)
+                commands.append(indent + exit_command(line))
+    return commands
+
+def diff_config(running, target):
+    """
+    Computes the minimal set of commands turning the running configuration into the target one.
+
+    :param running: ConfigSection de la configuration actuelle du routeur
+    :param target: ConfigSection de la configuration générée
+    :return: Liste de commandes à envoyer en mode configuration
+    """
+    return diff_sections(running, target)
+
+
+class ParsedConfig:
+    """A configuration read back into the router model, with its section tree and the settings the model has no field for"""
+    __slots__ = ("root", "router", "settings")
+
+    def __init__(self, root, router, settings):
+        self.root = root
+        self.router = router
+        self.settings = settings  # "interface X ospf", "ospf router-id"... -> value
+
+    def __repr__(self):
+        return f"ParsedConfig({self.router.hostname}, {len(self.root.children)} sections)"
+
+
+def sections(root, prefix):
+    """Yields (rest of the header, section) for every top level section whose header starts with prefix"""
+    for line, section in root.children.items():
+        if line.startswith(prefix):
+            yield line[len(prefix):], section
+
+def parse_address(words):
+    """Returns (address, prefixlen) from the words of an "ip address A M" line"""
+    try:
+        return ip_to_int(words[2]), netmask_to_prefixlen(words[3])
+    except (IndexError, ValueError):
+        return None, None
+
+def parse_startup_config(lines, num_creation=None):
+    """
+    Reads an IOS configuration into the router model.
+
+    Only the parts the generator manages are modelled (hostname, VRFs, interfaces, OSPF, BGP and
+    its address families), every other section stays available in the tree of the ParsedConfig.
+
+    :param lines: Texte de la configuration, ou itérable de lignes (un fichier ouvert par exemple)
+    :param num_creation: Numéro du routeur (i{num_creation}_startup-config.cfg) s'il est connu
+    :return: ParsedConfig
+    """
+    root = parse_config(lines)
+    settings = {}
+    hostname = next((line.split(None, 1)[1] for line in root.children if line.startswith("hostname ")), None)
+    router = Router(hostname, None, None, False, None, num_creation, None)
+
+    vrfs = {}
+    for name, section in sections(root, "ip vrf "):
+        vrf = vrfs[name] = Vrf(name, None, [], [], None, None)
+        for line in section.children:
+            words = line.split()
+            if words[0] == "rd":
+                vrf.rd = words[1]
+            elif line.startswith("route-target "):
+                if words[1] in ("export", "both"):
+                    vrf.exports.append(words[2])
+                if words[1] in ("import", "both"):
+                    vrf.imports.append(words[2])
+
+    for name, section in sections(root, "interface "):
+        address, prefixlen = None, None
+        vrf = None
+        for line in section.children:
+            words = line.split()
+            if line.startswith("ip address "):
+                address, prefixlen = parse_address(words)
+            elif line.startswith("ip vrf forwarding "):
+                vrf = words[3]
+            elif line.startswith("ip ospf ") and "area" in words:
+                settings[f"interface {name} ospf"] = " ".join(words[2:])
+            elif line == "shutdown":
+                settings[f"interface {name} shutdown"] = True
+        router.interfaces[name] = Interface(name, address, prefixlen, "mpls ip" in section.children, vrf)
+        router.mpls |= router.interfaces[name].mpls
+
+    for process, section in sections(root, "router ospf "):
+        router.igp = True
+        settings["ospf"] = process
+        for line in section.children:
+            if line.startswith("router-id "):
+                settings["ospf router-id"] = line.split()[1]
+            elif line.startswith("redistribute "):
+                settings.setdefault("ospf redistribute", []).append(line[len("redistribute "):])
+
+    for as_number, section in sections(root, "router bgp "):
+        router.as_number = int(as_number)
+        neighbors = {}
+        for line in section.children:
+            words = line.split()
+            if line.startswith(("bgp router-id ", "router-id ")):
+                settings["bgp router-id"] = words[-1]
+            elif line.startswith("bgp cluster-id "):
+                router.cluster_id = words[2]
+            elif words[0] == "neighbor" and len(words) > 3 and words[2] == "remote-as":
+                neighbors[words[1]] = BgpNeighbor(ip_to_int(words[1]), int(words[3]), external=int(words[3]) != router.as_number)
+                router.bgp_neighbors.append(neighbors[words[1]])
+            elif words[0] == "neighbor" and words[2:] == ["update-source", "Loopback0"]:
+                settings.setdefault("bgp update-source Loopback0", []).append(words[1])
+
+        for family, af in sections(section, "address-family "):
+            vrf_name = family.split()[2] if family.startswith("ipv4 vrf ") else None
+            for line in af.children:
+                words = line.split()
+                if words[0] == "redistribute":
+                    settings.setdefault(f"bgp {family} redistribute", []).append(" ".join(words[1:]))
+                if words[0] != "neighbor" or len(words) < 3 : continue
+                ip = words[1]
+                if vrf_name is not None:
+                    vrf = vrfs.setdefault(vrf_name, Vrf(vrf_name, None, [], [], None, None))
+                    if words[2] == "remote-as":
+                        vrf.remote_ip, vrf.remote_as = ip_to_int(ip), int(words[3])
+                elif words[2] == "route-reflector-client":
+                    router.route_reflector = True
+                    if family == "vpnv4":
+                        for neighbor in router.vpnv4_neighbors:
+                            if neighbor.address == ip_to_int(ip) : neighbor.rr_client = True
+                    elif ip in neighbors:
+                        neighbors[ip].rr_client = True
+                elif words[2] == "activate" and family == "vpnv4":
+                    remote_as = neighbors[ip].remote_as if ip in neighbors else router.as_number
+                    router.vpnv4_neighbors.append(BgpNeighbor(ip_to_int(ip), remote_as))
+                elif words[2] in ("activate", "allowas-in", "send-community"):
+                    settings.setdefault(f"bgp {family} {words[2]}", []).append(ip)
+    router.vpns = list(vrfs.values())
+    return ParsedConfig(root, router, settings)
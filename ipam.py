@@ -0,0 +1,235 @@
+"""IP address management for the generator.
+
+Each AS prefix is cut in fixed size blocks (/30 for links, /32 for loopbacks in
+the last /24 of the prefix). Pools track used blocks with an integer bitmap and
+hand out offsets, so an allocation is a couple of integer operations instead of
+walking ipaddress iterators. Allocations are keyed (by link or by hostname) and
+can be saved to an allocation table : reloading it keeps every existing address
+where it was and only the new links/routers get fresh blocks.
+
+When the intent is streamed, blocks are allocated one key at a time as links
+and routers arrive (Pool.allocate) instead of all at once (Pool.assign).
+
+The numbers of the VRFs (see vrf_registry.py) are kept in the same table.
+"""
+import json
+import os
+
+from topology import int_to_ip, ip_to_int
+from vrf_registry import VrfRegistry
+
+LINK_BLOCK = 4         # /30
+LOOPBACK_POOL_SIZE = 256  # last /24 of the AS prefix, one /32 per router
+
+
+class IpamError(Exception):
+    pass
+
+
+def link_key(first_hostname, first_interface, second_hostname, second_interface):
+    """Key identifying a link in the allocation table, independent of the order of its ends"""
+    ends = sorted((f"{first_hostname}:{first_interface}", f"{second_hostname}:{second_interface}"))
+    return f"{ends[0]}-{ends[1]}"
+
+
+class Pool:
+    """Blocks of block_size addresses starting at base, with a bitmap of the used ones"""
+    __slots__ = ("name", "base", "block_size", "size", "reserved", "bitmap", "allocations", "previous", "held")
+
+    def __init__(self, name, base, block_size, size, reserved=0):
+        self.name = name
+        self.base = base
+        self.block_size = block_size
+        self.size = size
+        self.reserved = reserved  # bitmap of blocks that can never be allocated
+        self.bitmap = reserved
+        self.allocations = {}     # key -> block offset
+        self.previous = {}        # key -> block offset of the previous allocation table, for allocate()
+        self.held = 0             # bitmap of the previous offsets whose key has not been allocated yet
+
+    def assign(self, keys, previous=None):
+        """Allocate one block per key, keeping the offsets of the previous allocation table"""
+        previous = previous or {}
+        self.bitmap = self.reserved
+        self.allocations = {}
+        new_keys = []
+        for key in keys:
+            offset = previous.get(key)
+            if offset is not None and 0 <= offset < self.size and not (self.bitmap >> offset) & 1:
+                self.allocations[key] = offset
+                self.bitmap |= 1 << offset
+            else:
+                new_keys.append(key)
+
+        free = self.size - self.bitmap.bit_count()
+        if len(new_keys) > free:
+            raise IpamError(f'Intent file error : {self.name} exhausted, {len(keys)} blocks needed but only {self.size - self.reserved.bit_count()} available')
+
+        for key in new_keys:
+            lowest_free = (self.bitmap + 1) & ~self.bitmap
+            offset = lowest_free.bit_length() - 1
+            self.allocations[key] = offset
+            self.bitmap |= lowest_free
+
+    def hold(self, previous):
+        """Keeps the offsets of the previous allocation table for their keys, before allocating keys one by one"""
+        self.previous = previous or {}
+        self.held = 0
+        for offset in self.previous.values():
+            if 0 <= offset < self.size:
+                self.held |= 1 << offset
+        self.held &= ~self.reserved
+
+    def allocate(self, key):
+        """Allocates the block of one key without knowing the keys still to come, returns its offset"""
+        offset = self.allocations.get(key)
+        if offset is not None:
+            return offset
+        offset = self.previous.get(key)
+        if offset is None or not 0 <= offset < self.size or (self.bitmap >> offset) & 1:
+            # New keys avoid the offsets held for keys that may come later, unless nothing else is left
+            for used in (self.bitmap | self.held, self.bitmap):
+                offset = ((used + 1) & ~used).bit_length() - 1
+                if offset < self.size : break
+            else:
+                raise IpamError(f'Intent file error : {self.name} exhausted, only {self.size - self.reserved.bit_count()} blocks available')
+        self.allocations[key] = offset
+        self.bitmap |= 1 << offset
+        self.held &= ~(1 << offset)
+        return offset
+
+    def address(self, key):
+        """First address of the block allocated to key"""
+        return self.base + self.allocations[key] * self.block_size
+
+
+class Ipam:
+    """Link and loopback pools of every AS, and the VRF numbers"""
+
+    def __init__(self):
+        self.links = {}      # AS number -> Pool
+        self.loopbacks = {}  # AS number -> Pool
+        self.prefixes = {}   # AS number -> (base, mask)
+        self.vrfs = VrfRegistry()
+
+    def add_as(self, as_number, prefix, mask, previous=None):
+        mask = int(mask)
+        base = ip_to_int(prefix)
+        if not 0 < mask <= 24 : raise IpamError(f'Intent file error : IPv4_mask of AS {as_number} must be between 1 and 24, got {mask}')
+        if base & ((1 << (32 - mask)) - 1) : raise IpamError(f'Intent file error : IPv4_prefix {prefix}/{mask} of AS {as_number} has host bits set')
+
+        link_blocks = 1 << (30 - mask)
+        loopback_blocks = LOOPBACK_POOL_SIZE // LINK_BLOCK
+        # The last /24 holds the loopbacks and is kept out of the link pool
+        reserved = ((1 << loopback_blocks) - 1) << (link_blocks - loopback_blocks)
+        self.prefixes[as_number] = (base, mask)
+        self.links[as_number] = Pool(f"link pool of AS {as_number}", base, LINK_BLOCK, link_blocks, reserved)
+        self.loopbacks[as_number] = Pool(f"loopback pool of AS {as_number}", base + (1 << (32 - mask)) - LOOPBACK_POOL_SIZE, 1, LOOPBACK_POOL_SIZE)
+        if previous:
+            # Streamed intent : the previous table of the AS is held while its keys are allocated one by one
+            self.links[as_number].hold(previous.get("links"))
+            self.loopbacks[as_number].hold(previous.get("loopbacks"))
+
+    def check_overlaps(self):
+        """Returns an error message for every pair of AS prefixes that overlap"""
+        errors = []
+        ordered = sorted(self.prefixes.items(), key=lambda item: item[1][0])
+        end, last_as = -1, None
+        for as_number, (base, mask) in ordered:
+            if base <= end:
+                last_base, last_mask = self.prefixes[last_as]
+                errors.append(f'Intent file error : prefix {int_to_ip(base)}/{mask} of AS {as_number} overlaps prefix {int_to_ip(last_base)}/{last_mask} of AS {last_as}')
+            if base + (1 << (32 - mask)) - 1 > end:
+                end, last_as = base + (1 << (32 - mask)) - 1, as_number
+        return errors
+
+    def check_overlap(self, as_number):
+        """Returns an error message for every AS prefix overlapping the one of as_number (streamed intents)"""
+        base, mask = self.prefixes[as_number]
+        end = base + (1 << (32 - mask)) - 1
+        return [f'Intent file error : prefix {int_to_ip(base)}/{mask} of AS {as_number} overlaps prefix {int_to_ip(other_base)}/{other_mask} of AS {other_as}'
+                for other_as, (other_base, other_mask) in self.prefixes.items()
+                if other_as != as_number and other_base <= end and base <= other_base + (1 << (32 - other_mask)) - 1]
+
+    def link(self, as_number, key):
+        """Returns the two host addresses of the /30 allocated to a link"""
+        network = self.links[as_number].address(key)
+        return network + 1, network + 2
+
+    def loopback(self, as_number, hostname):
+        return self.loopbacks[as_number].address(hostname)
+
+    def table(self):
+        """Current allocations, in the format of the allocation table file"""
+        table = {str(as_number): {"links": self.links[as_number].allocations, "loopbacks": self.loopbacks[as_number].allocations}
+                 for as_number in self.prefixes}
+        table["vrfs"] = self.vrfs.table()
+        return table
+
+
+def plan_intent(as_list, as_connections, table=None):
+    """
+    Allocates every address of the intent file before any of them is used.
+
+    :param as_list: Liste des AS de l'intent file
+    :param as_connections: Liste des AS_connections
+    :param table: Table d'allocation précédente (voir load_allocation_table)
+    :return: Ipam with all the links and loopbacks allocated
+    """
+    table = table or {}
+    ipam = Ipam()
+    errors = []
+    for as_data in as_list:
+        try:
+            ipam.add_as(int(as_data["number"]), as_data.get("IPv4_prefix"), as_data.get("IPv4_mask"))
+        except (IpamError, ValueError, AttributeError) as e:
+            errors.append(str(e) if isinstance(e, IpamError) else f'Intent file error : invalid IPv4 prefix for AS {as_data.get("number")} ({e})')
+    errors.extend(ipam.check_overlaps())
+    if errors : raise IpamError("\n".join(errors))
+
+    vrf_names = []
+    for connection in as_connections:
+        connexion = connection["connexion"][0]
+        if connexion["type"] == "VPN":
+            vrf_names.append(connexion["vrf_name"])
+            vrf_names.extend(connexion.get("vrf_import") or [])
+    ipam.vrfs.assign(vrf_names, table.get("vrfs"))
+
+    link_keys = {as_number: [] for as_number in ipam.prefixes}
+    for as_data in as_list:
+        as_number = int(as_data["number"])
+        for internal in as_data.get("internal_connections", []):
+            link_keys[as_number].append(link_key(internal["first_peer_hostname"], internal["first_peer_interface"],
+                                                 internal["second_peer_hostname"], internal["second_peer_interface"]))
+    for connection in as_connections:
+        # Transit links are taken from the pool of the highest AS number
+        as_number = max(int(connection["AS_1"]), int(connection["AS_2"]))
+        link_keys[as_number].append(link_key(connection["AS_1_router_hostname"], connection["AS_1_router_interface"],
+                                             connection["AS_2_router_hostname"], connection["AS_2_router_interface"]))
+
+    for as_data in as_list:
+        as_number = int(as_data["number"])
+        previous = table.get(str(as_number), {})
+        try:
+            ipam.links[as_number].assign(link_keys[as_number], previous.get("links"))
+        except IpamError as e:
+            errors.append(str(e))
+        try:
+            ipam.loopbacks[as_number].assign([router["hostname"] for router in as_data.get("routers", [])], previous.get("loopbacks"))
+        except IpamError as e:
+            errors.append(str(e))
+    if errors : raise IpamError("\n".join(errors))
+    return ipam
+
+def load_allocation_table(path):
+    """Returns the allocation table saved by a previous run, or an empty one"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as table_file:
+        return json.load(table_file)
+
+def save_allocation_table(path, ipam):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as table_file:
+        json.dump(ipam.table(), table_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
@@ -1,318 +1,736 @@
 from pprint import pprint 
 from file_dispatcher import  FileDispatcher
-import ipaddress
+from file_server import TFTP_PORT
+from intent_loader import load_intent_file, iter_intent_records, CACHE_DIR
+from telnet import deploy_configs
+from drift import detect_drift, print_drift_report
+from convergence import verify_convergence, print_convergence_report, DEFAULT_VERIFY_TIMEOUT
+from topology import Topology, Router, Interface, Vrf, BgpNeighbor, int_to_ip
+from ipam import Ipam, IpamError, plan_intent, link_key, load_allocation_table, save_allocation_table
+from templates import render
+from validator import validate_intent, IntentValidationError
+from incremental import intent_fingerprints, affected_routers, build_manifest, load_manifest, save_manifest, content_hash, file_hash
+from watch import file_watcher, DEFAULT_POLL_INTERVAL
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import islice
+import multiprocessing
+import templates
+import profiler
+import telemetry
+from scheduler import build_graph, deployment_waves, intent_links
+import heapq
+import time
+import sys
+import os
 import argparse
-import json
-import yaml
+
+STREAM_CHUNK_SIZE = 64  # routers sent at once to a render process in stream mode
+# Modules whose code changes the rendered configurations : editing one of them invalidates the manifest
+RENDERING_MODULES = ("nas_config_generator", "topology", "ipam", "vrf_registry", "bgp_policy", "incremental", "templates")
 
 # FILE INTERACTION AND USER INTERACTION
 def argument_parser():
     parser = argparse.ArgumentParser(description='''Projet NAS 2024-2025 -- Génération automatisé de configurations CISCO avec support BGP/MPLS VPN''')
     parser.add_argument('filename', help="Intent file describing the network that needs to be configured. YAML and JSON are supported")
     parser.add_argument('-c', '--copy_config', help="Generate config files and copy them to the specified GNS3 directory")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Do not list every copied file")
+    parser.add_argument('--dry_run', action='store_true', help="Show which GNS3 config files would be replaced without touching them")
     parser.add_argument('-t', '--telnet', action='store_true', help="Automatically configures the routers using Telnet")
+    parser.add_argument('--delta', action='store_true', help="With -t, read the running-config of each router and only send the differences")
+    parser.add_argument('--telnet_host', default="localhost", help="Host running the router consoles")
+    parser.add_argument('--concurrency', type=int, default=50, help="Maximum number of routers configured at the same time over Telnet")
+    parser.add_argument('--timeout', type=float, default=10, help="Telnet timeout in seconds for each router answer")
+    parser.add_argument('--retries', type=int, default=2, help="Number of Telnet retries for a router")
+    parser.add_argument('--no_waves', action='store_true', help="With -t, push every router at once instead of the P routers, then the PEs, then the CEs")
+    parser.add_argument('--per_as_concurrency', type=int, help="With -t, maximum number of routers of the same AS configured at the same time")
+    parser.add_argument('--bulk', choices=("http", "tftp"), help="With -t, serve the config files from a local HTTP or TFTP server and load each one with a single command")
+    parser.add_argument('--bulk_command', choices=("replace", "copy"), default="replace", help="Command loading the served file : configure replace or copy to running-config")
+    parser.add_argument('--server_bind', help="Address the file server of --bulk listens on (--server_address by default, 0.0.0.0 serves the configs to the whole network)")
+    parser.add_argument('--server_port', type=int, help="Port of the file server of --bulk (69 for TFTP, a free port for HTTP by default)")
+    parser.add_argument('--server_address', default="127.0.0.1", help="Address of the file server as seen from the routers")
+    parser.add_argument('--deploy_report', nargs='?', const=telemetry.DEFAULT_REPORT_FILE, help=f"With -t, write the per router metrics of the deployment as JSON (default {telemetry.DEFAULT_REPORT_FILE})")
+    parser.add_argument('--metrics', nargs='?', const=telemetry.DEFAULT_METRICS_FILE, help=f"With -t, write the deployment metrics as a Prometheus textfile (default {telemetry.DEFAULT_METRICS_FILE})")
+    parser.add_argument('--verify', action='store_true', help="After -t (or alone), poll the routers until their OSPF, LDP and BGP adjacencies and VRF routes are up, and report the missing ones")
+    parser.add_argument('--verify_timeout', type=float, default=DEFAULT_VERIFY_TIMEOUT, help="Seconds --verify waits for the network to converge")
+    parser.add_argument('-i', '--incremental', action='store_true', help="Only regenerate the routers affected by the changes since the last incremental run")
+    parser.add_argument('--manifest', default="nas_manifest.json", help="Manifest of the last incremental run")
+    parser.add_argument('-j', '--jobs', type=int, help="Number of processes rendering the configurations (or parsing them with --drift), 0 to use every core. 1 by default, every core with --drift")
+    parser.add_argument('--templates', help="Directory of custom templates (<name>.tmpl, or <role>/<name>.tmpl for a PE, P or CE role)")
+    parser.add_argument('-s', '--stream', action='store_true', help="Read the intent as a stream of records (JSON Lines or YAML documents) and write each config as soon as it is complete")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Print the whole router model before generating the configs")
+    parser.add_argument('--profile', nargs='?', const=profiler.DEFAULT_TRACE_FILE, help=f"Record the time, CPU time and allocations of every phase and router, written as a Chrome trace (default {profiler.DEFAULT_TRACE_FILE})")
+    parser.add_argument('--drift', metavar="GNS3_DIR", help="Compare the configs of a GNS3 project with the generated ones and report the differences of every router, without writing anything")
+    parser.add_argument('-w', '--watch', action='store_true', help="Keep running and regenerate the affected routers every time the intent file changes (with -c and -t, only they are copied and pushed)")
+    parser.add_argument('--polling', action='store_true', help="With --watch, poll the intent file instead of using inotify")
+    parser.add_argument('--poll_interval', type=float, default=DEFAULT_POLL_INTERVAL, help="Polling interval of --watch in seconds")
+    parser.add_argument('--no_cache', action='store_true', help="Always parse the intent file instead of using the cache in .nas_cache")
+    parser.add_argument('--ipam_table', default="ipam_table.json", help="Allocation table keeping the IP addresses stable between runs")
     return parser.parse_args()
 
-def load_intent_file(filename):
-    """Loading the file as a Python dict object. Compatible with yaml and  json"""
-    with open(filename, 'r') as intent_file:
-        if (filename.split('.')[-1] == 'json') :
-            data = json.load(intent_file)
-        elif (filename.split('.')[-1] == 'yaml' or 'yml'):
-              data = yaml.safe_load(intent_file)
-    return data
-
 # UTILS FUNCTIONS
-def get_all_as_subnets(prefix, mask):
-    """Function that returns all the available subnets for an AS"""
-    network = ipaddress.ip_network(f"{prefix}/{mask}")
-    networks = iter(network.subnets(new_prefix=30))
-    return networks
-
-def get_loopback_subnet(prefix, mask):
-    """Function to retrieve the loopback subnet for an AS"""
-    network = ipaddress.ip_network(f"{prefix}/{mask}")
-    # WARNING : Dark magic below, see here : https://stackoverflow.com/questions/2138873/cleanest-way-to-get-last-item-from-python-iterator
-    *_, last = iter(network.subnets(new_prefix=24))
-    return iter(last.subnets(new_prefix=32))
-
-def get_internal_ips(routers_dict, as_data):
+def get_as_list(data):
+    """Returns the data of every AS of the intent file"""
+    return [data.get(as_name_string, {})[0] for as_name_string in data if "AS_" not in as_name_string]
+
+def get_internal_ips(topology, as_data, ipam):
     """Generate the ip for internal connections in an AS"""
-    as_subnets = get_all_as_subnets(as_data.get("IPv4_prefix"), as_data.get("IPv4_mask"))
-    current_subnet = next(as_subnets)
+    as_number = int(as_data["number"])
     is_mpls_as = as_data.get("mpls", False)
     for internal in as_data.get("internal_connections", {}):
         # Getting all the data
-        first_peer = routers_dict.get(internal.get('first_peer_hostname', None))
+        first_hostname = internal.get('first_peer_hostname', None)
+        first_peer = topology.routers.get(first_hostname)
         first_interface = internal.get('first_peer_interface', None)
-        second_peer = routers_dict.get(internal.get('second_peer_hostname', None))
+        second_hostname = internal.get('second_peer_hostname', None)
+        second_peer = topology.routers.get(second_hostname)
         second_interface = internal.get('second_peer_interface', None)
 
-        first_peer["mpls"] = True
-        second_peer["mpls"] = True
+        first_peer.mpls = True
+        second_peer.mpls = True
 
         # Error checking
-        if first_peer["interfaces"].get(first_interface, None) : raise Exception(f'Intent file error : interface {first_interface} for router {internal.get('first_peer_hostname', None)} is already in use')
-        if second_peer["interfaces"].get(second_interface, None) : raise Exception(f'Intent file error : interface {second_interface} for router {internal.get('second_peer_hostname', None)} is already in use')
+        if first_interface in first_peer.interfaces : raise Exception(f'Intent file error : interface {first_interface} for router {first_hostname} is already in use')
+        if second_interface in second_peer.interfaces : raise Exception(f'Intent file error : interface {second_interface} for router {second_hostname} is already in use')
        
-        subnet_ips = current_subnet.hosts()
-        first_ip = str(next(subnet_ips)) + ' 255.255.255.252'
-        second_ip = str(next(subnet_ips)) + ' 255.255.255.252'
-    
-        first_peer["interfaces"][first_interface] = (first_ip, is_mpls_as, None)
-        second_peer["interfaces"][second_interface] = (second_ip, is_mpls_as, None)
-           
-        current_subnet = next(as_subnets)
-
-    return as_subnets 
+        first_ip, second_ip = ipam.link(as_number, link_key(first_hostname, first_interface, second_hostname, second_interface))
+        first_peer.interfaces[first_interface] = Interface(first_interface, first_ip, 30, is_mpls_as)
+        second_peer.interfaces[second_interface] = Interface(second_interface, second_ip, 30, is_mpls_as)
 
-def get_loopback_ips(routers_dict, as_data):
-    loopback_subnets = get_loopback_subnet(as_data.get("IPv4_prefix"), as_data.get("IPv4_mask"))
-    current_subnet = next(loopback_subnets)
+def get_loopback_ips(topology, as_data, ipam):
+    as_number = int(as_data["number"])
+    for router in topology.routers_by_as.get(as_number, []):
+        router.interfaces["Loopback0"] = Interface("Loopback0", ipam.loopback(as_number, router.hostname), 32)
 
-    for hostname, router_data in routers_dict.items():
-        if int(router_data["as_number"]) != int(as_data["number"]) : continue
-        ip = str(current_subnet.hosts()[0]) + ' 255.255.255.255'
-        routers_dict[hostname]["interfaces"]["Loopback0"] = (ip, False, None)
-
-        current_subnet = next(loopback_subnets)
-
-def get_external_ips(routers_dict, data, as_subnets):
+def get_external_ips(topology, data, ipam):
      for connection in data.get("AS_connections", []):
-        subnet = next(as_subnets[int(connection["AS_1"]) if int(connection["AS_1"]) > int(connection["AS_2"]) else int(connection["AS_2"])])
-
-        subnet_ips = subnet.hosts()
-        first_ip = str(next(subnet_ips)) +' 255.255.255.252'
-        second_ip = str(next(subnet_ips)) + ' 255.255.255.252'
-
-        routers_dict[connection["AS_1_router_hostname"]]['interfaces'][connection["AS_1_router_interface"]] = (first_ip, False, None)
-        routers_dict[connection["AS_2_router_hostname"]]['interfaces'][connection["AS_2_router_interface"]] = (second_ip, False, None)
+        first_hostname = connection["AS_1_router_hostname"]
+        first_interface = connection["AS_1_router_interface"]
+        second_hostname = connection["AS_2_router_hostname"]
+        second_interface = connection["AS_2_router_interface"]
+        key = link_key(first_hostname, first_interface, second_hostname, second_interface)
+        first_ip, second_ip = ipam.link(max(int(connection["AS_1"]), int(connection["AS_2"])), key)
+
+        topology[first_hostname].interfaces[first_interface] = Interface(first_interface, first_ip, 30)
+        topology[second_hostname].interfaces[second_interface] = Interface(second_interface, second_ip, 30)
     
-def get_ibgp_neighbors(routers_dict, data):
-    for router in data["routers"]:
-        for second_peer in data["routers"]:
-            if router == second_peer : continue
-            loopback_ip = routers_dict[second_peer["hostname"]]['interfaces']['Loopback0'][0].split(' ')[0]
-            
-            routers_dict[router["hostname"]]['bgp_neighbors'].append((loopback_ip, int(data["number"]),False))
-
-def get_ebgp_neighbors(routers_dict, data):
+def elect_route_reflectors(as_data):
+    """Returns the route reflectors of an AS : the ones given in the intent file, or the best connected routers"""
+    hostnames = [router["hostname"] for router in as_data.get("routers", [])]
+    route_reflectors = as_data.get("route_reflectors")
+    if route_reflectors:
+        if not isinstance(route_reflectors, list) : raise Exception(f'Intent file error : route_reflectors of AS {as_data["number"]} must be a list of hostnames')
+        for hostname in route_reflectors:
+            if hostname not in hostnames : raise Exception(f'Intent file error : route reflector {hostname} is not a router of AS {as_data["number"]}')
+        return list(route_reflectors)
+
+    count = as_data.get("route_reflector_count", 1)
+    if isinstance(count, bool) or not isinstance(count, int) or not 1 <= count <= len(hostnames):
+        raise Exception(f'Intent file error : route_reflector_count of AS {as_data["number"]} must be an integer between 1 and {len(hostnames)}, got {count!r}')
+    degree = dict.fromkeys(hostnames, 0)
+    for internal in as_data.get("internal_connections", []):
+        degree[internal["first_peer_hostname"]] += 1
+        degree[internal["second_peer_hostname"]] += 1
+    return heapq.nlargest(count, hostnames, key=degree.get)
+
+def get_ibgp_neighbors(topology, data):
+    """Build the iBGP sessions of an AS, as a full mesh or as a route reflector cluster"""
+    as_number = int(data["number"])
+    routers = topology.routers_by_as.get(as_number, [])
+    if not routers : return
+
+    if data.get("ibgp", "full_mesh") != "route_reflector":
+        border_routers = topology.border_routers_by_as.get(as_number, [])
+        for router in routers:
+            for peer in routers:
+                if peer is router : continue
+                router.bgp_neighbors.append(BgpNeighbor(peer.loopback, as_number))
+            for peer in border_routers:
+                if peer is router : continue
+                router.vpnv4_neighbors.append(BgpNeighbor(peer.loopback, as_number))
+        return
+
+    # Route reflector cluster : clients only peer with the reflectors, so sessions grow linearly
+    route_reflectors = [topology[hostname] for hostname in elect_route_reflectors(data)]
+    first_rr = route_reflectors[0].num_creation
+    cluster_id = data.get("cluster_id", f"{first_rr}.{first_rr}.{first_rr}.{first_rr}")
+    for router in route_reflectors:
+        router.route_reflector = True
+        router.cluster_id = cluster_id
+    for router in routers:
+        if router.route_reflector:
+            for peer in routers:
+                if peer is router : continue
+                is_client = not peer.route_reflector
+                router.bgp_neighbors.append(BgpNeighbor(peer.loopback, as_number, rr_client=is_client))
+                if not is_client or peer.is_border:
+                    router.vpnv4_neighbors.append(BgpNeighbor(peer.loopback, as_number, rr_client=is_client))
+        else:
+            for peer in route_reflectors:
+                router.bgp_neighbors.append(BgpNeighbor(peer.loopback, as_number))
+                if router.is_border:
+                    router.vpnv4_neighbors.append(BgpNeighbor(peer.loopback, as_number))
+
+def get_ebgp_neighbors(topology, data):
     for connection in data.get("AS_connections", []):
-        first_peer_ip = routers_dict[connection["AS_1_router_hostname"]]["interfaces"][connection["AS_1_router_interface"]][0].split(' ')[0]
-        second_peer_ip = routers_dict[connection["AS_2_router_hostname"]]["interfaces"][connection["AS_2_router_interface"]][0].split(' ')[0]
+        first_peer = topology[connection["AS_1_router_hostname"]]
+        second_peer = topology[connection["AS_2_router_hostname"]]
+        first_interface = first_peer.interfaces[connection["AS_1_router_interface"]]
+        second_interface = second_peer.interfaces[connection["AS_2_router_interface"]]
 
-        first_peer_as = int(routers_dict[connection["AS_1_router_hostname"]]["as_number"])
-        second_peer_as = int(routers_dict[connection["AS_2_router_hostname"]]["as_number"])
-        
         if connection["connexion"][0]["type"] == 'BGP':
-            routers_dict[connection["AS_1_router_hostname"]]['bgp_neighbors'].append((second_peer_ip, second_peer_as,True))
-            routers_dict[connection["AS_2_router_hostname"]]['bgp_neighbors'].append((first_peer_ip, first_peer_as,True))
+            first_peer.bgp_neighbors.append(BgpNeighbor(second_interface.address, second_peer.as_number, external=True))
+            second_peer.bgp_neighbors.append(BgpNeighbor(first_interface.address, first_peer.as_number, external=True))
         
         if connection["connexion"][0]["type"] == "VPN":
-           vrf_name = connection["connexion"][0]["vrf_name"]
-           rd_number = (len(routers_dict[connection["AS_1_router_hostname"]]["vpns"]) + 1) * 100
-           rt_number = (len(routers_dict[connection["AS_1_router_hostname"]]["vpns"]) + 1) * 1000
-           remote_as = second_peer_as
-           remote_ip = second_peer_ip
-
-           shlag_ip, shlag_mpls, _ = routers_dict[connection["AS_1_router_hostname"]]["interfaces"][connection["AS_1_router_interface"]]
-           routers_dict[connection["AS_1_router_hostname"]]["interfaces"][connection["AS_1_router_interface"]] = (shlag_ip, shlag_mpls, vrf_name)
-
-           routers_dict[connection["AS_1_router_hostname"]]['vpns'].append((vrf_name, rd_number, rt_number, remote_ip, remote_as))
+           connexion = connection["connexion"][0]
+           vrf_name = connexion["vrf_name"]
+           # RD and RT come from the global registry : the same VRF has the same values on every PE
+           topology.vrfs.attach(vrf_name, first_peer.hostname, second_peer.hostname, connexion.get("vrf_role"), connexion.get("vrf_import") or ())
+           exports, imports = topology.vrfs.route_targets(vrf_name, first_peer.hostname)
+
+           first_interface.vrf = vrf_name
+           topology.add_vrf(first_peer, Vrf(vrf_name, topology.vrfs.rd(vrf_name), exports, imports, second_interface.address, second_peer.as_number))
            
-           routers_dict[connection["AS_2_router_hostname"]]['bgp_neighbors'].append((first_peer_ip, first_peer_as, True))
-            
-            
-            
-
-
-def get_routers_dict(data):
-    """Convert the intent file into a super useful dict for our project, very fancy :tm:"""
-    routers = dict()
-    as_subnets = dict()
-    for as_name_string in [key for key, _ in data.items() if "AS_" not in key]: # Find all the AS
-        as_data = data.get(as_name_string, {})[0]
+           second_peer.bgp_neighbors.append(BgpNeighbor(first_interface.address, first_peer.as_number, external=True))
+
+def get_addressing(data, ipam=None):
+    """Creates the routers of the intent file with all their interfaces and addresses, without any BGP session"""
+    as_list = get_as_list(data)
+    if ipam is None:
+        ipam = plan_intent(as_list, data.get("AS_connections", []))
+    topology = Topology(ipam.vrfs)
+    for as_data in as_list: # Find all the AS
         as_number = int(as_data.get("number"))
         is_igp_as = as_data.get("igp", False)
         is_vpn_client=as_data.get("VPN_Client", False)
 
         for router in as_data.get("routers",[]):
-
-            hostname = router.get("hostname")
-            telnet_port = int(router.get("telnet_port"))
-            num_creation = int(router.get("num_creation"))
-            is_border = router.get("is_border")
-            routers[hostname] = {
-                "as_number" : as_number,
-                "is_border" : is_border,
-                "mpls": False, 
-                "igp": is_igp_as,
-                "VPN_Client": is_vpn_client,
-                "num_creation" : num_creation ,
-                "telnet_port" : telnet_port, 
-                "interfaces" : {}, 
-                'bgp_neighbors' : [], 
-                'vpns': []
-            }
+            topology.add_router(Router(
+                router.get("hostname"),
+                as_number,
+                router.get("is_border"),
+                is_igp_as,
+                is_vpn_client,
+                int(router.get("num_creation")),
+                int(router.get("telnet_port")),
+            ))
         
-        as_subnets[as_number] = get_internal_ips(routers, as_data)
-        get_loopback_ips(routers, as_data)
-        get_ibgp_neighbors(routers, as_data)
-    get_external_ips(routers, data, as_subnets)
-    get_ebgp_neighbors(routers, data)
-    return routers
+        get_internal_ips(topology, as_data, ipam)
+        get_loopback_ips(topology, as_data, ipam)
+    get_external_ips(topology, data, ipam)
+    return topology
+
+def get_bgp_neighbors(topology, data):
+    """Adds the iBGP and eBGP sessions (and the VRFs) to an addressed topology"""
+    for as_data in get_as_list(data):
+        get_ibgp_neighbors(topology, as_data)
+    get_ebgp_neighbors(topology, data)
+
+def get_topology(data, ipam=None):
+    """Convert the intent file into the indexed topology model used by the generator"""
+    topology = get_addressing(data, ipam)
+    get_bgp_neighbors(topology, data)
+    return topology
+
+def stream_routers(records, ipam, table=None):
+    """
+    Builds the topology from a stream of intent records and yields every router as soon as its configuration is complete.
+
+    A router only depends on its AS, except the border routers which also wait for their AS connections :
+    the routers of an AS are yielded when the next record closes the AS, the border routers on a "flush"
+    record or at the end of the stream. Yielded routers are dropped from the topology, so the memory only
+    grows with the open AS and the border routers still waiting.
+
+    :param records: Générateur de (type, record), voir intent_loader.iter_intent_records
+    :param ipam: Ipam vide, les blocs sont alloués au fil du stream
+    :param table: Table d'allocation précédente (voir load_allocation_table)
+    :return: Générateur de Router
+    """
+    table = table or {}
+    ipam.vrfs.hold(table.get("vrfs"))
+    topology = Topology(ipam.vrfs)
+    closed_as = set()
+    as_data = None
+
+    def close_as():
+        as_number = int(as_data["number"])
+        for internal in as_data["internal_connections"]:
+            ipam.links[as_number].allocate(link_key(internal["first_peer_hostname"], internal["first_peer_interface"],
+                                                    internal["second_peer_hostname"], internal["second_peer_interface"]))
+        for router in as_data["routers"]:
+            ipam.loopbacks[as_number].allocate(router["hostname"])
+        get_internal_ips(topology, as_data, ipam)
+        get_loopback_ips(topology, as_data, ipam)
+        get_ibgp_neighbors(topology, as_data)
+        closed_as.add(as_number)
+        ready = [router for router in topology.routers_by_as.get(as_number, []) if not router.is_border]
+        topology.remove_routers(ready)
+        return ready
+
+    for kind, record in records:
+        if kind in ("AS", "AS_connection", "flush") and as_data is not None:
+            yield from close_as()
+            as_data = None
+
+        if kind == "AS":
+            as_number = int(record["number"])
+            if as_number in closed_as : raise Exception(f'Intent file error : AS {as_number} is given twice in the stream')
+            try:
+                ipam.add_as(as_number, record.get("IPv4_prefix"), record.get("IPv4_mask"), table.get(str(as_number), {}))
+            except (ValueError, AttributeError) as e:
+                raise IpamError(f'Intent file error : invalid IPv4 prefix for AS {as_number} ({e})')
+            errors = ipam.check_overlap(as_number)
+            if errors : raise IpamError("\n".join(errors))
+            as_data = dict(record, routers=[], internal_connections=[])
+        elif kind in ("router", "internal_connection"):
+            if as_data is None : raise Exception(f'Intent file error : {kind} {record} is not preceded by its AS in the stream')
+            if kind == "router":
+                if record.get("hostname") in topology.routers : raise Exception(f'Intent file error : router {record.get("hostname")} is given twice in the stream')
+                as_data["routers"].append(record)
+                topology.add_router(Router(
+                    record.get("hostname"),
+                    int(as_data["number"]),
+                    record.get("is_border"),
+                    as_data.get("igp", False),
+                    as_data.get("VPN_Client", False),
+                    int(record.get("num_creation")),
+                    int(record.get("telnet_port")),
+                ))
+            else:
+                as_data["internal_connections"].append(record)
+        elif kind == "AS_connection":
+            for side in ("AS_1", "AS_2"):
+                hostname = record[f"{side}_router_hostname"]
+                if int(record[side]) not in closed_as : raise Exception(f'Intent file error : AS connection of {hostname} is given before AS {record[side]}')
+                if hostname not in topology.routers : raise Exception(f'Intent file error : AS connection of {hostname} : unknown router, or not a border router waiting for its AS connections')
+            ipam.links[max(int(record["AS_1"]), int(record["AS_2"]))].allocate(
+                link_key(record["AS_1_router_hostname"], record["AS_1_router_interface"], record["AS_2_router_hostname"], record["AS_2_router_interface"]))
+            get_external_ips(topology, {"AS_connections": [record]}, ipam)
+            get_ebgp_neighbors(topology, {"AS_connections": [record]})
+
+        if kind == "flush":
+            ready = list(topology)
+            topology.remove_routers(ready)
+            yield from ready
+
+    if as_data is not None:
+        yield from close_as()
+    yield from topology
 
 #START OF CONFIG
-def generate_base_cisco_config(hostname, mpls, vrfs):
+def generate_base_cisco_config(hostname, mpls, vrfs, role=None):
     """
     Génère une configuration de base pour un routeur Cisco.
 
     :param hostname: Nom d'hôte du routeur (hostname)
+    :param vrfs: Liste des Vrf du routeur
+    :param role: Rôle du routeur (PE, P ou CE) pour le choix des templates
     :return: Chaîne de texte représentant la configuration de base
     """
     config = []
     
     # Configuration de base
-    config.append("service timestamps debug datetime msec")
-    config.append("service timestamps log datetime msec")
-    config.append("!")
-    config.append(f"hostname {hostname}")
-    config.append("!")
+    config.append(render(role, "header", hostname=hostname))
+    defined = set()
     for vrf in vrfs:
-        config.append(f"ip vrf {vrf[0]}")
-        config.append(f" rd {vrf[1]}:{vrf[1]}")
-        config.append(f" route-target export {vrf[2]}:{vrf[2]}")
-        config.append(f" route-target import {vrf[2]}:{vrf[2]}")
-        config.append("!")
-    config.append("!")
-    if mpls == True:
-        config.append("mpls label protocol ldp\nmultilink bundle-name authenticated\n!")
+        # A PE with several CEs in the same VRF defines it once
+        if vrf.name in defined : continue
+        defined.add(vrf.name)
+        config.append(render(role, "vrf_definition", name=vrf.name, rd=vrf.rd))
+        for rt in vrf.exports:
+            config.append(render(role, "vrf_route_target", direction="export", rt=rt))
+        for rt in vrf.imports:
+            config.append(render(role, "vrf_route_target", direction="import", rt=rt))
+        config.append(render(role, "vrf_end"))
+    config.append(render(role, "header_end", mpls=mpls))
     return "\n".join(config)
 
-def config_interfaces(valeurs, num_as, igp):
+def config_interfaces(valeurs, num_as, igp, role=None):
     """
     Génère une configuration pour les interfaces d'un routeur.
 
-    :param valeurs: Dictionnaire des interfaces avec leurs adresses IP
+    :param valeurs: Dictionnaire {nom: Interface} du routeur
+    :param role: Rôle du routeur (PE, P ou CE) pour le choix des templates
     :return: Chaîne de texte représentant la configuration des interfaces
     """
     config = []
     
     # Configuration des interfaces
-    for interface, values_interface in valeurs.items():
-        config.append(f"interface {interface}")
-        if values_interface[2]:
-            config.append(f" ip vrf forwarding {values_interface[2]}")
-        elif igp:
-            config.append (f" ip ospf {num_as} area 0")
-        config.append(f" ip address {values_interface[0]}")
-        config.append (" negotiation auto")
-        if values_interface[1]:
-            config.append (" mpls ip")
-        config.append("!")
-
-
+    for interface in valeurs.values():
+        config.append(render(role, "interface",
+            name=interface.name,
+            vrf=interface.vrf,
+            ospf_as=num_as if igp and not interface.vrf else None,
+            ip=interface.ip,
+            netmask=interface.netmask,
+            mpls=interface.mpls,
+        ))
     return "\n".join(config)
 
-def bgp_add(bgp_config, num, num_as, VPN_Client):
+def bgp_add(bgp_config, num, num_as, VPN_Client, cluster_id=None, role=None):
     """
     Génère la configuration BGP pour un routeur Cisco.
 
-    :param bgp_config: Dictionnaire contenant les informations BGP (AS et voisins)
+    :param bgp_config: Liste des BgpNeighbor du routeur
     :param num: Numéro du routeur (extrait du nom du routeur)
+    :param cluster_id: Cluster-id si le routeur est route reflector
+    :param role: Rôle du routeur (PE, P ou CE) pour le choix des templates
     :return: Chaîne de texte représentant la configuration BGP
     """
+    # A VPN client only keeps its sessions with the provider
+    neighbors = [neighbor for neighbor in bgp_config if not VPN_Client or neighbor.remote_as != num_as]
     config = []
     # Configuration du BGP
-    config.append(f"router bgp {num_as}")
-    config.append(f" bgp router-id {num}.{num}.{num}.{num}")
-    config.append(" bgp log-neighbor-changes")
-    for neighbor in bgp_config:
-        if VPN_Client and neighbor[1] != num_as:
-            config.append(f" neighbor {neighbor[0]} remote-as {neighbor[1]}")
-        elif not VPN_Client:
-            config.append(f" neighbor {neighbor[0]} remote-as {neighbor[1]}")
-            if neighbor[1] == num_as:
-                config.append(f" neighbor {neighbor[0]} update-source Loopback0")
-    config.append(" !\n address-family ipv4")
-    if VPN_Client:
-        config.append("  redistribute connected")
-    for neighbor in bgp_config:
-        if VPN_Client and neighbor[1] != num_as:
-            config.append(f"  neighbor {neighbor[0]} activate")
-            config.append(f"  neighbor {neighbor[0]} allowas-in")
-        elif not VPN_Client:
-            config.append(f"  neighbor {neighbor[0]} activate")
-    config.append(" exit-address-family")
-    config.append("!")
+    config.append(render(role, "bgp_header", as_number=num_as, router_id=f"{num}.{num}.{num}.{num}", cluster_id=cluster_id))
+    for neighbor in neighbors:
+        config.append(render(role, "bgp_neighbor", ip=neighbor.ip, remote_as=neighbor.remote_as, internal=not VPN_Client and neighbor.remote_as == num_as))
+    config.append(render(role, "ipv4_header", redistribute=VPN_Client))
+    for neighbor in neighbors:
+        config.append(render(role, "ipv4_neighbor", ip=neighbor.ip, allowas_in=VPN_Client, rr_client=not VPN_Client and neighbor.rr_client))
+    config.append(render(role, "af_end"))
     return "\n".join(config)
 
-def add_protocol(num, num_as, igp):
-    config = []
+def add_protocol(num, num_as, igp, role=None):
     if igp:
-        config.append(f"router ospf {num_as}")
-        config.append(f" router-id {num}.{num}.{num}.{num}")
-        config.append(" redistribute connected")
-        config.append("!")
-        return "\n".join(config)
+        return render(role, "ospf", as_number=num_as, router_id=f"{num}.{num}.{num}.{num}")
     else:
-        return "!"
+        return render(role, "no_igp")
 
-def add_vpnv4(hostname, as_num, router_infos):
+def add_vpnv4(vpnv4_neighbors, role=None):
     config = []
-    border_routers_ips = []
-    for host, router in router_infos.items():
-        if router["as_number"] == as_num and router["is_border"] == True and host != hostname:
-            border_routers_ips.append(router["interfaces"]["Loopback0"][0].split(' ')[0])
-    
-    config.append(" address-family vpnv4")
-    for router in border_routers_ips:
-        config.append(f"  neighbor {router} activate")
-        config.append(f"  neighbor {router} send-community both")
-    config.append(" exit-address-family")
-    config.append("!")
+    config.append(render(role, "vpnv4_header"))
+    for neighbor in vpnv4_neighbors:
+        config.append(render(role, "vpnv4_neighbor", ip=neighbor.ip, rr_client=neighbor.rr_client))
+    config.append(render(role, "af_end"))
     return "\n".join(config)
 
 
-def add_vrf(vpn):
+def add_vrf(vpn, role=None):
     config = []
     
     for vrf in vpn:
-        config.append(f" address-family ipv4 vrf {vrf[0]}")
-        config.append("  redistribute connected")
-        config.append(f"  neighbor {vrf[3]} remote-as {vrf[4]}")
-        config.append(f"  neighbor {vrf[3]} activate")
-        config.append(" exit-address-family")
-        config.append("!")
+        config.append(render(role, "vrf_af", name=vrf.name, ip=int_to_ip(vrf.remote_ip), remote_as=vrf.remote_as))
     return "\n".join(config)
 
-def generate_config_file(router, info, router_infos):
-    num_as = info["as_number"]
-    num_creat = info["num_creation"]
-    file_name = f"i{num_creat}_startup-config.cfg"
-    with open(file_name, 'w') as file:
-        file.write(generate_base_cisco_config(router, info["mpls"], info["vpns"]))
-        file.write("\n" + config_interfaces(info["interfaces"], num_as, info["igp"]))
-        file.write("\n" + add_protocol(num_creat, num_as, info["igp"]))
-        file.write("\n" + bgp_add(info["bgp_neighbors"], num_creat, num_as, info["VPN_Client"]))
-        if info["vpns"]:
-            file.write("\n" + add_vpnv4(router, num_as, router_infos))
-            file.write("\n" + add_vrf(info["vpns"]))
-
-    print(f"Configuration pour le router {router} terminée")
+def config_file_name(router):
+    return f"i{router.num_creation}_startup-config.cfg"
+
+def render_config(router):
+    """Returns the full startup-config of a router"""
+    num_as = router.as_number
+    num_creat = router.num_creation
+    role = router.role
+    sections = [
+        generate_base_cisco_config(router.hostname, router.mpls, router.vpns, role),
+        config_interfaces(router.interfaces, num_as, router.igp, role),
+        add_protocol(num_creat, num_as, router.igp, role),
+        bgp_add(router.bgp_neighbors, num_creat, num_as, router.vpn_client, router.cluster_id, role),
+    ]
+    if router.vpns or router.route_reflector:
+        sections.append(add_vpnv4(router.vpnv4_neighbors, role))
+    if router.vpns:
+        sections.append(add_vrf(router.vpns, role))
+    return "\n".join(sections)
+
+# Read-only topology shared with the render worker processes
+_render_snapshot = None
+
+def _init_render_worker(topology, template_dir=None):
+    global _render_snapshot
+    _render_snapshot = topology
+    if templates.engine.template_dir != template_dir:
+        templates.load_templates(template_dir)
+
+def _timed_render(router):
+    """Renders a router, with its (start, cpu time, allocated blocks, pid) for the profiler"""
+    allocations = sys.getallocatedblocks()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    config = render_config(router)
+    elapsed = time.perf_counter() - start
+    return config, elapsed, (start, time.process_time() - cpu, sys.getallocatedblocks() - allocations, os.getpid())
+
+def _record_render(hostname, elapsed, measures):
+    start, cpu, allocations, pid = measures
+    profiler.record(f"render {hostname}", "router", start, elapsed, cpu, allocations, pid, pid)
+
+def _render_chunk(hostnames):
+    return [(hostname, *_timed_render(_render_snapshot[hostname])) for hostname in hostnames]
+
+def _render_routers(routers):
+    return [_timed_render(router) for router in routers]
+
+def render_stream(routers, jobs=1, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Renders routers as they come from a generator, over a pool of jobs processes.
+
+    :param routers: Itérable de Router, voir stream_routers
+    :param jobs: Nombre de processus, 0 pour utiliser tous les coeurs
+    :return: Générateur de (Router, configuration, durée du rendu), dans l'ordre des routers
+    """
+    jobs = jobs or os.cpu_count()
+    if jobs <= 1:
+        for router in routers:
+            config, elapsed, measures = _timed_render(router)
+            _record_render(router.hostname, elapsed, measures)
+            yield router, config, elapsed
+        return
+
+    routers = iter(routers)
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    with ProcessPoolExecutor(jobs, mp_context=context, initializer=_init_render_worker, initargs=(None, templates.engine.template_dir)) as pool:
+        # Only a few chunks are in flight, the stream is not read ahead of the workers
+        pending = deque()
+        while True:
+            chunk = list(islice(routers, chunk_size))
+            if chunk:
+                pending.append((chunk, pool.submit(_render_routers, chunk)))
+            if pending and (not chunk or len(pending) >= jobs * 2):
+                chunk_routers, future = pending.popleft()
+                for router, (config, elapsed, measures) in zip(chunk_routers, future.result()):
+                    _record_render(router.hostname, elapsed, measures)
+                    yield router, config, elapsed
+            elif not chunk:
+                return
+
+def render_configs(topology, hostnames, jobs=1):
+    """
+    Renders the configuration of the given routers, over a pool of jobs processes.
+
+    :param hostnames: Routeurs à générer
+    :param jobs: Nombre de processus, 0 pour utiliser tous les coeurs
+    :return: Dictionnaire {hostname: (configuration, durée du rendu)} dans l'ordre de l'intent file
+    """
+    wanted = set(hostnames)
+    ordered = [hostname for hostname in topology.routers if hostname in wanted]
+    jobs = jobs or os.cpu_count()
+    if jobs <= 1 or len(ordered) < 2:
+        _init_render_worker(topology, templates.engine.template_dir)
+        results = _render_chunk(ordered)
+    else:
+        chunk_size = max(1, len(ordered) // (jobs * 4))
+        chunks = [ordered[i:i + chunk_size] for i in range(0, len(ordered), chunk_size)]
+        # fork shares the topology with the workers instead of pickling it
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(jobs, mp_context=context, initializer=_init_render_worker, initargs=(topology, templates.engine.template_dir)) as pool:
+            results = [result for chunk in pool.map(_render_chunk, chunks) for result in chunk]
+    for hostname, config, elapsed, measures in results:
+        _record_render(hostname, elapsed, measures)
+    return {hostname: (config, elapsed) for hostname, config, elapsed, measures in results}
+
+def write_config_files(topology, rendered, configs=None, output_dir=".", verbose=True):
+    """
+    Writes every rendered configuration to its file, each file in a single write.
+
+    :param rendered: Résultat de render_configs
+    :param configs: Dictionnaire {hostname: {"file": chemin, "hash": hash}} du manifest, mis à jour.
+                    Si donné, seuls les fichiers dont le contenu a changé sont réécrits
+    :param output_dir: Répertoire des fichiers de configuration
+    :param verbose: Affiche une ligne par routeur écrit
+    :return: Liste des routeurs dont le fichier a été écrit
+    """
+    written = []
+    for hostname, (config, elapsed) in rendered.items():
+        file_name = config_file_name(topology[hostname])
+        path = os.path.join(output_dir, file_name)
+        if configs is not None:
+            entry = {"file": file_name, "hash": content_hash(config)}
+            if configs.get(hostname) == entry and os.path.exists(path):
+                continue
+            configs[hostname] = entry
+        with profiler.phase(f"write {hostname}", "router"), open(path, 'w') as file:
+            file.write(config)
+        written.append(hostname)
+        if verbose:
+            print(f"Configuration pour le router {hostname} terminée ({elapsed * 1000:.2f} ms)")
+    return written
+
+def write_config_stream(rendered):
+    """Writes each configuration of render_stream as soon as it is rendered, returns the (hostname, port, file) of every router"""
+    targets = []
+    for router, config, elapsed in rendered:
+        file_name = config_file_name(router)
+        with profiler.phase(f"write {router.hostname}", "router"), open(file_name, 'w') as file:
+            file.write(config)
+        targets.append((router.hostname, router.telnet_port, file_name))
+        print(f"Configuration pour le router {router.hostname} terminée ({elapsed * 1000:.2f} ms)")
+    return targets
+
+def generator_fingerprint():
+    """Hash of the rendering modules and of the templates in use, stored in the manifest of --incremental"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    hashes = [file_hash(os.path.join(directory, f"{name}.py")) for name in RENDERING_MODULES]
+    return content_hash("".join(hashes) + templates.engine.fingerprint)
+
 # END OF CONFIG
 
 
 
-if __name__ == "__main__":
-        args = argument_parser()
-        data = load_intent_file(args.filename)
-        routers_info = get_routers_dict(data)
-        pprint(routers_info)
-        for router, info in routers_info.items():
-            generate_config_file(router, info, routers_info)
-        if args.copy_config :
-            configurator = FileDispatcher(args.copy_config)
+# WATCH MODE
+def deploy_options(args, topology=None, data=None):
+    """Options of deploy_configs : bulk mode, deployment waves (when the topology is known) and per AS cap"""
+    options = {"bulk": args.bulk, "bulk_command": args.bulk_command, "server_host": args.server_bind,
+               "server_port": args.server_port, "advertised_host": args.server_address,
+               "per_as_concurrency": args.per_as_concurrency}
+    if topology is not None:
+        options["as_numbers"] = {router.hostname: router.as_number for router in topology}
+        if not args.no_waves:
+            graph = build_graph(intent_links(get_as_list(data), data.get("AS_connections")))
+            options["waves"] = deployment_waves({router.hostname: router.role for router in topology}, graph)
+    return options
+
+def write_telemetry(args, results):
+    """Writes the JSON report and the Prometheus textfile of a deployment, if asked"""
+    if args.deploy_report:
+        telemetry.write_deploy_report(args.deploy_report, results, args.bulk or "line")
+    if args.metrics:
+        telemetry.write_prometheus_textfile(args.metrics, results, args.bulk or "line")
+
+def watch_intent(args):
+    """
+    Regenerates the configurations every time the intent file changes, without leaving the process.
+
+    The templates and their render cache, the allocation table and the manifest stay in memory :
+    each change only renders the affected routers again, only rewrites the files whose content
+    changed, and only copies (-c) or pushes (-t) these routers.
+    """
+    watcher = file_watcher(args.filename, args.polling, args.poll_interval)
+    manifest = load_manifest(args.manifest) if args.incremental else {}
+    table = load_allocation_table(args.ipam_table)
+    generator = generator_fingerprint()
+    print(f"Surveillance de {args.filename} ({type(watcher).__name__}), Ctrl+C pour arrêter")
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                data = validate_intent(load_intent_file(args.filename, cache_dir=None))
+                as_list = get_as_list(data)
+                ipam = plan_intent(as_list, data.get("AS_connections", []), table)
+                topology = get_topology(data, ipam)
+            except Exception as e:
+                # A half-edited intent must not stop the watch
+                print(f"{e}\nEn attente d'une modification de {args.filename}...")
+                watcher.wait()
+                continue
+            table = ipam.table()
+            save_allocation_table(args.ipam_table, ipam)
+
+            fingerprints = intent_fingerprints(as_list, data.get("AS_connections", []), generator)
+            hostnames = affected_routers(manifest, fingerprints, topology)
+            configs = {hostname: entry for hostname, entry in manifest.get("configs", {}).items() if hostname in topology.routers}
+            written = write_config_files(topology, render_configs(topology, hostnames, args.jobs), configs)
+            manifest = build_manifest(fingerprints, configs)
+            if args.incremental:
+                save_manifest(args.manifest, fingerprints, configs)
+            print(f"{len(hostnames)}/{len(topology)} routeurs régénérés, {len(written)} fichiers modifiés en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+            if written and args.copy_config:
+                FileDispatcher(args.copy_config, quiet=args.quiet, dry_run=args.dry_run).copy_configs()
+            if written and args.telnet:
+                targets = [(hostname, topology[hostname].telnet_port, config_file_name(topology[hostname])) for hostname in written]
+                results = deploy_configs(targets, args.telnet_host, args.concurrency, args.timeout, args.retries, delta=args.delta, **deploy_options(args, topology, data))
+                write_telemetry(args, results)
+                print(f"Telnet : {sum(result.ok for result in results)}/{len(results)} routeurs configurés")
+            if written and args.verify:
+                print_convergence_report(verify_convergence(topology, args.telnet_host, args.concurrency, args.timeout, args.verify_timeout))
+            if written and (args.copy_config or args.telnet):
+                print(f"Modification déployée en {(time.perf_counter() - start) * 1000:.1f} ms")
+            watcher.wait()
+    except KeyboardInterrupt:
+        print("\nFin de la surveillance")
+    finally:
+        watcher.close()
+
+
+def main(args):
+    if args.bulk and args.delta : raise SystemExit("--bulk loads whole configurations and cannot be used with --delta")
+    if args.bulk == "tftp" and args.server_port not in (None, TFTP_PORT):
+        print(f"Attention : les URL tftp:// d'IOS n'acceptent en général pas de port, --server_port {args.server_port} ne convient qu'à fake_ios.py")
+    if args.jobs is None:
+        args.jobs = 0 if args.drift else 1
+    with profiler.phase("templates"):
+        templates.load_templates(args.templates)
+    if args.watch:
+        if args.stream : raise SystemExit("--watch keeps the whole model in memory and cannot be used with --stream")
+        watch_intent(args)
+        return
+    if args.stream:
+        if args.incremental : raise SystemExit("--incremental needs the whole intent file and cannot be used with --stream")
+        if args.verify : raise SystemExit("--verify needs the whole model and cannot be used with --stream")
+        start = time.perf_counter()
+        ipam = Ipam()
+        with profiler.phase("stream"):
+            targets = write_config_stream(render_stream(stream_routers(iter_intent_records(args.filename), ipam, load_allocation_table(args.ipam_table)), args.jobs))
+            save_allocation_table(args.ipam_table, ipam)
+        topology = data = None  # the routers are not kept, no deployment waves
+        print(f"{len(targets)} configurations générées et écrites en {time.perf_counter() - start:.3f} s")
+    else:
+        with profiler.phase("load"):
+            data = load_intent_file(args.filename, cache_dir=None if args.no_cache else CACHE_DIR)
+        with profiler.phase("validation"):
+            # Every error of the intent is reported before anything is written
+            try:
+                validate_intent(data)
+            except IntentValidationError as e:
+                raise SystemExit(f"{len(e.errors)} erreur(s) dans {args.filename} :\n{e}")
+            as_list = get_as_list(data)
+        with profiler.phase("addressing"):
+            ipam = plan_intent(as_list, data.get("AS_connections", []), load_allocation_table(args.ipam_table))
+            topology = get_addressing(data, ipam)
+            if not args.drift:  # --drift writes nothing, not even the allocation table
+                save_allocation_table(args.ipam_table, ipam)
+        with profiler.phase("neighbors"):
+            get_bgp_neighbors(topology, data)
+        if args.drift:
+            rendered = render_configs(topology, topology.routers, args.jobs)
+            expected = {topology[hostname].num_creation: config for hostname, (config, _) in rendered.items()}
+            gns3_configs = FileDispatcher(args.drift, quiet=True, dry_run=True).find_gns3_config_files(args.drift)
+            report = detect_drift(expected, gns3_configs, args.jobs)
+            drifted = print_drift_report(report, {router.num_creation: router.hostname for router in topology})
+            raise SystemExit(1 if drifted else 0)
+        start = time.perf_counter()
+        if args.incremental:
+            with profiler.phase("incremental"):
+                manifest = load_manifest(args.manifest)
+                fingerprints = intent_fingerprints(as_list, data.get("AS_connections", []), generator_fingerprint())
+                configs = {hostname: entry for hostname, entry in manifest.get("configs", {}).items() if hostname in topology.routers}
+                hostnames = affected_routers(manifest, fingerprints, topology)
+            print(f"{len(hostnames)}/{len(topology)} routeurs concernés par la modification de l'intent file")
+        else:
+            if args.verbose:
+                pprint(topology.routers)
+            configs = None
+            hostnames = topology.routers
+        with profiler.phase("rendering", jobs=args.jobs):
+            rendered = render_configs(topology, hostnames, args.jobs)
+        render_time = time.perf_counter() - start
+        with profiler.phase("write"):
+            written = write_config_files(topology, rendered, configs)
+            if args.incremental:
+                save_manifest(args.manifest, fingerprints, configs)
+        print(f"{len(rendered)} configurations générées en {render_time:.3f} s, {len(written)} fichiers écrits en {time.perf_counter() - start - render_time:.3f} s")
+        targets = [(router.hostname, router.telnet_port, config_file_name(router)) for router in topology]
+    if args.copy_config :
+        with profiler.phase("dispatch"):
+            configurator = FileDispatcher(args.copy_config, quiet=args.quiet, dry_run=args.dry_run)
             configurator.copy_configs()
-            #pour faire marcher le filedispatcher : après le lancement du code rajotuer -c "directory de tous les routers"
+        #pour faire marcher le filedispatcher : après le lancement du code rajotuer -c "directory de tous les routers"
+    if args.telnet :
+        with profiler.phase("telnet", concurrency=args.concurrency):
+            results = deploy_configs(targets, args.telnet_host, args.concurrency, args.timeout, args.retries, delta=args.delta, **deploy_options(args, topology, data))
+        write_telemetry(args, results)
+        print(f"Telnet : {sum(result.ok for result in results)}/{len(results)} routeurs configurés")
+    converged = True
+    if args.verify:
+        with profiler.phase("verify", concurrency=args.concurrency):
+            converged = print_convergence_report(verify_convergence(topology, args.telnet_host, args.concurrency, args.timeout, args.verify_timeout))
+    if not converged:
+        raise SystemExit(1)
+
 
+if __name__ == "__main__":
+        args = argument_parser()
+        # The trace is written even when main exits early (--drift, --watch, failed convergence)
+        with profiler.profiling(args.profile):
+            main(args)
@@ -0,0 +1,130 @@
+"""Profiling of the generator phases, enabled with --profile.
+
+Phases (load, addressing, rendering, dispatch, telnet...) and per router work
+are recorded as spans with their wall time, CPU time and allocation count (net
+number of memory blocks allocated, from sys.getallocatedblocks, which costs
+nothing unlike tracemalloc). The spans are written as a Chrome trace JSON file,
+readable with chrome://tracing or https://ui.perfetto.dev, and summed up in a
+table. When profiling is disabled, phase() is a shared no-op context manager.
+"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+DEFAULT_TRACE_FILE = "nas_profile.json"
+TOP_ROUTERS = 10
+
+
+class Span:
+    __slots__ = ("name", "category", "start", "wall", "cpu", "allocations", "pid", "tid", "args")
+
+    def __init__(self, name, category, start, wall, cpu=None, allocations=None, pid=None, tid=None, args=None):
+        self.name = name
+        self.category = category
+        self.start = start              # time.perf_counter() at the start
+        self.wall = wall                # seconds
+        self.cpu = cpu                  # seconds, None when unknown (asyncio tasks)
+        self.allocations = allocations  # net allocated blocks, None when unknown
+        self.pid = pid or os.getpid()
+        self.tid = tid or threading.get_ident()
+        self.args = args or {}
+
+
+class Profiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.spans = []  # list.append is atomic, spans can be recorded from threads
+
+    @contextlib.contextmanager
+    def _phase(self, name, category, args):
+        allocations = sys.getallocatedblocks()
+        cpu = time.thread_time() if category == "router" else time.process_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = (time.thread_time() if category == "router" else time.process_time()) - cpu
+            self.spans.append(Span(name, category, start, wall, cpu, sys.getallocatedblocks() - allocations, args=args))
+
+    def phase(self, name, category="phase", **args):
+        """Context manager recording a span, category is "phase" for the pipeline steps and "router" for per router work"""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._phase(name, category, args)
+
+    def record(self, name, category, start, wall, cpu=None, allocations=None, pid=None, tid=None, **args):
+        """Records a span measured elsewhere (render processes, telnet tasks)"""
+        if self.enabled:
+            self.spans.append(Span(name, category, start, wall, cpu, allocations, pid, tid, args))
+
+    def trace(self):
+        """Returns the spans in the Chrome trace event format"""
+        events = []
+        for pid in sorted({span.pid for span in self.spans}):
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+                           "args": {"name": "nas_config_generator" if pid == os.getpid() else f"worker {pid}"}})
+        for span in self.spans:
+            args = dict(span.args)
+            if span.cpu is not None:
+                args["cpu_ms"] = round(span.cpu * 1000, 3)
+            if span.allocations is not None:
+                args["allocations"] = span.allocations
+            events.append({"name": span.name, "cat": span.category, "ph": "X", "pid": span.pid, "tid": span.tid,
+                           "ts": round((span.start - self.origin) * 1e6, 1), "dur": round(span.wall * 1e6, 1), "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as trace_file:
+            json.dump(self.trace(), trace_file)
+        os.replace(tmp_path, path)
+
+    def summary(self, top=TOP_ROUTERS):
+        """Returns the table of the phases and of the slowest per router spans"""
+        lines = [f"{'phase':<28}{'wall (ms)':>11}{'cpu (ms)':>11}{'allocs':>11}"]
+        for span in sorted(self.spans, key=lambda span: span.start):
+            if span.category != "phase" : continue
+            lines.append(f"{span.name:<28}{span.wall * 1000:>11.2f}{span.cpu * 1000:>11.2f}{span.allocations:>11}")
+
+        routers = [span for span in self.spans if span.category == "router"]
+        if routers:
+            lines.append("")
+            lines.append(f"{len(routers)} opérations par routeur, les {min(top, len(routers))} plus longues :")
+            for span in sorted(routers, key=lambda span: span.wall, reverse=True)[:top]:
+                cpu = "-" if span.cpu is None else f"{span.cpu * 1000:.2f}"
+                allocations = "-" if span.allocations is None else span.allocations
+                lines.append(f"{span.name:<28}{span.wall * 1000:>11.2f}{cpu:>11}{allocations:>11}")
+        return "\n".join(lines)
+
+
+# Profiler of the running command, disabled unless enable() is called
+active = Profiler()
+
+def enable():
+    global active
+    active = Profiler(enabled=True)
+    return active
+
+def phase(name, category="phase", **args):
+    return active.phase(name, category, **args)
+
+def record(name, category, start, wall, cpu=None, allocations=None, pid=None, tid=None, **args):
+    active.record(name, category, start, wall, cpu, allocations, pid, tid, **args)
+
+@contextlib.contextmanager
+def profiling(path=None):
+    """Profiles the enclosed code when path is given, and writes its trace there however the code exits"""
+    if not path:
+        yield active
+        return
+    profiler = enable()
+    try:
+        yield profiler
+    finally:
+        profiler.write_trace(path)
+        print(f"\n{profiler.summary()}\nTrace enregistrée dans {path} (chrome://tracing ou ui.perfetto.dev)")
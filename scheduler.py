@@ -0,0 +1,67 @@
+"""Order of the telnet deployment, derived from the topology.
+
+Pushing every router at once makes the PEs and CEs come up before the core
+they depend on (OSPF, LDP, iBGP through the P routers), and the network
+reconverges several times. The routers are instead deployed in waves : the P
+routers of the core, then the PEs, then the CEs, each wave starting when the
+previous one is done. Inside a wave every router is pushed in parallel, the
+ones closest to the core first (breadth first distance in the graph of the
+internal and AS connections), and the number of routers of the same AS
+configured at the same time can be capped.
+"""
+from collections import deque
+
+WAVES = ("P", "PE", "CE")
+
+
+def intent_links(as_list, as_connections):
+    """Yields (hostname, hostname) for every internal and AS connection of the intent file"""
+    for as_data in as_list:
+        for internal in as_data.get("internal_connections") or []:
+            yield internal["first_peer_hostname"], internal["second_peer_hostname"]
+    for connection in as_connections or []:
+        yield connection["AS_1_router_hostname"], connection["AS_2_router_hostname"]
+
+def build_graph(links):
+    """Adjacency sets of the routers, from (hostname, hostname) pairs"""
+    graph = {}
+    for first, second in links:
+        graph.setdefault(first, set()).add(second)
+        graph.setdefault(second, set()).add(first)
+    return graph
+
+def core_distances(graph, core):
+    """Breadth first distance of every router to the closest router of core"""
+    distances = dict.fromkeys(core, 0)
+    queue = deque(core)
+    while queue:
+        hostname = queue.popleft()
+        for neighbor in graph.get(hostname, ()):
+            if neighbor not in distances:
+                distances[neighbor] = distances[hostname] + 1
+                queue.append(neighbor)
+    return distances
+
+def border_roles(hostnames, as_connections):
+    """Roles of routers without a role of their own (generate_conf.py) : border routers are PEs, the others P routers"""
+    border = {connection[f"{side}_router_hostname"] for connection in as_connections or [] for side in ("AS_1", "AS_2")}
+    return {hostname: "PE" if hostname in border else "P" for hostname in hostnames}
+
+def deployment_waves(roles, graph):
+    """
+    Splits the routers to deploy in waves.
+
+    :param roles: Dictionnaire {hostname: "P", "PE" ou "CE"}, dans l'ordre de déploiement par défaut
+    :param graph: Adjacence des routeurs, voir build_graph
+    :return: Liste de vagues non vides, chacune étant une liste de hostnames triée par distance au coeur
+    """
+    core = [hostname for hostname, role in roles.items() if role == "P"]
+    # Without a P router, the distances are measured from the PEs
+    distances = core_distances(graph, core or [hostname for hostname, role in roles.items() if role == "PE"])
+    order = {hostname: index for index, hostname in enumerate(roles)}
+    waves = []
+    for wave in WAVES:
+        hostnames = [hostname for hostname, role in roles.items() if role == wave]
+        if hostnames:
+            waves.append(sorted(hostnames, key=lambda hostname: (distances.get(hostname, len(graph) + 1), order[hostname])))
+    return waves
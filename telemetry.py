@@ -0,0 +1,120 @@
+"""Metrics of the telnet deployments.
+
+Every DeployResult of a deployment (connect time, duration, lines and bytes
+sent, commands rejected by IOS, attempts) is written as a JSON report, and as a
+Prometheus textfile for the node_exporter textfile collector, so slow consoles
+and deploy time regressions show up on a dashboard as the topologies grow.
+"""
+import json
+import os
+import time
+
+DEFAULT_REPORT_FILE = "deploy_report.json"
+DEFAULT_METRICS_FILE = "nas_deploy.prom"
+METRIC_PREFIX = "nas_deploy"
+
+# name, help, value of a DeployResult
+ROUTER_METRICS = (
+    ("success", "1 if the configuration of the router was deployed", lambda result: int(result.ok)),
+    ("connect_seconds", "Time to open the console of the router, last attempt", lambda result: result.connect_time),
+    ("duration_seconds", "Time to deploy the router, retries included", lambda result: result.duration),
+    ("lines_sent", "Configuration lines delivered to the router", lambda result: result.lines_sent),
+    ("bytes_sent", "Bytes sent on the console of the router", lambda result: result.bytes_sent),
+    ("config_bytes", "Size of the configuration delivered to the router", lambda result: result.config_bytes),
+    ("lines_per_second", "Configuration lines delivered per second", lambda result: lines_per_second(result)),
+    ("ios_errors", "Commands rejected by IOS", lambda result: len(result.ios_errors)),
+    ("attempts", "Connection attempts, 1 without retry", lambda result: result.attempts),
+)
+
+
+def lines_per_second(result):
+    return result.lines_sent / result.duration if result.duration else 0.0
+
+def deploy_window(results):
+    """Returns (start, duration) of the whole deployment, from the first router started to the last one done"""
+    if not results:
+        return None, 0.0
+    start = min(result.start for result in results)
+    return start, max(result.start + result.duration for result in results) - start
+
+def deploy_report(results, mode="line"):
+    """
+    Returns the report of a deployment as a dictionary.
+
+    :param results: Liste de DeployResult, voir telnet.deploy_configs
+    :param mode: Mode de déploiement ("line", "http" ou "tftp")
+    :return: Dictionnaire sérialisable en JSON
+    """
+    _, duration = deploy_window(results)
+    lines = sum(result.lines_sent for result in results)
+    return {
+        "timestamp": time.time(),
+        "mode": mode,
+        "routers": len(results),
+        "succeeded": sum(result.ok for result in results),
+        "failed": sum(not result.ok for result in results),
+        "retried": sum(result.attempts > 1 for result in results),
+        "duration_seconds": duration,
+        "lines_sent": lines,
+        "bytes_sent": sum(result.bytes_sent for result in results),
+        "config_bytes": sum(result.config_bytes for result in results),
+        "lines_per_second": lines / duration if duration else 0.0,
+        "slowest": [result.hostname for result in sorted(results, key=lambda result: result.duration, reverse=True)[:10]],
+        "per_router": [{
+            "hostname": result.hostname,
+            "port": result.port,
+            "ok": result.ok,
+            "error": result.error,
+            "attempts": result.attempts,
+            "connect_seconds": result.connect_time,
+            "duration_seconds": result.duration,
+            "lines_sent": result.lines_sent,
+            "bytes_sent": result.bytes_sent,
+            "config_bytes": result.config_bytes,
+            "lines_per_second": lines_per_second(result),
+            "ios_errors": result.ios_errors,
+        } for result in results],
+    }
+
+def label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def prometheus_metrics(results, mode="line"):
+    """Returns the metrics of a deployment in the Prometheus text exposition format"""
+    report = deploy_report(results, mode)
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+        for labels, value in samples:
+            labels = ",".join(f'{key}="{label(label_value)}"' for key, label_value in labels.items())
+            lines.append(f"{METRIC_PREFIX}_{name}{{{labels}}} {value}")
+
+    metric("last_run_timestamp_seconds", "gauge", "End of the last deployment", [({"mode": mode}, f"{report['timestamp']:.3f}")])
+    metric("run_duration_seconds", "gauge", "Duration of the last deployment", [({"mode": mode}, f"{report['duration_seconds']:.6f}")])
+    metric("routers", "gauge", "Routers of the last deployment by status",
+           [({"mode": mode, "status": "ok"}, report["succeeded"]), ({"mode": mode, "status": "failed"}, report["failed"])])
+    metric("run_lines_per_second", "gauge", "Configuration lines delivered per second over the last deployment",
+           [({"mode": mode}, f"{report['lines_per_second']:.3f}")])
+    for name, help_text, value in ROUTER_METRICS:
+        samples = []
+        for result in results:
+            sample = value(result)
+            if sample is None : continue
+            samples.append(({"router": result.hostname, "port": result.port, "mode": mode}, f"{sample:.6f}" if isinstance(sample, float) else sample))
+        metric(f"router_{name}", "gauge", help_text, samples)
+    return "\n".join(lines) + "\n"
+
+def write_atomic(path, text):
+    # The textfile collector may read the file at any time, it must never see half of it
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as output_file:
+        output_file.write(text)
+    os.replace(tmp_path, path)
+
+def write_deploy_report(path, results, mode="line"):
+    write_atomic(path, json.dumps(deploy_report(results, mode), indent=2))
+
+def write_prometheus_textfile(path, results, mode="line"):
+    write_atomic(path, prometheus_metrics(results, mode))
@@ -1,20 +1,354 @@
-from Exscript.protocols import Telnet
-from multiprocessing import Process
+"""Telnet deployment of the generated configurations.
 
-class TelnetConfigurator(Process):
-    def __init__(self, host_ip, router_telnet_port, router_config_file):
-        super().__init__()
-        self.connection = Telnet()
+Every router is configured from one asyncio event loop : a semaphore bounds the
+number of open consoles, each session waits for the IOS prompts instead of
+blindly sending lines, configuration lines are sent in chunks (one round trip
+per chunk rather than per line) and every router gets its own timeout and
+retries.
+
+The routers can be deployed in waves (core, then PEs, then CEs, see
+scheduler.py) with a cap on the routers of the same AS configured at once.
+
+In bulk mode, the configuration files are served by a local HTTP or TFTP
+server (see file_server.py) and each router downloads its own with a single
+configure replace (or copy) command, instead of receiving it line by line.
+"""
+import asyncio
+import contextlib
+import os
+import re
+import time
+
+import profiler
+
+from file_server import file_server
+from ios_config import parse_config, diff_config
+
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+ECHO, SGA = 1, 3
+
+PROMPT = re.compile(r"(?:^|[\r\n])([\w.\-]+)(\([\w\-]+\))?([>#]) ?$")
+CONFIG_PROMPT = re.compile(r"[\w.\-]+\(config[\w\-]*\)#")
+IOS_ERRORS = ("% Invalid input", "% Incomplete command", "% Ambiguous command", "% Unknown command", "% Unrecognized command")
+TRANSFER_ERRORS = ("%Error", "% Error", "Rollback aborted", "Failed to")
+QUESTION = re.compile(r"(\?|\[confirm\]|\[yes/no\]:?) ?$")
+BULK_COMMANDS = {
+    "replace": "configure replace {url} force",
+    "copy": "copy {url} running-config",
+}
+
+
+class TelnetSession:
+    """Telnet client with just enough of the protocol for an IOS console"""
+
+    def __init__(self, host, port, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.buffer = ""
+        self.pending = b""  # incomplete telnet command at the end of the last read
+        self.bytes_sent = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    def filter_telnet(self, data):
+        """Removes the telnet commands from data and answers the option negotiations"""
+        data = self.pending + data
+        self.pending = b""
+        output = bytearray()
+        replies = bytearray()
+        i = 0
+        while i < len(data):
+            byte = data[i]
+            if byte != IAC:
+                output.append(byte)
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                self.pending = data[i:]
+                break
+            command = data[i + 1]
+            if command == IAC:
+                output.append(IAC)
+                i += 2
+            elif command in (DO, DONT, WILL, WONT):
+                if i + 2 >= len(data):
+                    self.pending = data[i:]
+                    break
+                option = data[i + 2]
+                if command == DO:
+                    replies += bytes((IAC, WONT, option))
+                elif command == WILL:
+                    replies += bytes((IAC, DO if option in (ECHO, SGA) else DONT, option))
+                i += 3
+            elif command == SB:
+                end = data.find(bytes((IAC, SE)), i)
+                if end < 0:
+                    self.pending = data[i:]
+                    break
+                i = end + 2
+            else:
+                i += 2
+        if replies:
+            self.writer.write(bytes(replies))
+        return output.decode("latin-1")
+
+    async def read_until(self, predicate, timeout=None):
+        """Reads until predicate(buffer) is true, then returns and empties the buffer"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        while not predicate(self.buffer):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"pas de réponse attendue de {self.host}:{self.port}, reçu {self.buffer[-80:]!r}")
+            data = await asyncio.wait_for(self.reader.read(4096), remaining)
+            if not data:
+                raise ConnectionError(f"connexion fermée par {self.host}:{self.port}")
+            self.buffer += self.filter_telnet(data)
+        output, self.buffer = self.buffer, ""
+        return output
+
+    async def send(self, text):
+        data = text.encode("latin-1")
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+        await self.writer.drain()
+
+    async def expect_prompt(self, timeout=None):
+        """Waits for any prompt, returns (output, prompt_char, mode)"""
+        output = await self.read_until(PROMPT.search, timeout)
+        match = PROMPT.search(output)
+        return output, match.group(3), match.group(2)
+
+    async def command(self, line, timeout=None):
+        await self.send(line + "\r")
+        return await self.expect_prompt(timeout)
+
+    async def enable(self):
+        """Gets the privileged prompt of a console just connected"""
+        await self.send("\r")
+        _, prompt, mode = await self.expect_prompt()
+        if mode:
+            # Left in configuration mode by a previous session
+            _, prompt, mode = await self.command("end")
+        if prompt == ">":
+            await self.command("enable")
+
+    async def answer_until_prompt(self, line, timeout=None):
+        """Sends a command and confirms its questions (destination file name, [confirm]) until the prompt comes back"""
+        await self.send(line + "\r")
+        output = ""
+        while True:
+            output += await self.read_until(lambda buffer: PROMPT.search(buffer) or QUESTION.search(buffer), timeout)
+            if PROMPT.search(output):
+                return output
+            await self.send("\r")
+
+    async def send_config_chunk(self, lines, timeout=None):
+        """Sends several configuration lines at once and waits for one config prompt per line"""
+        await self.send("\r".join(lines) + "\r")
+        return await self.read_until(lambda buffer: len(CONFIG_PROMPT.findall(buffer)) >= len(lines) and PROMPT.search(buffer), timeout)
+
+
+def config_lines(config_file):
+    """Returns the lines of a config file worth sending (without blank and comment lines)"""
+    with open(config_file, 'r') as f:
+        return [line.rstrip() for line in f if line.strip() and line.strip() != "!"]
+
+def find_ios_errors(output, lines, markers=IOS_ERRORS):
+    """Returns the commands IOS rejected, with its error message"""
+    errors = []
+    last_command = None
+    for output_line in output.splitlines():
+        for line in lines:
+            if output_line.endswith(line.strip()):
+                last_command = line.strip()
+        for marker in markers:
+            if marker in output_line:
+                errors.append(f"{last_command} : {output_line.strip()}")
+    return errors
+
+
+class DeployResult:
+    __slots__ = ("hostname", "port", "ok", "error", "lines_sent", "bytes_sent", "config_bytes", "ios_errors", "attempts", "connect_time", "start", "duration")
+
+    def __init__(self, hostname, port):
+        self.hostname = hostname
+        self.port = port
+        self.ok = False
+        self.error = None
+        self.lines_sent = 0
+        self.bytes_sent = 0
+        self.config_bytes = 0  # size of the commands delivered : the lines sent on the console, or the file given to the file server
+        self.ios_errors = []
+        self.attempts = 0
+        self.connect_time = None
+        self.start = None
+        self.duration = 0.0
+
+
+class TelnetConfigurator:
+    """Pushes the configuration file of one router on its console"""
+
+    def __init__(self, hostname, host_ip, router_telnet_port, router_config_file, timeout=10, retries=2, chunk_size=10, delta=False, url=None, bulk_command="replace"):
+        self.hostname = hostname
         self.host = host_ip
         self.port = router_telnet_port
         self.config = router_config_file
+        self.timeout = timeout
+        self.retries = retries
+        self.chunk_size = chunk_size
+        self.delta = delta
+        self.url = url  # bulk mode : URL of the configuration on the file server
+        self.bulk_command = bulk_command
+
+    async def fetch_running_config(self, session):
+        await session.command("terminal length 0")
+        output, _, _ = await session.command("show running-config", self.timeout * 3)
+        # Drops the echoed command and the final prompt
+        return parse_config(output.splitlines()[1:-1])
+
+    async def push(self, session, lines, result, attempt_start):
+        await session.connect()
+        result.connect_time = time.perf_counter() - attempt_start
+        await session.enable()
+        if self.url:
+            command = BULK_COMMANDS[self.bulk_command].format(url=self.url)
+            output = await session.answer_until_prompt(command, self.timeout * 3)
+            result.ios_errors.extend(find_ios_errors(output, [command], IOS_ERRORS + TRANSFER_ERRORS))
+            result.lines_sent = len(lines)
+            result.config_bytes = os.path.getsize(self.config)
+            return
+        if self.delta:
+            # lines is the parsed target configuration, only its differences with the router are sent
+            lines = diff_config(await self.fetch_running_config(session), lines)
+            if not lines:
+                return
+        await session.command("configure terminal")
+        for start in range(0, len(lines), self.chunk_size):
+            chunk = lines[start:start + self.chunk_size]
+            output = await session.send_config_chunk(chunk)
+            result.ios_errors.extend(find_ios_errors(output, chunk))
+            result.lines_sent += len(chunk)
+            result.config_bytes += sum(len(line) + 1 for line in chunk)
+        await session.command("end")
+
+    async def run(self):
+        result = DeployResult(self.hostname, self.port)
+        start = result.start = time.perf_counter()
+        if self.delta:
+            with open(self.config, 'r') as f:
+                lines = parse_config(f)
+        else:
+            lines = config_lines(self.config)
+        for attempt in range(1, self.retries + 2):
+            result.attempts = attempt
+            result.lines_sent = 0
+            result.ios_errors = []
+            result.config_bytes = 0
+            attempt_start = time.perf_counter()
+            session = TelnetSession(self.host, self.port, self.timeout)
+            try:
+                await self.push(session, lines, result, attempt_start)
+                result.ok = True
+                result.error = None
+                break
+            except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                result.error = str(e) or type(e).__name__
+                if attempt <= self.retries:
+                    await asyncio.sleep(min(0.5 * 2 ** (attempt - 1), 5))
+            finally:
+                result.bytes_sent += session.bytes_sent
+                await session.close()
+        result.duration = time.perf_counter() - start
+        return result
+
+
+async def deploy_configs_async(configurators, concurrency=50, server=None, waves=None, as_numbers=None, per_as_concurrency=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    as_semaphores = {}
+
+    async def bounded(configurator):
+        as_slot = contextlib.nullcontext()
+        if per_as_concurrency:
+            as_number = (as_numbers or {}).get(configurator.hostname)
+            as_slot = as_semaphores.setdefault(as_number, asyncio.Semaphore(per_as_concurrency))
+        # The AS slot is taken first, a router waiting for its AS does not hold a console slot
+        async with as_slot, semaphore:
+            return await configurator.run()
+
+    async def run_waves():
+        if not waves:
+            return await asyncio.gather(*(bounded(configurator) for configurator in configurators))
+        by_hostname = {configurator.hostname: configurator for configurator in configurators}
+        scheduled = [[by_hostname[hostname] for hostname in wave if hostname in by_hostname] for wave in waves]
+        in_waves = {configurator.hostname for wave in scheduled for configurator in wave}
+        scheduled.append([configurator for configurator in configurators if configurator.hostname not in in_waves])
+        results = {}
+        for wave in scheduled:
+            # Each wave starts once the previous one is deployed
+            for result in await asyncio.gather(*(bounded(configurator) for configurator in wave)):
+                results[result.hostname] = result
+        return [results[configurator.hostname] for configurator in configurators]
 
-    def run(self):
-        self.connection.connect(self.host, self.port)
-        self.connection.send("configure terminal \r")
-        with open(self.config, 'r') as f: 
-            for config_line in f :
-                self.connection.send(config_line+"\r")
-        self.connection.send("exit\r")
+    if server is None:
+        return await run_waves()
+    async with server:
+        for configurator in configurators:
+            configurator.url = server.url(configurator.config)
+        return await run_waves()
 
+def deploy_configs(targets, host="localhost", concurrency=50, timeout=10, retries=2, chunk_size=10, delta=False, verbose=True,
+                   bulk=None, bulk_command="replace", server_host=None, server_port=None, advertised_host="127.0.0.1",
+                   waves=None, as_numbers=None, per_as_concurrency=None):
+    """
+    Pushes the configurations on every router from a single process.
 
+    :param targets: Liste de (hostname, port telnet, fichier de configuration)
+    :param concurrency: Nombre maximum de consoles ouvertes en même temps
+    :param delta: Lit la running-config de chaque routeur et n'envoie que les différences
+    :param bulk: "http" ou "tftp" pour que chaque routeur télécharge sa configuration d'un serveur local, None pour l'envoyer ligne par ligne
+    :param bulk_command: "replace" (configure replace) ou "copy" (copy vers la running-config)
+    :param server_host: Adresse d'écoute du serveur de fichiers, advertised_host par défaut
+    :param server_port: Port du serveur de fichiers, 69 en TFTP et un port libre en HTTP par défaut
+    :param advertised_host: Adresse du serveur de fichiers vue depuis les routeurs
+    :param waves: Vagues de hostnames déployées l'une après l'autre (voir scheduler.deployment_waves), None pour tout lancer en même temps
+    :param as_numbers: Dictionnaire {hostname: numéro d'AS}, pour per_as_concurrency
+    :param per_as_concurrency: Nombre maximum de routeurs d'un même AS configurés en même temps
+    :return: Liste de DeployResult, dans l'ordre des targets
+    """
+    if bulk and delta : raise ValueError("the bulk mode sends whole configurations and cannot be used with delta")
+    configurators = [TelnetConfigurator(hostname, host, port, config_file, timeout, retries, chunk_size, delta, bulk_command=bulk_command)
+                     for hostname, port, config_file in targets]
+    server = file_server(bulk, [config_file for _, _, config_file in targets], server_host or advertised_host, server_port, advertised_host) if bulk else None
+    start = time.perf_counter()
+    results = asyncio.run(deploy_configs_async(configurators, concurrency, server, waves, as_numbers, per_as_concurrency))
+    duration = time.perf_counter() - start
+    for result in results:
+        # The tasks share one thread, each router gets its own line in the trace
+        profiler.record(f"telnet {result.hostname}", "router", result.start, result.duration, tid=result.port, ok=result.ok,
+                        lines_sent=result.lines_sent, bytes_sent=result.bytes_sent, attempts=result.attempts, connect_time=result.connect_time)
+    if verbose:
+        for result in results:
+            if result.ok:
+                print(f"Telnet : {result.hostname} configuré ({result.lines_sent} lignes en {result.duration:.2f} s, {result.attempts} tentative(s))")
+            else:
+                print(f"Telnet : échec pour {result.hostname} (port {result.port}) : {result.error}")
+            for error in result.ios_errors:
+                print(f"Telnet : {result.hostname} a refusé {error}")
+        lines = sum(result.lines_sent for result in results)
+        size = sum(result.config_bytes for result in results)
+        print(f"Telnet ({f'{bulk} ' + bulk_command if bulk else 'ligne par ligne'}) : {lines} lignes, {size / 1024:.1f} Ko en {duration:.2f} s, "
+              f"{lines / duration:.0f} lignes/s, {size / 1024 / duration:.1f} Ko/s")
+    return results
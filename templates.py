@@ -0,0 +1,95 @@
+"""Section templates used to render the router configurations.
+
+Templates are plain text with {field} placeholders, compiled once into a list
+of line formatters. A line is left out when one of its fields is None, and a
+line starting with [field] is only kept when that field is true, which covers
+the optional lines of the Cisco stanzas without any logic in the templates.
+
+Rendered blocks are memoized in an LRU cache keyed on the role and the fields,
+so a block shared by many routers (a VRF definition, the stanza of an iBGP
+neighbor in a full mesh...) is only formatted once.
+
+Any template can be replaced for every router by <template_dir>/<name>.tmpl,
+or for one role by <template_dir>/<role>/<name>.tmpl (role being PE, P or CE).
+"""
+from functools import lru_cache
+import hashlib
+import os
+import re
+
+ROLES = ("PE", "P", "CE")
+DEFAULT_CACHE_SIZE = 65536
+
+DEFAULT_TEMPLATES = {
+    "header": "service timestamps debug datetime msec\nservice timestamps log datetime msec\n!\nhostname {hostname}\n!",
+    "vrf_definition": "ip vrf {name}\n rd {rd}",
+    "vrf_route_target": " route-target {direction} {rt}",
+    "vrf_end": "!",
+    "header_end": "!\n[mpls]mpls label protocol ldp\n[mpls]multilink bundle-name authenticated\n[mpls]!",
+    "interface": "interface {name}\n ip vrf forwarding {vrf}\n ip ospf {ospf_as} area 0\n ip address {ip} {netmask}\n negotiation auto\n[mpls] mpls ip\n!",
+    "ospf": "router ospf {as_number}\n router-id {router_id}\n redistribute connected\n!",
+    "no_igp": "!",
+    "bgp_header": "router bgp {as_number}\n bgp router-id {router_id}\n bgp cluster-id {cluster_id}\n bgp log-neighbor-changes",
+    "bgp_neighbor": " neighbor {ip} remote-as {remote_as}\n[internal] neighbor {ip} update-source Loopback0",
+    "ipv4_header": " !\n address-family ipv4\n[redistribute]  redistribute connected",
+    "ipv4_neighbor": "  neighbor {ip} activate\n[allowas_in]  neighbor {ip} allowas-in\n[rr_client]  neighbor {ip} route-reflector-client",
+    "af_end": " exit-address-family\n!",
+    "vpnv4_header": " address-family vpnv4",
+    "vpnv4_neighbor": "  neighbor {ip} activate\n  neighbor {ip} send-community both\n[rr_client]  neighbor {ip} route-reflector-client",
+    "vrf_af": " address-family ipv4 vrf {name}\n  redistribute connected\n  neighbor {ip} remote-as {remote_as}\n  neighbor {ip} activate\n exit-address-family\n!",
+}
+
+FIELD = re.compile(r"(?<!{){(\w+)}")
+GUARD = re.compile(r"^\[(\w+)\]")
+
+
+def compile_template(source):
+    """Compiles a template into a tuple of (guard, fields, formatter), one per line"""
+    lines = []
+    for line in source.split("\n"):
+        guard = GUARD.match(line)
+        if guard:
+            line = line[guard.end():]
+        lines.append((guard.group(1) if guard else None, tuple(FIELD.findall(line)), line.format))
+    return tuple(lines)
+
+def render_compiled(compiled, fields):
+    output = []
+    for guard, names, formatter in compiled:
+        if guard and not fields.get(guard) : continue
+        if any(fields.get(name) is None for name in names) : continue
+        output.append(formatter(**fields))
+    return "\n".join(output)
+
+
+class TemplateEngine:
+    """Compiled templates of every role, with the memo cache of the rendered blocks"""
+
+    def __init__(self, template_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.template_dir = template_dir
+        sources = {role: dict(DEFAULT_TEMPLATES) for role in ROLES + (None,)}
+        if template_dir:
+            for role in ROLES + (None,):
+                for name in DEFAULT_TEMPLATES:
+                    for path in (os.path.join(template_dir, f"{name}.tmpl"), os.path.join(template_dir, role or "", f"{name}.tmpl")):
+                        if os.path.isfile(path):
+                            with open(path, 'r') as template_file:
+                                sources[role][name] = template_file.read().rstrip("\n")
+        self.fingerprint = hashlib.sha256(repr(sorted((str(role), sorted(templates.items())) for role, templates in sources.items())).encode()).hexdigest()
+        self.templates = {role: {name: compile_template(source) for name, source in templates.items()} for role, templates in sources.items()}
+        self.render = lru_cache(maxsize=cache_size)(self._render)
+
+    def _render(self, role, template, **fields):
+        return render_compiled(self.templates[role if role in self.templates else None][template], fields)
+
+
+engine = TemplateEngine()
+
+def load_templates(template_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+    """Replaces the templates used by render (and empties the memo cache)"""
+    global engine
+    engine = TemplateEngine(template_dir, cache_size)
+    return engine
+
+def render(role, template, **fields):
+    return engine.render(role, template, **fields)
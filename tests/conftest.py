@@ -0,0 +1,20 @@
+import copy
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live at the root of the repository, next to nas_config_generator.py
+sys.path.insert(0, ROOT)
+
+from intent_loader import load_intent_file
+
+INTENT_FILE = os.path.join(ROOT, "intent.yml")
+_intent = load_intent_file(INTENT_FILE, cache_dir=None)
+
+
+@pytest.fixture
+def intent():
+    """The example intent of the repository, which every test may modify"""
+    return copy.deepcopy(_intent)
@@ -0,0 +1,33 @@
+import pytest
+
+from bgp_policy import EXPORT_ROUTE_MAP, PolicyEngine
+
+
+def test_customer_routes_are_not_filtered():
+    engine = PolicyEngine()
+    assert engine.neighbor_lines("10.0.0.1", "provider") == [" neighbor 10.0.0.1 route-map PROVIDER in"]
+    assert engine.neighbor_lines("10.0.0.2", "peer") == [" neighbor 10.0.0.2 route-map PEER in",
+                                                          f" neighbor 10.0.0.2 route-map {EXPORT_ROUTE_MAP} out"]
+
+def test_blocks_are_shared_by_as_and_relations():
+    engine = PolicyEngine()
+    block = engine.policy_config(100, {"peer", "client"})
+    # The order of the relations of a router does not matter
+    assert engine.policy_config(100, ["client", "peer"]) is block
+    assert "ip community-list standard FROM_CUSTOMER permit 100:10" in block
+    assert " set local-preference 150" in block
+    assert block.index("route-map CLIENT") < block.index("route-map PEER")
+
+def test_provider_only_block_has_no_export_filter():
+    block = PolicyEngine().policy_config(100, {"provider"})
+    assert EXPORT_ROUTE_MAP not in block
+    assert "community-list" not in block
+
+def test_policies_of_the_intent():
+    engine = PolicyEngine({"peer": {"local_preference": 120, "export_filter": False}})
+    assert " set local-preference 120" in engine.policy_config(100, {"peer"})
+    assert engine.neighbor_lines("10.0.0.2", "peer") == [" neighbor 10.0.0.2 route-map PEER in"]
+
+def test_unknown_relation():
+    with pytest.raises(Exception, match="unknown BGP relation sibling"):
+        PolicyEngine({"sibling": {}})
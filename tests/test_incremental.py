@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from incremental import affected_routers, build_manifest, intent_fingerprints
+from ipam import plan_intent
+from nas_config_generator import config_file_name, get_as_list, get_topology, render_configs, write_config_files
+
+
+def generate(data, table=None, manifest=None):
+    """Generates data in the current directory like nas_config_generator.py -i, returns (manifest, allocation table, routers rendered)"""
+    as_list = get_as_list(data)
+    ipam = plan_intent(as_list, data.get("AS_connections", []), table)
+    topology = get_topology(data, ipam)
+    fingerprints = intent_fingerprints(as_list, data.get("AS_connections", []), "generator")
+    configs = {hostname: entry for hostname, entry in (manifest or {}).get("configs", {}).items() if hostname in topology.routers}
+    hostnames = affected_routers(manifest or {}, fingerprints, topology)
+    write_config_files(topology, render_configs(topology, hostnames), configs, verbose=False)
+    return build_manifest(fingerprints, configs), ipam.table(), hostnames
+
+def read_configs(directory, data):
+    files = {}
+    for as_data in get_as_list(data):
+        for router in as_data["routers"]:
+            with open(os.path.join(directory, f"i{router['num_creation']}_startup-config.cfg")) as config_file:
+                files[router["hostname"]] = config_file.read()
+    return files
+
+
+def remove_core_link(data):
+    data["AS1"][0]["internal_connections"].pop(1)
+
+def add_core_router(data):
+    data["AS1"][0]["routers"].append({"hostname": "P3", "is_border": False, "num_creation": 9, "telnet_port": 3009})
+    data["AS1"][0]["internal_connections"].append({"first_peer_hostname": "P1", "first_peer_interface": "GigabitEthernet3/0",
+                                                   "second_peer_hostname": "P3", "second_peer_interface": "GigabitEthernet1/0"})
+
+def rename_vrf(data):
+    data["AS_connections"][0]["connexion"][0]["vrf_name"] = "CLIENT3_VRF"
+
+def hub_and_spoke(data):
+    data["AS_connections"][2]["connexion"][0]["vrf_role"] = "hub"
+    data["AS_connections"][3]["connexion"][0]["vrf_role"] = "spoke"
+
+def route_reflectors(data):
+    data["AS1"][0].update(ibgp="route_reflector", route_reflectors=["P1"])
+
+def not_border(data):
+    data["AS1"][0]["routers"][1]["is_border"] = False
+
+def nothing(data):
+    pass
+
+
+def links_to_pe2(data):
+    # PE2 gets the most internal links, and is elected route reflector instead of P1
+    data["AS1"][0]["internal_connections"] += [
+        {"first_peer_hostname": "PE2", "first_peer_interface": "GigabitEthernet4/0", "second_peer_hostname": "PE1", "second_peer_interface": "GigabitEthernet4/0"},
+        {"first_peer_hostname": "PE2", "first_peer_interface": "GigabitEthernet5/0", "second_peer_hostname": "P1", "second_peer_interface": "GigabitEthernet3/0"},
+    ]
+
+def check_incremental(intent, tmp_path, monkeypatch, change):
+    """Applies change after a first run, checks the incremental run against a full rebuild, returns the routers it rendered"""
+    (tmp_path / "incremental").mkdir()
+    (tmp_path / "full").mkdir()
+    monkeypatch.chdir(tmp_path / "incremental")
+    manifest, table, _ = generate(intent)
+    change(intent)
+    _, _, rendered = generate(intent, table, manifest)
+    monkeypatch.chdir(tmp_path / "full")
+    generate(intent, table)
+    assert read_configs(tmp_path / "incremental", intent) == read_configs(tmp_path / "full", intent)
+    return rendered
+
+
+@pytest.mark.parametrize("change", [remove_core_link, add_core_router, rename_vrf, hub_and_spoke, route_reflectors, not_border, links_to_pe2, nothing])
+def test_incremental_output_equals_a_full_rebuild(intent, tmp_path, monkeypatch, change):
+    rendered = check_incremental(intent, tmp_path, monkeypatch, change)
+    if change is nothing:
+        assert rendered == set()
+
+@pytest.mark.parametrize("change", [links_to_pe2, remove_core_link])
+def test_link_change_with_elected_route_reflectors(intent, tmp_path, monkeypatch, change):
+    intent["AS1"][0]["ibgp"] = "route_reflector"
+    rendered = check_incremental(intent, tmp_path, monkeypatch, change)
+    assert {"PE1", "PE2", "P1", "P2"} <= rendered
+
+def test_unchanged_files_are_not_rewritten(intent, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manifest, table, _ = generate(intent)
+    for path in tmp_path.iterdir():
+        os.utime(path, ns=(0, 0))
+    rename_vrf(intent)
+    _, _, rendered = generate(intent, table, manifest)
+    # PE2 shares the VRF PE1 leaves, its route-targets are rendered again but do not change
+    assert rendered == {"PE1", "PE2", "CE1"}
+    rewritten = {path.name for path in tmp_path.iterdir() if path.stat().st_mtime_ns != 0}
+    assert rewritten == {"i1_startup-config.cfg"}
+
+def test_a_new_generator_renders_everything(intent, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manifest, table, _ = generate(intent)
+    as_list = get_as_list(intent)
+    topology = get_topology(intent, plan_intent(as_list, intent["AS_connections"], table))
+    fingerprints = intent_fingerprints(as_list, intent["AS_connections"], "another generator")
+    assert affected_routers(manifest, fingerprints, topology) == set(topology.routers)
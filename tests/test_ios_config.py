@@ -0,0 +1,142 @@
+import copy
+
+import pytest
+
+from fake_ios import FakeRouter, Faults
+from ios_config import parse_config, diff_config
+from ipam import plan_intent
+from nas_config_generator import get_as_list, get_topology, render_configs
+
+P1 = """hostname P1
+!
+interface Loopback0
+ ip ospf 1000 area 0
+ ip address 100.50.255.1 255.255.255.255
+!
+interface GigabitEthernet1/0
+ ip ospf 1000 area 0
+ ip address 100.50.0.2 255.255.255.252
+ negotiation auto
+ mpls ip
+!
+interface GigabitEthernet2/0
+ ip ospf 1000 area 0
+ ip address 100.50.0.5 255.255.255.252
+ negotiation auto
+ mpls ip
+!
+router ospf 1000
+ router-id 2.2.2.2
+!
+"""
+
+LINK_TO_P2 = """interface GigabitEthernet2/0
+ ip ospf 1000 area 0
+ ip address 100.50.0.5 255.255.255.252
+ negotiation auto
+ mpls ip
+!
+"""
+
+
+def test_identical_configs_have_no_delta():
+    assert diff_config(parse_config(P1), parse_config(P1)) == []
+
+def test_removed_link_defaults_its_interface():
+    commands = diff_config(parse_config(P1), parse_config(P1.replace(LINK_TO_P2, "")))
+    assert commands == ["default interface GigabitEthernet2/0"]
+
+def test_unused_interface_is_left_alone():
+    running = P1 + "interface GigabitEthernet3/0\n no ip address\n shutdown\n!\n"
+    assert diff_config(parse_config(running), parse_config(P1)) == []
+
+def test_added_link_sends_the_whole_interface():
+    commands = diff_config(parse_config(P1.replace(LINK_TO_P2, "")), parse_config(P1))
+    assert commands == ["interface GigabitEthernet2/0", " ip ospf 1000 area 0", " ip address 100.50.0.5 255.255.255.252",
+                        " negotiation auto", " mpls ip", "exit"]
+
+def test_new_address_replaces_the_old_one():
+    commands = diff_config(parse_config(P1), parse_config(P1.replace("100.50.0.5", "100.50.0.9")))
+    assert commands == ["interface GigabitEthernet2/0", " ip address 100.50.0.9 255.255.255.252", "exit"]
+
+
+def push_delta(running, target):
+    """Applies the delta from running to target on an emulated router, returns its running-config afterwards"""
+    router = FakeRouter("R", 0, Faults())
+    router.running, router.configuring = parse_config(running), True
+    for command in diff_config(router.running, parse_config(target)):
+        assert router.apply(command) is None
+    return router.running
+
+@pytest.fixture
+def configs(intent):
+    """Renders the configs of the example intent after applying a change, {hostname: config}"""
+    table = plan_intent(get_as_list(intent), intent["AS_connections"]).table()
+
+    def render(change=None):
+        data = copy.deepcopy(intent)
+        if change:
+            change(data)
+        topology = get_topology(data, plan_intent(get_as_list(data), data["AS_connections"], table))
+        return {hostname: config for hostname, (config, _) in render_configs(topology, topology.routers).items()}
+    return render
+
+def remove_core_link(data):
+    data["AS1"][0]["internal_connections"].pop(1)
+
+def move_to_vrf(data):
+    data["AS_connections"][0]["connexion"][0]["vrf_name"] = "CLIENT3_VRF"
+
+def remove_vpn(data):
+    data["AS_connections"].pop(3)
+
+def route_reflectors(data):
+    data["AS1"][0].update(ibgp="route_reflector", route_reflectors=["P1"])
+
+def move_subnet(data):
+    data["AS1"][0]["IPv4_prefix"] = "100.60.0.0"
+
+@pytest.mark.parametrize("change", [remove_core_link, move_to_vrf, remove_vpn, route_reflectors, move_subnet])
+def test_delta_round_trip(configs, change):
+    before, after = configs(), configs(change)
+    for hostname, target in after.items():
+        running = push_delta(before[hostname], target)
+        assert diff_config(running, parse_config(target)) == [], hostname
+        # Nothing the generator wrote before is left behind, except the interfaces put back to their defaults
+        stale = set(running.lines()) - set(parse_config(target).lines())
+        assert all(line.startswith("interface ") and not running.children[line].children for line in stale), (hostname, stale)
+
+def test_delta_drops_the_whole_neighbor(configs):
+    running = push_delta(configs()["PE1"], configs(route_reflectors)["PE1"])
+    neighbors = {line.split()[1] for line in running.children["router bgp 1000"].lines() if line.strip().startswith("neighbor")}
+    assert neighbors == {"100.50.255.2", "100.52.0.2", "100.53.0.2"}
+
+BGP = """router bgp 1000
+ bgp router-id 1.1.1.1
+ neighbor 10.0.0.1 remote-as 1000
+ neighbor 10.0.0.1 update-source Loopback0
+ neighbor 10.0.0.2 remote-as 1000
+ !
+ address-family ipv4
+  neighbor 10.0.0.1 activate
+  neighbor 10.0.0.2 activate
+ exit-address-family
+ !
+ address-family vpnv4
+  neighbor 10.0.0.1 activate
+  neighbor 10.0.0.1 send-community both
+ exit-address-family
+!
+"""
+
+def test_new_remote_as_sends_the_whole_neighbor_again():
+    target = BGP.replace("10.0.0.1 remote-as 1000", "10.0.0.1 remote-as 2000")
+    assert diff_config(parse_config(BGP), parse_config(target)) == [
+        "router bgp 1000", " no neighbor 10.0.0.1 remote-as 1000", " neighbor 10.0.0.1 remote-as 2000",
+        " neighbor 10.0.0.1 update-source Loopback0",
+        " address-family ipv4", "  neighbor 10.0.0.1 activate", " exit-address-family",
+        " address-family vpnv4", "  neighbor 10.0.0.1 activate", "  neighbor 10.0.0.1 send-community both", " exit-address-family",
+        "exit"]
+    running = push_delta(BGP, target)
+    assert diff_config(running, parse_config(target)) == []
+    assert sorted(running.lines()) == sorted(parse_config(target).lines())
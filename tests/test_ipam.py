@@ -0,0 +1,64 @@
+import pytest
+
+from ipam import Ipam, IpamError, Pool, link_key, plan_intent
+from nas_config_generator import get_as_list
+from topology import int_to_ip
+
+
+def test_pool_allocates_the_lowest_free_blocks():
+    pool = Pool("pool", 0, 4, 8, reserved=0b10)
+    pool.assign(["a", "b", "c"])
+    assert pool.allocations == {"a": 0, "b": 2, "c": 3}
+    assert pool.address("c") == 12
+
+def test_pool_keeps_previous_offsets():
+    pool = Pool("pool", 0, 4, 8)
+    pool.assign(["new", "old"], previous={"old": 5, "gone": 0})
+    assert pool.allocations == {"old": 5, "new": 0}
+
+def test_pool_exhausted():
+    pool = Pool("pool", 0, 4, 2)
+    with pytest.raises(IpamError, match="exhausted"):
+        pool.assign(["a", "b", "c"])
+
+def test_pool_allocate_avoids_held_offsets():
+    pool = Pool("pool", 0, 4, 4)
+    pool.hold({"later": 0})
+    assert pool.allocate("first") == 1
+    assert pool.allocate("later") == 0
+    assert pool.allocate("first") == 1
+
+def test_link_key_ignores_the_order_of_the_ends():
+    assert link_key("P1", "Gi1/0", "P2", "Gi2/0") == link_key("P2", "Gi2/0", "P1", "Gi1/0")
+
+def test_invalid_prefixes():
+    ipam = Ipam()
+    with pytest.raises(IpamError, match="host bits"):
+        ipam.add_as(1, "10.0.0.1", 16)
+    with pytest.raises(IpamError, match="between 1 and 24"):
+        ipam.add_as(1, "10.0.0.0", 28)
+
+def test_overlapping_prefixes():
+    ipam = Ipam()
+    ipam.add_as(1, "10.0.0.0", 8)
+    ipam.add_as(2, "10.1.0.0", 16)
+    assert len(ipam.check_overlaps()) == 1
+
+def test_plan_intent(intent):
+    ipam = plan_intent(get_as_list(intent), intent["AS_connections"])
+    first, second = ipam.link(1000, link_key("PE1", "GigabitEthernet1/0", "P1", "GigabitEthernet1/0"))
+    assert (int_to_ip(first), int_to_ip(second)) == ("100.50.0.1", "100.50.0.2")
+    # Loopbacks come from the last /24 of the AS prefix
+    assert int_to_ip(ipam.loopback(1000, "PE1")) == "100.50.255.0"
+
+def test_plan_intent_keeps_the_allocation_table(intent):
+    as_list = get_as_list(intent)
+    table = plan_intent(as_list, intent["AS_connections"]).table()
+    # Without its first link and first router, the others keep their addresses
+    as_list[0]["internal_connections"].pop(0)
+    as_list[0]["routers"].pop(0)
+    replanned = plan_intent(as_list, intent["AS_connections"], table).table()
+    for pool in ("links", "loopbacks"):
+        for key, offset in replanned["1000"][pool].items():
+            assert table["1000"][pool][key] == offset
+    assert replanned["vrfs"] == table["vrfs"]
@@ -0,0 +1,51 @@
+import pytest
+
+from validator import IntentValidationError, validate_intent
+
+
+def errors(data):
+    with pytest.raises(IntentValidationError) as info:
+        validate_intent(data)
+    return info.value.errors
+
+
+def test_example_intent_is_valid(intent):
+    assert validate_intent(intent) is intent
+
+def test_every_error_is_reported(intent):
+    intent["AS1"][0]["routers"][1]["telnet_port"] = intent["AS1"][0]["routers"][0]["telnet_port"]
+    intent["AS2"][0]["number"] = "1000"
+    intent["AS_connections"][0]["connexion"][0]["type"] = "OSPF"
+    found = errors(intent)
+    assert any("AS1[0].routers[1].telnet_port" in error for error in found)
+    assert any("AS 1000 is defined twice" in error for error in found)
+    assert any("unknown connexion type 'OSPF'" in error for error in found)
+
+def test_unknown_router_in_a_link(intent):
+    intent["AS1"][0]["internal_connections"][0]["second_peer_hostname"] = "P9"
+    assert errors(intent) == ["Intent file error : AS1[0].internal_connections[0].second_peer_hostname : P9 is not a router of AS 1000"]
+
+def test_interface_used_twice(intent):
+    intent["AS1"][0]["internal_connections"][1]["first_peer_interface"] = "GigabitEthernet1/0"
+    assert any("interface GigabitEthernet1/0 of router P1 is used twice" in error for error in errors(intent))
+
+@pytest.mark.parametrize("count", [0, -1, "x", True, 2.5])
+def test_invalid_route_reflector_count(intent, count):
+    intent["AS1"][0].update(ibgp="route_reflector", route_reflector_count=count)
+    assert errors(intent) == [f"Intent file error : AS1[0].route_reflector_count : route_reflector_count must be an integer of at least 1, got {count!r}"]
+
+def test_too_many_route_reflectors(intent):
+    intent["AS1"][0].update(ibgp="route_reflector", route_reflector_count=5)
+    assert errors(intent) == ["Intent file error : AS1[0].route_reflector_count : 5 route reflectors asked for but AS 1000 only has 4 routers"]
+
+def test_route_reflectors_must_be_a_list(intent):
+    intent["AS1"][0].update(ibgp="route_reflector", route_reflectors="P1")
+    assert errors(intent) == ["Intent file error : AS1[0].route_reflectors : must be a list of hostnames"]
+
+def test_unknown_route_reflector(intent):
+    intent["AS1"][0].update(ibgp="route_reflector", route_reflectors=["P1", "CE1"])
+    assert errors(intent) == ["Intent file error : AS1[0].route_reflectors : route reflector CE1 is not a router of AS 1000"]
+
+def test_unknown_extranet_vrf(intent):
+    intent["AS_connections"][0]["connexion"][0]["vrf_import"] = ["NOPE"]
+    assert errors(intent) == ["Intent file error : AS_connections[0].connexion[0].vrf_import[0] : VRF NOPE is not the vrf_name of any VPN connexion"]
@@ -0,0 +1,43 @@
+from vrf_registry import VrfRegistry, community
+
+
+def test_numbers_follow_the_first_use():
+    registry = VrfRegistry()
+    registry.assign(["B", "A", "B"])
+    assert registry.numbers == {"B": 1, "A": 2}
+    assert registry.rd("A") == "200:200"
+    assert registry.rt("A") == "2000:2000"
+
+def test_previous_numbers_are_kept():
+    registry = VrfRegistry()
+    registry.assign(["NEW", "OLD"], previous={"OLD": 1, "GONE": 2})
+    assert registry.numbers == {"OLD": 1, "NEW": 2}
+
+def test_allocate_avoids_held_numbers():
+    registry = VrfRegistry()
+    registry.hold({"LATER": 1})
+    assert registry.allocate("FIRST") == 2
+    assert registry.allocate("LATER") == 1
+
+def test_community_past_16_bits():
+    assert community(100, 1) == "100:100"
+    assert community(70000, 70) == "70000:70"
+
+def test_full_mesh_route_targets():
+    registry = VrfRegistry()
+    registry.attach("A", "PE1", "CE1")
+    assert registry.route_targets("A", "PE1") == (("1000:1000",), ("1000:1000",))
+
+def test_hub_and_spoke_route_targets():
+    registry = VrfRegistry()
+    registry.attach("A", "PE1", "CE1", "hub")
+    registry.attach("A", "PE2", "CE2", "spoke")
+    assert registry.route_targets("A", "PE1") == (("1000:1000",), ("1001:1001",))
+    assert registry.route_targets("A", "PE2") == (("1001:1001",), ("1000:1000",))
+
+def test_extranet_imports():
+    registry = VrfRegistry()
+    registry.attach("A", "PE1", "CE1", imports=("SHARED",))
+    exports, imports = registry.route_targets("A", "PE1")
+    assert exports == ("1000:1000",)
+    assert imports == ("1000:1000", "2000:2000")
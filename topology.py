@@ -0,0 +1,166 @@
+"""Compact model of the network described by the intent file.
+
+Every object uses __slots__ and stores its addresses as integers, the
+Topology keeps the indexes the generator needs so that each stage does
+lookups instead of rescanning every router.
+"""
+from vrf_registry import VrfRegistry
+
+
+def int_to_ip(value):
+    """Converts an integer IPv4 address to its dotted string"""
+    return f"{value >> 24}.{(value >> 16) & 255}.{(value >> 8) & 255}.{value & 255}"
+
+def ip_to_int(ip):
+    """Converts a dotted IPv4 address string to an integer"""
+    a, b, c, d = ip.split('.')
+    return (int(a) << 24) | (int(b) << 16) | (int(c) << 8) | int(d)
+
+def prefixlen_to_netmask(prefixlen):
+    """Returns the dotted netmask for a prefix length"""
+    return int_to_ip((0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF)
+
+def netmask_to_prefixlen(netmask):
+    """Returns the prefix length of a dotted netmask"""
+    return ip_to_int(netmask).bit_count()
+
+
+class Interface:
+    __slots__ = ("name", "address", "prefixlen", "mpls", "vrf")
+
+    def __init__(self, name, address, prefixlen, mpls=False, vrf=None):
+        self.name = name
+        self.address = address
+        self.prefixlen = prefixlen
+        self.mpls = mpls
+        self.vrf = vrf
+
+    @property
+    def ip(self):
+        return int_to_ip(self.address)
+
+    @property
+    def netmask(self):
+        return prefixlen_to_netmask(self.prefixlen)
+
+    def __repr__(self):
+        address = f"{self.ip}/{self.prefixlen}" if self.address is not None else "no address"
+        return f"Interface({self.name}, {address}, mpls={self.mpls}, vrf={self.vrf})"
+
+
+class Vrf:
+    __slots__ = ("name", "rd", "exports", "imports", "remote_ip", "remote_as")
+
+    def __init__(self, name, rd, exports, imports, remote_ip, remote_as):
+        self.name = name
+        self.rd = rd              # "value:value", see vrf_registry
+        self.exports = exports    # route-targets exported
+        self.imports = imports    # route-targets imported
+        self.remote_ip = remote_ip
+        self.remote_as = remote_as
+
+    def __repr__(self):
+        remote = int_to_ip(self.remote_ip) if self.remote_ip is not None else None
+        return f"Vrf({self.name}, rd={self.rd}, exports={list(self.exports or ())}, imports={list(self.imports or ())}, remote={remote} AS{self.remote_as})"
+
+
+class BgpNeighbor:
+    __slots__ = ("address", "remote_as", "external", "rr_client")
+
+    def __init__(self, address, remote_as, external=False, rr_client=False):
+        self.address = address
+        self.remote_as = remote_as
+        self.external = external
+        self.rr_client = rr_client
+
+    @property
+    def ip(self):
+        return int_to_ip(self.address)
+
+    def __repr__(self):
+        return f"BgpNeighbor({self.ip}, AS{self.remote_as}, external={self.external}, rr_client={self.rr_client})"
+
+
+class Router:
+    __slots__ = ("hostname", "as_number", "is_border", "mpls", "igp", "vpn_client", "num_creation", "telnet_port",
+                 "interfaces", "bgp_neighbors", "vpnv4_neighbors", "vpns", "route_reflector", "cluster_id")
+
+    def __init__(self, hostname, as_number, is_border, igp, vpn_client, num_creation, telnet_port):
+        self.hostname = hostname
+        self.as_number = as_number
+        self.is_border = is_border
+        self.mpls = False
+        self.igp = igp
+        self.vpn_client = vpn_client
+        self.num_creation = num_creation
+        self.telnet_port = telnet_port
+        self.interfaces = {}  # interface name -> Interface
+        self.bgp_neighbors = []
+        self.vpnv4_neighbors = []
+        self.vpns = []
+        self.route_reflector = False
+        self.cluster_id = None
+
+    @property
+    def role(self):
+        """PE, P or CE, used to pick the templates of the router"""
+        if self.vpn_client:
+            return "CE"
+        return "PE" if self.is_border else "P"
+
+    @property
+    def loopback(self):
+        """Integer address of the Loopback0 interface"""
+        return self.interfaces["Loopback0"].address
+
+    def __repr__(self):
+        return (f"Router({self.hostname}, AS{self.as_number}, border={self.is_border}, mpls={self.mpls}, "
+                f"interfaces={list(self.interfaces.values())}, bgp_neighbors={self.bgp_neighbors}, "
+                f"vpnv4_neighbors={self.vpnv4_neighbors}, vpns={self.vpns})")
+
+
+class Topology:
+    """All the routers of the intent file and the indexes built over them"""
+    __slots__ = ("routers", "routers_by_as", "border_routers_by_as", "vrfs")
+
+    def __init__(self, vrfs=None):
+        self.routers = {}               # hostname -> Router
+        self.routers_by_as = {}         # AS number -> [Router]
+        self.border_routers_by_as = {}  # AS number -> [Router]
+        self.vrfs = vrfs if vrfs is not None else VrfRegistry()  # VRF numbers, PEs and CE attachments
+
+    def add_router(self, router):
+        self.routers[router.hostname] = router
+        self.routers_by_as.setdefault(router.as_number, []).append(router)
+        if router.is_border:
+            self.border_routers_by_as.setdefault(router.as_number, []).append(router)
+
+    def add_vrf(self, router, vrf):
+        """Adds a VRF attachment to a PE, the route-targets of the VRF on this PE are the ones of its last attachment"""
+        if len(self.vrfs.pes.get(vrf.name, {}).get(router.hostname, ())) > 1:
+            for other in router.vpns:
+                if other.name == vrf.name:
+                    other.exports, other.imports = vrf.exports, vrf.imports
+        router.vpns.append(vrf)
+
+    def remove_routers(self, routers):
+        """Drops routers from the topology and its indexes once their configuration is generated"""
+        removed = {router.hostname for router in routers}
+        for hostname in removed:
+            del self.routers[hostname]
+        for index in (self.routers_by_as, self.border_routers_by_as):
+            for key in list(index):
+                kept = [router for router in index[key] if router.hostname not in removed]
+                if kept:
+                    index[key] = kept
+                else:
+                    del index[key]
+
+    def __getitem__(self, hostname):
+        return self.routers[hostname]
+
+    def __iter__(self):
+        return iter(self.routers.values())
+
+    def __len__(self):
+        return len(self.routers)
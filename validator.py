@@ -0,0 +1,228 @@
+"""Validation of a whole intent file before anything is generated.
+
+The intent is walked once, building hash indexes (AS numbers, hostnames,
+num_creation, telnet ports, interfaces in use, block count of every pool) as it
+goes, and every problem is collected with its path in the intent file, e.g.
+AS1[0].routers[2].telnet_port. The generator only starts when the list is
+empty, so a bad intent never leaves half of the config files on disk.
+"""
+from ipam import Ipam, IpamError, LOOPBACK_POOL_SIZE
+from vrf_registry import VRF_ROLES
+
+CONNECTION_TYPES = ("BGP", "VPN")
+IBGP_MODES = ("full_mesh", "route_reflector")
+ROUTER_KEYS = ("hostname", "num_creation", "telnet_port")
+INTERNAL_KEYS = ("first_peer_hostname", "first_peer_interface", "second_peer_hostname", "second_peer_interface")
+AS_CONNECTION_KEYS = ("AS_1", "AS_1_router_hostname", "AS_1_router_interface", "AS_2", "AS_2_router_hostname", "AS_2_router_interface")
+
+
+class IntentValidationError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("\n".join(errors))
+
+
+def as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class IntentValidator:
+    """Indexes filled while the intent is walked, and the errors found"""
+
+    def __init__(self):
+        self.errors = []
+        self.as_paths = {}      # AS number -> path
+        self.routers = {}       # hostname -> (AS number, path)
+        self.num_creations = {} # num_creation -> path
+        self.telnet_ports = {}  # telnet_port -> path
+        self.interfaces = {}    # (hostname, interface) -> path of the connection using it
+        self.link_count = {}    # AS number -> links allocated from its pool
+        self.vrfs = set()       # names of the VRFs of the VPN connexions
+        self.vrf_imports = []   # (path, VRF name) of the extranet imports, checked once every VRF is known
+        self.ipam = Ipam()
+
+    def error(self, path, message):
+        self.errors.append(f"Intent file error : {path} : {message}")
+
+    def unique(self, index, key, path, message):
+        """Records key in index, or reports it with the path of its first use"""
+        first = index.get(key)
+        if first is not None:
+            self.error(path, f"{message} (already used at {first})")
+            return False
+        index[key] = path
+        return True
+
+    def use_interface(self, hostname, interface, path):
+        if interface is None : return
+        self.unique(self.interfaces, (hostname, interface), path, f"interface {interface} of router {hostname} is used twice")
+
+    def check_as(self, key, value):
+        if not isinstance(value, list) or not value or not isinstance(value[0], dict):
+            self.error(key, "an AS must be a list holding one mapping")
+            return
+        path = f"{key}[0]"
+        as_data = value[0]
+        as_number = as_int(as_data.get("number"))
+        if as_number is None:
+            self.error(f"{path}.number", f"invalid AS number {as_data.get('number')!r}")
+            return
+        if not self.unique(self.as_paths, as_number, f"{path}.number", f"AS {as_number} is defined twice"):
+            return
+        try:
+            self.ipam.add_as(as_number, as_data.get("IPv4_prefix"), as_data.get("IPv4_mask"))
+        except IpamError as e:
+            self.error(f"{path}.IPv4_prefix", str(e).replace("Intent file error : ", ""))
+        except (ValueError, TypeError, AttributeError) as e:
+            self.error(f"{path}.IPv4_prefix", f"invalid IPv4 prefix {as_data.get('IPv4_prefix')}/{as_data.get('IPv4_mask')} ({e})")
+        if as_data.get("ibgp", "full_mesh") not in IBGP_MODES:
+            self.error(f"{path}.ibgp", f"unknown iBGP mode {as_data.get('ibgp')!r}, use {' or '.join(IBGP_MODES)}")
+
+        hostnames = set()
+        routers = as_data.get("routers") or []
+        for index, router in enumerate(routers):
+            router_path = f"{path}.routers[{index}]"
+            if not isinstance(router, dict):
+                self.error(router_path, "a router must be a mapping")
+                continue
+            missing = [field for field in ROUTER_KEYS if router.get(field) is None]
+            if missing:
+                self.error(router_path, f"missing {', '.join(missing)}")
+            hostname = router.get("hostname")
+            if hostname in self.routers:
+                self.error(f"{router_path}.hostname", f"hostname {hostname} is defined twice (already used at {self.routers[hostname][1]})")
+            elif hostname is not None:
+                self.routers[hostname] = (as_number, router_path)
+                hostnames.add(hostname)
+            for field, index_dict in (("num_creation", self.num_creations), ("telnet_port", self.telnet_ports)):
+                if router.get(field) is None : continue
+                number = as_int(router.get(field))
+                if number is None:
+                    self.error(f"{router_path}.{field}", f"{field} must be an integer, got {router.get(field)!r}")
+                else:
+                    self.unique(index_dict, number, f"{router_path}.{field}", f"{field} {number} is used twice")
+        if len(routers) > LOOPBACK_POOL_SIZE:
+            self.error(f"{path}.routers", f"loopback pool of AS {as_number} exhausted, {len(routers)} routers for {LOOPBACK_POOL_SIZE} loopbacks")
+
+        route_reflectors = as_data.get("route_reflectors") or []
+        if not isinstance(route_reflectors, list):
+            self.error(f"{path}.route_reflectors", "must be a list of hostnames")
+            route_reflectors = []
+        for hostname in route_reflectors:
+            if hostname not in hostnames:
+                self.error(f"{path}.route_reflectors", f"route reflector {hostname} is not a router of AS {as_number}")
+        if "route_reflector_count" in as_data:
+            count = as_data["route_reflector_count"]
+            if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+                self.error(f"{path}.route_reflector_count", f"route_reflector_count must be an integer of at least 1, got {count!r}")
+            elif count > len(routers):
+                self.error(f"{path}.route_reflector_count", f"{count} route reflectors asked for but AS {as_number} only has {len(routers)} routers")
+
+        internal_connections = as_data.get("internal_connections") or []
+        self.link_count[as_number] = self.link_count.get(as_number, 0) + len(internal_connections)
+        for index, internal in enumerate(internal_connections):
+            internal_path = f"{path}.internal_connections[{index}]"
+            if not isinstance(internal, dict):
+                self.error(internal_path, "an internal connection must be a mapping")
+                continue
+            missing = [field for field in INTERNAL_KEYS if internal.get(field) is None]
+            if missing:
+                self.error(internal_path, f"missing {', '.join(missing)}")
+            for side in ("first", "second"):
+                hostname = internal.get(f"{side}_peer_hostname")
+                if hostname is None : continue
+                if hostname not in hostnames:
+                    self.error(f"{internal_path}.{side}_peer_hostname", f"{hostname} is not a router of AS {as_number}")
+                self.use_interface(hostname, internal.get(f"{side}_peer_interface"), f"{internal_path}.{side}_peer_interface")
+            if internal.get("first_peer_hostname") is not None and internal.get("first_peer_hostname") == internal.get("second_peer_hostname"):
+                self.error(internal_path, f"router {internal['first_peer_hostname']} is connected to itself")
+
+    def check_as_connection(self, index, connection):
+        path = f"AS_connections[{index}]"
+        if not isinstance(connection, dict):
+            self.error(path, "an AS connection must be a mapping")
+            return
+        missing = [field for field in AS_CONNECTION_KEYS if connection.get(field) is None]
+        if missing:
+            self.error(path, f"missing {', '.join(missing)}")
+        numbers = []
+        for side in ("AS_1", "AS_2"):
+            as_number = as_int(connection.get(side))
+            hostname = connection.get(f"{side}_router_hostname")
+            if connection.get(side) is not None and as_number not in self.as_paths:
+                self.error(f"{path}.{side}", f"AS {connection.get(side)} is not defined")
+            numbers.append(as_number)
+            if hostname is None : continue
+            if hostname not in self.routers:
+                self.error(f"{path}.{side}_router_hostname", f"router {hostname} does not exist")
+            elif as_number is not None and self.routers[hostname][0] != as_number:
+                self.error(f"{path}.{side}_router_hostname", f"router {hostname} is in AS {self.routers[hostname][0]}, not in AS {as_number}")
+            self.use_interface(hostname, connection.get(f"{side}_router_interface"), f"{path}.{side}_router_interface")
+        if None not in numbers and max(numbers) in self.as_paths:
+            # Transit links are taken from the pool of the highest AS number
+            self.link_count[max(numbers)] = self.link_count.get(max(numbers), 0) + 1
+
+        connexion = connection.get("connexion")
+        if not isinstance(connexion, list) or not connexion or not isinstance(connexion[0], dict):
+            self.error(f"{path}.connexion", "missing connexion type")
+            return
+        connexion_type = connexion[0].get("type")
+        if connexion_type not in CONNECTION_TYPES:
+            self.error(f"{path}.connexion[0].type", f"unknown connexion type {connexion_type!r}, use {' or '.join(CONNECTION_TYPES)}")
+        elif connexion_type == "VPN" and not connexion[0].get("vrf_name"):
+            self.error(f"{path}.connexion[0].vrf_name", "a VPN connexion needs a vrf_name")
+        elif connexion_type == "VPN":
+            self.vrfs.add(connexion[0]["vrf_name"])
+            if connexion[0].get("vrf_role") not in (None,) + VRF_ROLES:
+                self.error(f"{path}.connexion[0].vrf_role", f"unknown VRF role {connexion[0]['vrf_role']!r}, use {' or '.join(VRF_ROLES)}")
+            vrf_import = connexion[0].get("vrf_import") or []
+            if not isinstance(vrf_import, list):
+                self.error(f"{path}.connexion[0].vrf_import", "must be a list of VRF names")
+                vrf_import = []
+            for index, name in enumerate(vrf_import):
+                self.vrf_imports.append((f"{path}.connexion[0].vrf_import[{index}]", name))
+
+    def check_vrfs(self):
+        for path, name in self.vrf_imports:
+            if name not in self.vrfs:
+                self.error(path, f"VRF {name} is not the vrf_name of any VPN connexion")
+
+    def check_pools(self):
+        for error in self.ipam.check_overlaps():
+            self.errors.append(error)
+        for as_number, count in self.link_count.items():
+            pool = self.ipam.links.get(as_number)
+            if pool is None : continue
+            available = pool.size - pool.reserved.bit_count()
+            if count > available:
+                self.error(f"{self.as_paths[as_number].rsplit('.', 1)[0]}.IPv4_prefix",
+                           f"link pool of AS {as_number} exhausted, {count} /30 links needed but only {available} available")
+
+
+def validate_intent(data):
+    """
+    Checks the whole intent file and raises IntentValidationError with every error found.
+
+    :param data: Intent file chargé par load_intent_file
+    :return: data, si aucune erreur n'est trouvée
+    """
+    validator = IntentValidator()
+    if not isinstance(data, dict):
+        raise IntentValidationError([f"Intent file error : the intent file must be a mapping, got {type(data).__name__}"])
+    for key, value in data.items():
+        if "AS_" not in key:
+            validator.check_as(key, value)
+    as_connections = data.get("AS_connections") or []
+    if not isinstance(as_connections, list):
+        validator.error("AS_connections", "must be a list")
+        as_connections = []
+    for index, connection in enumerate(as_connections):
+        validator.check_as_connection(index, connection)
+    validator.check_vrfs()
+    validator.check_pools()
+    if validator.errors:
+        raise IntentValidationError(validator.errors)
+    return data
@@ -0,0 +1,132 @@
+"""Registry of the VRFs of the whole network.
+
+Every VRF gets a number once, for the whole intent, and its route
+distinguisher and route-targets are derived from it : a VRF has the same RD/RT
+on every PE whatever the order of the AS_connections. Like the address pools
+(see ipam.py), numbers are tracked with an integer bitmap and can be saved in
+the allocation table, so adding a VRF never renumbers the others.
+
+The registry also indexes the PEs and CE attachments of every VRF, and derives
+the import/export route-targets of a VRF on a PE from the policies of its
+attachments :
+  - no role : full mesh, the VRF exports and imports its route-target
+  - hub-and-spoke : hubs export the route-target of the VRF and import the one
+    of the spokes, spokes export their own route-target and only import the hub
+  - extranet : vrf_import lists other VRFs whose routes are imported too
+"""
+
+RD_STEP = 100
+RT_STEP = 1000
+VRF_ROLES = ("hub", "spoke")
+MAX_NUMBER = 0xFFFF  # nn of a RD/RT is 16 bits once the administrator field is 32 bits
+
+
+def community(value, number):
+    """Formats a RD or RT, as value:value while it fits in 16 bits, value:number past that"""
+    return f"{value}:{value}" if value <= 0xFFFF else f"{value}:{number}"
+
+
+class Attachment:
+    __slots__ = ("vrf", "pe", "ce", "role", "imports")
+
+    def __init__(self, vrf, pe, ce, role=None, imports=()):
+        self.vrf = vrf
+        self.pe = pe            # hostname of the PE
+        self.ce = ce            # hostname of the CE
+        self.role = role        # None, "hub" or "spoke"
+        self.imports = tuple(imports)  # names of the VRFs imported in this one (extranet)
+
+    def __repr__(self):
+        return f"Attachment({self.vrf}, {self.pe} -> {self.ce}, role={self.role}, imports={list(self.imports)})"
+
+
+class VrfRegistry:
+    """Numbers of every VRF, with the PEs and CE attachments of each one"""
+    __slots__ = ("numbers", "bitmap", "previous", "held", "attachments", "pes")
+
+    def __init__(self):
+        self.numbers = {}      # VRF name -> number
+        self.bitmap = 1        # numbers in use, 0 is never allocated
+        self.previous = {}     # VRF name -> number of the previous allocation table, for allocate()
+        self.held = 0          # bitmap of the previous numbers whose VRF has not been allocated yet
+        self.attachments = {}  # VRF name -> [Attachment]
+        self.pes = {}          # VRF name -> {PE hostname: [Attachment]}
+
+    def assign(self, names, previous=None):
+        """Numbers every VRF of names, keeping the numbers of the previous allocation table"""
+        previous = previous or {}
+        self.numbers = {}
+        self.bitmap = 1
+        new_names = []
+        for name in dict.fromkeys(names):
+            number = previous.get(name)
+            if number is not None and 0 < number <= MAX_NUMBER and not (self.bitmap >> number) & 1:
+                self.numbers[name] = number
+                self.bitmap |= 1 << number
+            else:
+                new_names.append(name)
+        for name in new_names:
+            self.allocate(name)
+
+    def hold(self, previous):
+        """Keeps the numbers of the previous allocation table for their VRFs, before allocating VRFs one by one"""
+        self.previous = previous or {}
+        self.held = 0
+        for number in self.previous.values():
+            if 0 < number <= MAX_NUMBER:
+                self.held |= 1 << number
+
+    def allocate(self, name):
+        """Returns the number of a VRF, allocating it the first time the VRF is seen"""
+        number = self.numbers.get(name)
+        if number is not None:
+            return number
+        number = self.previous.get(name)
+        if number is None or not 0 < number <= MAX_NUMBER or (self.bitmap >> number) & 1:
+            # New VRFs avoid the numbers held for VRFs that may come later, unless nothing else is left
+            for used in (self.bitmap | self.held, self.bitmap):
+                number = ((used + 1) & ~used).bit_length() - 1
+                if number <= MAX_NUMBER : break
+            else:
+                raise Exception(f'Intent file error : too many VRFs, only {MAX_NUMBER} route distinguishers available')
+        self.numbers[name] = number
+        self.bitmap |= 1 << number
+        self.held &= ~(1 << number)
+        return number
+
+    def rd(self, name):
+        number = self.allocate(name)
+        return community(number * RD_STEP, number)
+
+    def rt(self, name, role=None):
+        """Route-target of a VRF, spokes of a hub-and-spoke VRF have their own"""
+        number = self.allocate(name)
+        return community(number * RT_STEP + (1 if role == "spoke" else 0), number)
+
+    def attach(self, name, pe, ce, role=None, imports=()):
+        """Records a CE attached to a VRF on a PE, returns the Attachment"""
+        self.allocate(name)
+        for imported in imports:
+            self.allocate(imported)
+        attachment = Attachment(name, pe, ce, role, imports)
+        self.attachments.setdefault(name, []).append(attachment)
+        self.pes.setdefault(name, {}).setdefault(pe, []).append(attachment)
+        return attachment
+
+    def route_targets(self, name, pe):
+        """Returns the (exports, imports) route-targets of a VRF on a PE, from the policies of all its attachments there"""
+        exports, imports = {}, {}
+        for attachment in self.pes.get(name, {}).get(pe, ()):
+            if attachment.role is None:
+                exports[self.rt(name)] = imports[self.rt(name)] = None
+            elif attachment.role == "hub":
+                exports[self.rt(name)] = imports[self.rt(name, "spoke")] = None
+            else:
+                exports[self.rt(name, "spoke")] = imports[self.rt(name)] = None
+            for imported in attachment.imports:
+                imports[self.rt(imported)] = None
+        return tuple(exports), tuple(imports)
+
+    def table(self):
+        """Current numbers, in the format of the allocation table file"""
+        return dict(self.numbers)
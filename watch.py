@@ -0,0 +1,102 @@
+"""Watching of the intent file for the --watch mode.
+
+On Linux the directory of the file is watched with inotify (through ctypes, no
+extra dependency) so a change is seen as soon as the editor closes or renames
+the file. Elsewhere, or when inotify is not available, the file is polled with
+os.stat. Both watchers wait a short moment after the first event so that the
+several writes of one save only trigger one regeneration.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+DEBOUNCE = 0.05         # seconds of quiet after the first event
+DEFAULT_POLL_INTERVAL = 0.2
+
+
+class InotifyWatcher:
+    def __init__(self, path):
+        self.directory, self.name = os.path.split(os.path.abspath(path))
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # The directory is watched : editors often save by renaming a new file over the old one
+        if libc.inotify_add_watch(self.fd, self.directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch failed on {self.directory}")
+
+    def read_events(self, timeout):
+        """Returns True if the watched file was written or replaced within timeout seconds"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        data = os.read(self.fd, 65536)
+        changed = False
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0").decode(errors="replace")
+            changed |= name == self.name
+            offset += EVENT_HEADER.size + length
+        return changed
+
+    def wait(self):
+        """Blocks until the file changes"""
+        while not self.read_events(None):
+            pass
+        while self.read_events(DEBOUNCE):
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    def __init__(self, path, interval=DEFAULT_POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last = self.stat()
+
+    def stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def wait(self):
+        """Blocks until the file changes"""
+        while self.stat() == self.last:
+            time.sleep(self.interval)
+        # Waits for the end of the save
+        current = self.stat()
+        while True:
+            time.sleep(DEBOUNCE)
+            if self.stat() == current : break
+            current = self.stat()
+        self.last = current
+
+    def close(self):
+        pass
+
+
+def file_watcher(path, polling=False, interval=DEFAULT_POLL_INTERVAL):
+    """Returns an inotify watcher for path, or a polling one if inotify is not available or polling is True"""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError, TypeError):
+            pass
+    return PollingWatcher(path, interval)